@@ -0,0 +1,91 @@
+"""Cost of broadcasting one board update to a heavily spectated game, and the frame counters that go with it.
+
+Spectators are local socket pairs behind the server's QueuedConnection, drained by reader threads.
+Compares encoding the message once per broadcast (SharedFrame) with encoding it again for every recipient;
+both timings include the writer threads getting every frame onto the sockets.
+Uses a throwaway SQLite database:
+    python -m benchmarks.bench_broadcast --spectators 200 --broadcasts 500
+    python -m benchmarks.bench_broadcast --spectators 200 --broadcasts 100 --payload 65536
+"""
+import argparse
+import socket
+import threading
+import time
+
+from benchmarks.common import NullConnection, scratch_backend
+from classes.protocol import encode_frame, frame_counters
+from classes.send_queue import QueuedConnection
+from classes.server import TicTacToeServer
+from enums.game import Game
+
+
+def drain(sock):
+    while sock.recv(65536):
+        pass
+
+
+def spectator_connections(count):
+    connections = []
+    for _ in range(count):
+        server_side, client_side = socket.socketpair()
+        threading.Thread(target=drain, args=(client_side,), daemon=True).start()
+        connections.append((QueuedConnection(server_side, high_water_mark=64 * 1024 * 1024), client_side))
+    return connections
+
+
+def encode_per_recipient(message, connections):
+    """The old broadcast: every recipient gets its own freshly encoded frame."""
+    for conn in connections:
+        conn.sendall(encode_frame(message))
+
+
+def wait_until_sent(connections):
+    while any(conn.queue for conn in connections):
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spectators", type=int, default=200)
+    parser.add_argument("--broadcasts", type=int, default=500)
+    parser.add_argument("--payload", type=int, default=0, help="pad the message to this many bytes")
+    args = parser.parse_args()
+
+    server = TicTacToeServer(backend=scratch_backend())
+    reply = server.create_game(5, "bench_host", NullConnection())
+    game_id = reply.split(":")[1].split()[0]
+    pairs = spectator_connections(args.spectators)
+    connections = [conn for conn, _ in pairs]
+    server.games_data[game_id][Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].extend(connections)
+    message = server.game_board_json(game_id)
+    message += " " * (args.payload - len(message))  # Still valid JSON, for sizes past the scatter-gather threshold
+
+    started = time.perf_counter()
+    for _ in range(args.broadcasts):
+        encode_per_recipient(message, connections)
+    wait_until_sent(connections)
+    per_recipient_time = time.perf_counter() - started
+
+    before = frame_counters.snapshot()
+    started = time.perf_counter()
+    for _ in range(args.broadcasts):
+        server.broadcast_to_all_clients_in_game(message, game_id)
+    wait_until_sent(connections)
+    shared_time = time.perf_counter() - started
+    after = frame_counters.snapshot()
+
+    counts = {key: (after[key] - before[key]) / args.broadcasts for key in after}
+    print(f"{args.spectators} spectators, {len(message)} byte message")
+    print(f"encode per recipient {per_recipient_time / args.broadcasts * 1e6:8.1f} us/broadcast")
+    print(f"SharedFrame          {shared_time / args.broadcasts * 1e6:8.1f} us/broadcast "
+          f"({per_recipient_time / shared_time:.1f}x)")
+    print(f"per broadcast: {counts['encoded']:.0f} encoded ({counts['encoded_bytes']:.0f} B), "
+          f"{counts['sent']:.0f} sent, {counts['copied']:.0f} copied")
+
+    for conn, client_side in pairs:
+        conn.close()
+        client_side.close()
+
+
+if __name__ == '__main__':
+    main()
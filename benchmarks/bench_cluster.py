@@ -0,0 +1,82 @@
+"""Moves per second against the number of worker processes (--workers), with load from several processes.
+
+Each load process plays tie games back to back, one pair of clients per game. The joiner often lands on a
+worker that doesn't own the game, so every game also pays for one connection hand-off. Scaling needs a
+free core per worker on top of the load processes. Uses a throwaway SQLite database.
+    python -m benchmarks.bench_cluster --workers 1 2 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from benchmarks.common import BenchClient, start_server_process, stop_server_process
+from classes.server import SERVER_MODES
+
+
+def play_games(index, seconds, results):
+    moves = games = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = (f"load{index}_{games}a", f"load{index}_{games}b")
+        creator, joiner = BenchClient(), BenchClient()
+        creator.send(f"create_game 2 {names[0]}")
+        game_id = creator.receive().split(":")[1].split()[0]
+        joiner.send(f"join_game {game_id} {names[1]}")
+        joiner.receive()  # join confirmation
+        joiner.receive()  # board snapshot
+        players = (creator, joiner)
+        for turn, (row, col) in enumerate(TIE_MOVES):
+            players[turn % 2].send(f"make_move {game_id} {names[turn % 2]} {row},{col}")
+            for player in players:
+                player.receive()
+            moves += 1
+        creator.close()
+        joiner.close()
+        games += 1
+    results.put((moves, games))
+
+
+def run_load(processes, seconds):
+    results = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=play_games, args=(index, seconds, results))
+               for index in range(processes)]
+    started = time.perf_counter()
+    for loader in loaders:
+        loader.start()
+    totals = [results.get() for _ in loaders]
+    elapsed = time.perf_counter() - started
+    for loader in loaders:
+        loader.join()
+    return sum(moves for moves, _ in totals) / elapsed, sum(games for _, games in totals) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mode", choices=SERVER_MODES, default="asyncio")
+    parser.add_argument("--load-processes", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.load_processes} load processes, {args.mode} workers")
+    baseline = None
+    for workers in args.workers:
+        path = os.path.join(tempfile.mkdtemp(), "cluster.db")
+        process = start_server_process("--mode", args.mode, "--workers", str(workers), "--db", "sqlite",
+                                       "--sqlite-path", path, "--journal-dir", "")
+        try:
+            time.sleep(1)  # Let every worker start listening, not only the first
+            moves_per_second, games_per_second = run_load(args.load_processes, args.seconds)
+        finally:
+            stop_server_process(process)
+        baseline = baseline or moves_per_second
+        print(f"{workers:3d} workers: {moves_per_second:9.0f} moves/s {games_per_second:7.0f} games/s "
+              f"({moves_per_second / baseline:.2f}x)")
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Per-command cost of the server's command handlers, called directly without sockets.
+
+Uses a throwaway SQLite database:
+    python -m benchmarks.bench_commands --games 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import NullConnection, scratch_backend
+from classes.commands import parse_command
+from classes.server import TicTacToeServer
+
+# The first 8 moves of a tied 3x3 game; none of them ends the game, so no database work is measured
+OPENING_MOVES = [(0, 0), (0, 1), (0, 2), (1, 1), (1, 0), (2, 0), (2, 1), (1, 2)]
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count:>9} ops  {elapsed / count * 1e9:>10.0f} ns/op")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=5000)
+    args = parser.parse_args()
+
+    server = TicTacToeServer(backend=scratch_backend())
+    conn = NullConnection()
+    dispatch = server.dispatch_command
+    games = args.games
+
+    messages = [f"make_move GAME user_{n} 1,1" for n in range(games)]
+    timed("parse_command", games, lambda: [parse_command(message) for message in messages])
+
+    creates = [parse_command(f"create_game 2 bench_a{n}") for n in range(games)]
+    game_ids = []
+
+    def create_games():
+        for command in creates:
+            reply, _ = server.dispatcher.dispatch(conn, command)
+            game_ids.append(reply.split(":")[1].split()[0])
+
+    timed("create_game", games, create_games)
+
+    joins = [parse_command(f"join_game {game_id} bench_b{n}") for n, game_id in enumerate(game_ids)]
+    timed("join_game", games, lambda: [dispatch(conn, command) for command in joins])
+
+    moves = [parse_command(f"make_move {game_id} bench_{'ab'[index % 2]}{n} {row},{col}")
+             for n, game_id in enumerate(game_ids)
+             for index, (row, col) in enumerate(OPENING_MOVES)]
+    # Play every game move by move, so each command is a legal move for the player on turn
+    moves.sort(key=lambda command: OPENING_MOVES.index(tuple(map(int, command.args[-1].split(',')))))
+    timed("make_move", len(moves), lambda: [dispatch(conn, command) for command in moves])
+
+    lobby = parse_command("get_available_games")
+    timed("get_available_games", 100, lambda: [dispatch(conn, lobby) for _ in range(100)])
+
+
+if __name__ == '__main__':
+    main()
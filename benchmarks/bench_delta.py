@@ -0,0 +1,66 @@
+"""Bytes on the wire and encoding time per move: full board snapshot against a delta update.
+
+Plays a full game on every board size and encodes both messages after each move.
+Uses a throwaway SQLite database:
+    python -m benchmarks.bench_delta --rounds 200
+"""
+import argparse
+import time
+
+from benchmarks.common import NullConnection, scratch_backend
+from classes.commands import parse_command
+from classes.protocol import encode_frame
+from classes.server import TicTacToeServer
+from enums.game import Game
+
+
+def play_game(server, conn, num_players, name):
+    """Create and fill a game, then yield (game_id, row, col, player_index) after every move."""
+    reply, _ = server.dispatcher.dispatch(conn, parse_command(f"create_game {num_players} {name}0"))
+    game_id = reply.split(":")[1].split()[0]
+    for n in range(1, num_players):
+        server.dispatch_command(conn, parse_command(f"join_game {game_id} {name}{n}"))
+    board_size = num_players + 1
+    game_data = server.games_data[game_id]
+    for cell in range(board_size * board_size):
+        row, col = divmod(cell, board_size)
+        player_index = game_data[Game.CURRENT_PLAYER]
+        game_data[Game.BOARD].place(row, col, player_index)
+        game_data[Game.SEQUENCE] += 1
+        server.get_next_player(game_id)
+        yield game_id, row, col, player_index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    server = TicTacToeServer(backend=scratch_backend())
+    conn = NullConnection()
+    for num_players in range(2, 6):
+        moves = list(play_game(server, conn, num_players, f"delta{num_players}_"))
+        full_bytes = sum(len(encode_frame(server.game_board_json(game_id))) for game_id, *_ in moves)
+        delta_bytes = sum(len(encode_frame(server.move_delta_json(*move))) for move in moves)
+
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for game_id, *_ in moves:
+                encode_frame(server.game_board_json(game_id))
+        full_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for move in moves:
+                encode_frame(server.move_delta_json(*move))
+        delta_time = time.perf_counter() - started
+
+        count = len(moves) * args.rounds
+        board_size = num_players + 1
+        print(f"{board_size}x{board_size}: full board {full_bytes / len(moves):6.0f} B/move "
+              f"{full_time / count * 1e9:7.0f} ns/move | delta {delta_bytes / len(moves):4.0f} B/move "
+              f"{delta_time / count * 1e9:7.0f} ns/move ({full_bytes / delta_bytes:.1f}x fewer bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Latency of the move that ends a game, with leaderboard writes queued (write-behind) or done inline.
+
+Plays --games tied 3x3 games through the command handlers, timing only the final move, then times the flush.
+Uses a throwaway SQLite database:
+    python -m benchmarks.bench_game_end --games 500
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from benchmarks.common import NullConnection, percentile, scratch_backend
+from classes.commands import parse_command
+from classes.server import TicTacToeServer
+
+
+def play_games(server, conn, games, prefix):
+    samples = []
+    for n in range(games):
+        names = (f"{prefix}_a{n}", f"{prefix}_b{n}")
+        for name in names:
+            server.sql_client.insert_user(name, "password")
+        reply, _ = server.dispatcher.dispatch(conn, parse_command(f"create_game 2 {names[0]}"))
+        game_id = reply.split(":")[1].split()[0]
+        server.dispatch_command(conn, parse_command(f"join_game {game_id} {names[1]}"))
+        for index, (row, col) in enumerate(TIE_MOVES):
+            command = parse_command(f"make_move {game_id} {names[index % 2]} {row},{col}")
+            started = time.perf_counter()
+            server.dispatch_command(conn, command)
+            if index == len(TIE_MOVES) - 1:
+                samples.append(time.perf_counter() - started)
+        server.remove_player_from_game(names[0])
+        server.remove_player_from_game(names[1])
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=500)
+    args = parser.parse_args()
+
+    conn = NullConnection()
+    run_id = int(time.time())
+    for label, inline in (("inline", True), ("write-behind", False)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = TicTacToeServer(backend=scratch_backend())
+            if inline:
+                # The old behaviour: the mover's thread waits for the database
+                record_results = server.sql_client.record_results
+                server.leaderboard_writer.put_many = lambda results: record_results(results) or True
+            samples = play_games(server, conn, args.games, f"end{run_id}{label[0]}")
+            started = time.perf_counter()
+            server.shutdown()
+            flush_time = time.perf_counter() - started
+        print(f"{label:<13} game end p50 {percentile(samples, 50) * 1000:.3f} ms  "
+              f"p99 {percentile(samples, 99) * 1000:.3f} ms  shutdown flush {flush_time * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
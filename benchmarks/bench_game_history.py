@@ -0,0 +1,93 @@
+"""Game history throughput: finished games written to the games table in batches, against one insert per game.
+
+Plays --games tied 3x3 games through the command handlers on a SQLite database, so every finish queues its
+game for the history writer, and reports game completions per second and how long the writer takes to drain.
+Then times record_games alone on prepared games, at several batch sizes.
+No database server needed.
+    python -m benchmarks.bench_game_history --games 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from benchmarks.common import NullConnection
+from classes.commands import parse_command
+from classes.server import HISTORY_BATCH_SIZE, TicTacToeServer
+from sql.SQLClient import SQLClient
+from sql.backends import SQLiteBackend
+
+PLAYERS = 2000
+
+
+def add_players(server):
+    # Straight into the table: registering through insert_user would time scrypt, not the games table
+    with server.sql_client.cursor() as cur:
+        cur.executemany("INSERT INTO users (username, password, token) VALUES (%s, %s, %s)",
+                        [(f"p{n}", "x", "t") for n in range(PLAYERS)])
+
+
+def play_games(server, games):
+    conn = NullConnection()
+    for n in range(games):
+        names = (f"p{(2 * n) % PLAYERS}", f"p{(2 * n + 1) % PLAYERS}")
+        reply, _ = server.dispatcher.dispatch(conn, parse_command(f"create_game 2 {names[0]}"))
+        game_id = reply.split(":")[1].split()[0]
+        server.dispatch_command(conn, parse_command(f"join_game {game_id} {names[1]}"))
+        for index, (row, col) in enumerate(TIE_MOVES):
+            server.dispatch_command(conn, parse_command(f"make_move {game_id} {names[index % 2]} {row},{col}"))
+        server.remove_player_from_game(names[0])
+        server.remove_player_from_game(names[1])
+
+
+def writer_throughput(games, batch_size):
+    """Games per second record_games gets into the games table, batch_size games per transaction."""
+    path = os.path.join(tempfile.mkdtemp(), "writer.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = SQLClient(backend=SQLiteBackend(path))
+        with client.cursor() as cur:
+            cur.executemany("INSERT INTO users (username, password, token) VALUES (%s, %s, %s)",
+                            [(f"p{n}", "x", "t") for n in range(PLAYERS)])
+        moves = [[row, col, "XO"[index % 2]] for index, (row, col) in enumerate(TIE_MOVES)]
+        finished = [(f"G{n}", [(f"p{(2 * n) % PLAYERS}", "X", "tie"), (f"p{(2 * n + 1) % PLAYERS}", "O", "tie")],
+                     moves, 1000) for n in range(games)]
+        started = time.perf_counter()
+        for start in range(0, games, batch_size):
+            client.record_games(finished[start:start + batch_size])
+        elapsed = time.perf_counter() - started
+        client.close_connection()
+    return games / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=5000)
+    args = parser.parse_args()
+
+    for label, batched in (("one insert per game", False), ("batched", True)):
+        path = os.path.join(tempfile.mkdtemp(), "history.db")
+        with contextlib.redirect_stdout(io.StringIO()):  # The server prints on every game
+            server = TicTacToeServer(backend=SQLiteBackend(path))
+            add_players(server)
+            if not batched:
+                # Every finished game waits for its own transaction
+                server.history_writer.put = lambda game: server.sql_client.record_games([game]) or True
+            started = time.perf_counter()
+            play_games(server, args.games)
+            played = time.perf_counter() - started
+            server.shutdown()
+            total = time.perf_counter() - started
+        conn = SQLiteBackend(path).connect()
+        rows = conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+        conn.close()
+        print(f"{label:<20} {args.games / played:8.0f} games/s played  {args.games / total:8.0f} games/s written "
+              f"({rows} rows, drained {(total - played) * 1000:.0f} ms after the last game)")
+    for batch_size in (1, 50, HISTORY_BATCH_SIZE):
+        print(f"record_games, {batch_size:>3} per batch {writer_throughput(args.games * 4, batch_size):8.0f} games/s")
+
+
+if __name__ == '__main__':
+    main()
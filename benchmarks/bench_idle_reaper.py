@@ -0,0 +1,84 @@
+"""Idle reaper: server threads, memory and games before and after half the clients silently go away.
+
+Opens --clients connections that each create a game, then keeps answering the server's pings on half of
+them while the other half just stop, like clients whose network dropped. Once the idle timeout has passed
+the server should be back to what the live half needs. Uses a throwaway SQLite database.
+    python -m benchmarks.bench_idle_reaper --clients 1000
+"""
+import argparse
+import json
+import os
+import selectors
+import tempfile
+import threading
+import time
+
+from benchmarks.common import BenchClient, rss_bytes, start_server_process, stop_server_process, thread_count
+from classes.server import SERVER_MODES
+
+HEARTBEAT_INTERVAL = 1
+IDLE_TIMEOUT = 3
+
+
+def answer_pings(clients, stop):
+    """Stay alive on these clients: BenchClient.receive() answers pings (and only pings arrive here)."""
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client.sock, selectors.EVENT_READ, client)
+    while not stop.is_set():
+        for key, _ in selector.select(0.1):
+            key.data.pending.extend(key.data.reader.read_messages() or [])
+            while key.data.pending:
+                message = key.data.pending.popleft()
+                if message == "ping":
+                    key.data.send("pong")
+
+
+def measure(process):
+    probe = BenchClient()
+    probe.send("get_all_available_games")
+    games = len(json.loads(probe.receive()))
+    probe.close()
+    return thread_count(process.pid), rss_bytes(process.pid) / 2 ** 20, games
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", choices=SERVER_MODES, default=list(SERVER_MODES))
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        path = os.path.join(tempfile.mkdtemp(), "reaper.db")
+        process = start_server_process("--mode", mode, "--db", "sqlite", "--sqlite-path", path, "--journal-dir", "",
+                                       "--heartbeat-interval", str(HEARTBEAT_INTERVAL),
+                                       "--idle-timeout", str(IDLE_TIMEOUT))
+        try:
+            clients = []
+            for n in range(args.clients):
+                client = BenchClient()
+                client.send(f"create_game 2 idle{n}")
+                client.receive()
+                clients.append(client)
+            live = clients[:len(clients) // 2]  # The other half never reads or writes again
+            stop = threading.Event()
+            pinger = threading.Thread(target=answer_pings, args=(live, stop))
+            pinger.start()
+            threads, rss, games = measure(process)
+            label = f"{len(clients)} clients"
+            print(f"{mode:>8} {label:>20}: {threads:5d} threads {rss:7.1f} MiB {games:5d} games")
+            time.sleep(IDLE_TIMEOUT + 2 * HEARTBEAT_INTERVAL)
+            threads, rss, games = measure(process)
+            label = f"{len(live)} still alive"
+            print(f"{mode:>8} {label:>20}: {threads:5d} threads {rss:7.1f} MiB {games:5d} games")
+            stop.set()
+            pinger.join()
+            for client in clients:
+                client.close()
+        finally:
+            stop_server_process(process)
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Game journal: event write throughput, and recovery time with and without a snapshot at 100k live games.
+
+Writes --history finished games and --live games still in play to a journal, then times recovering the live
+games from the journal alone (grows with everything ever played) and from a snapshot plus --since games'
+worth of newer events (bounded by how much happens between snapshots). No database needed.
+    python -m benchmarks.bench_journal --live 100000 --history 200000
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from classes.game_journal import GameJournal, game_state
+
+PLAYERS_CHARS = ['X', 'O', '∆', '4', '5']
+LIVE_MOVES = TIE_MOVES[:4]  # Nobody has won yet
+
+
+def write_games(journal, prefix, count, moves):
+    for n in range(count):
+        game_id = f"{prefix}{n}"
+        journal.append("create", game_id, 1, 2, f"{prefix}a{n}", 0.0)
+        journal.append("join", game_id, 2, f"{prefix}b{n}")
+        for seq, (row, col) in enumerate(moves, 3):
+            journal.append("move", game_id, seq, row, col)
+
+
+def write_throughput(directory, threads, games_per_thread):
+    journal = GameJournal(directory)
+    journal.recover(PLAYERS_CHARS)
+    workers = [threading.Thread(target=write_games, args=(journal, f"w{index}_", games_per_thread, TIE_MOVES))
+               for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    appended = time.perf_counter() - started
+    journal.close()
+    durable = time.perf_counter() - started
+    return journal.appended / appended, journal.appended / durable, journal.syncs
+
+
+def timed_recover(directory):
+    journal = GameJournal(directory)
+    started = time.perf_counter()
+    games = journal.recover(PLAYERS_CHARS)
+    elapsed = time.perf_counter() - started
+    return journal, games, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", type=int, default=100000)
+    parser.add_argument("--history", type=int, default=200000)
+    parser.add_argument("--since", type=int, default=10000, help="games started after the snapshot")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    per_second, durable_per_second, syncs = write_throughput(directory, args.threads, args.live // args.threads)
+    print(f"append: {per_second:9.0f} events/s from {args.threads} threads, {durable_per_second:9.0f} events/s "
+          f"on disk ({syncs} fsyncs)")
+    shutil.rmtree(directory)
+
+    directory = tempfile.mkdtemp()
+    journal = GameJournal(directory)
+    journal.recover(PLAYERS_CHARS)
+    write_games(journal, "h", args.history, TIE_MOVES)
+    write_games(journal, "g", args.live, LIVE_MOVES)
+    journal.close()
+
+    journal, games, elapsed = timed_recover(directory)
+    print(f"recover from the journal alone:   {elapsed * 1000:7.0f} ms, {len(games)} live games "
+          f"({args.history} finished games replayed)")
+    journal.snapshot(lambda: {game_id: game_state(game_data) for game_id, game_data in games.items()})
+    write_games(journal, "s", args.since, LIVE_MOVES)
+    journal.close()
+
+    journal, games, elapsed = timed_recover(directory)
+    print(f"recover from snapshot + journal:  {elapsed * 1000:7.0f} ms, {len(games)} live games "
+          f"({args.since} games since the snapshot)")
+    journal.close()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""The in-memory ranked leaderboard against re-sorting every player after each result (what the
+ORDER BY wins DESC, draws DESC, losses scan did), at --users players. No database needed.
+    python -m benchmarks.bench_leaderboard --users 100000 --results 20000
+"""
+import argparse
+import random
+import time
+
+from classes.leaderboard_cache import LeaderboardCache, rank_key
+
+RESULTS = ('win', 'loss', 'tie')
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {count:>8} ops  {elapsed / count * 1e6:>10.2f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--results", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    rows = [(f"user{n}", rng.randrange(100), rng.randrange(100), rng.randrange(100)) for n in range(args.users)]
+    cache = LeaderboardCache()
+    timed("load", 1, lambda: cache.load(rows))
+
+    results = [(f"user{rng.randrange(args.users)}", rng.choice(RESULTS)) for _ in range(args.results)]
+    timed("record result", len(results), lambda: [cache.record_many((result,)) for result in results])
+    users = [username for username, _ in results]
+    timed("rank of user", len(users), lambda: [cache.rank(username) for username in users])
+    timed("top 10", 10000, lambda: [cache.top(10) for _ in range(10000)])
+    timed("20 around user", len(users), lambda: [cache.around(username, 10) for username in users])
+
+    stats = {username: [wins, losses, draws] for username, wins, losses, draws in rows}
+    rescans = 20
+    timed("full re-sort per result (old)", rescans,
+          lambda: [sorted(stats, key=lambda username: rank_key(username, *stats[username])) for _ in range(rescans)])
+
+    # Every player must sit where a full sort puts them
+    expected = sorted(cache.stats, key=lambda username: rank_key(username, *cache.stats[username]))
+    assert [entry["username"] for entry in cache.top(len(expected))] == expected
+    drifted = [(username, wins + 1, losses, draws) for username, (wins, losses, draws) in list(cache.stats.items())[:100]]
+    rest = [(username, *counts) for username, counts in list(cache.stats.items())[100:]]
+    timed("reconcile (100 drifted)", 1, lambda: cache.reconcile(drifted + rest))
+
+
+if __name__ == '__main__':
+    main()
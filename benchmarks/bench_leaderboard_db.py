@@ -0,0 +1,148 @@
+"""Leaderboard queries at --users players: checks their plans with EXPLAIN, then times them.
+
+The EXPLAIN check fails (exit status 1) when a query that should use an index doesn't, or a ranked page
+needs a sort of its own. With --db mysql it fills the configured database with bench users on the first run
+and later runs reuse them; --db sqlite (EXPLAIN QUERY PLAN) needs no database server and fills a throwaway one.
+    python -m benchmarks.bench_leaderboard_db --users 1000000
+    python -m benchmarks.bench_leaderboard_db --db sqlite --users 10000 --check-only
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from sql.SQLClient import SQLClient
+from sql.backends import SQLiteBackend
+from sql.sql_queries import LEADERBOARD_FIRST_PAGE_SQL, LEADERBOARD_NEXT_PAGE_SQL
+
+INSERT_CHUNK = 10000
+RANK_INDEX = "idx_leaderboard_rank"
+USER_INDEX = "idx_leaderboard_user"
+SQLITE_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY)")
+
+
+def explain(sql_client, query, params, tables):
+    """(index, sorts) for the first of tables in the query's plan: the index it reads that table through (None
+    for a full scan) and whether the rows need a sort of their own afterwards."""
+    with sql_client.cursor() as cur:
+        if sql_client.backend.name == "sqlite":
+            cur.execute("EXPLAIN QUERY PLAN " + query, params)
+            details = [row[-1] for row in cur.fetchall()]
+            sorts = any("USE TEMP B-TREE FOR ORDER BY" in detail for detail in details)
+            for detail in details:
+                words = detail.split()
+                if words[:1] in (["SCAN"], ["SEARCH"]) and words[1] in tables:
+                    match = SQLITE_INDEX.search(detail)
+                    return (match.group(1) or match.group(2) if match else None), sorts
+            raise AssertionError(f"No step reads {tables}: {details}")
+        cur.execute("EXPLAIN " + query, params)
+        plan = [dict(zip(cur.column_names, row)) for row in cur.fetchall()]
+    row = next(row for row in plan if row["table"] in tables)
+    return row["key"], "filesort" in (row["Extra"] or "")
+
+
+def check_query_plans(sql_client):
+    """EXPLAIN every hot leaderboard query. Returns a list of problems, empty when every plan is index-driven."""
+    problems = []
+    leaderboard = ("l", "leaderboard")
+
+    index, _ = explain(sql_client, "SELECT username_id FROM users WHERE username = %s", ("bench_user0",), ("users",))
+    if index is None:
+        problems.append("user id lookup scans users")
+
+    for label, query, params in (
+            ("leaderboard update", "UPDATE leaderboard SET wins = wins + 1 WHERE username_id = %s", (1,)),
+            ("record_results lookup", "SELECT username_id FROM leaderboard WHERE username_id IN (%s, %s, %s)",
+             (1, 2, 3))):
+        index, _ = explain(sql_client, query, params, leaderboard)
+        if index is None:
+            problems.append(f"{label} scans the leaderboard instead of using an index on username_id "
+                            f"({USER_INDEX} or the foreign key's)")
+
+    for label, query, params in (
+            ("first page", LEADERBOARD_FIRST_PAGE_SQL, (20,)),
+            ("next page", LEADERBOARD_NEXT_PAGE_SQL, (50, 50, 10, 10, 5, 5, 1000, 20))):
+        index, sorts = explain(sql_client, query, params, leaderboard)
+        if index != RANK_INDEX:
+            problems.append(f"{label} doesn't walk {RANK_INDEX}, uses {index}")
+        if sorts:
+            problems.append(f"{label} sorts the whole leaderboard")
+    return problems
+
+
+def fill(sql_client, users, seed):
+    with sql_client.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'bench!_user%' ESCAPE '!'")
+        existing = cur.fetchone()[0]
+    rng = random.Random(seed)
+    for start in range(existing, users, INSERT_CHUNK):
+        names = [f"bench_user{n}" for n in range(start, min(start + INSERT_CHUNK, users))]
+        with sql_client.cursor() as cur:
+            cur.executemany("INSERT INTO users (username, password, token) VALUES (%s, 'x', 'x')",
+                            [(name,) for name in names])
+            placeholders = ", ".join(["%s"] * len(names))
+            cur.execute(f"SELECT username_id FROM users WHERE username IN ({placeholders})", names)
+            ids = [row[0] for row in cur.fetchall()]
+            cur.executemany("INSERT INTO leaderboard (username_id, wins, losses, draws) VALUES (%s, %s, %s, %s)",
+                            [(user_id, rng.randrange(500), rng.randrange(500), rng.randrange(100)) for user_id in ids])
+        print(f"  {start + len(names)} / {users} users", end="\r")
+    print()
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {elapsed / count * 1000:>9.2f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check-only", action="store_true")
+    parser.add_argument("--db", choices=("mysql", "sqlite"), default="mysql",
+                        help="mysql: the configured database, sqlite: a throwaway database file")
+    args = parser.parse_args()
+
+    if args.db == "sqlite":
+        sql_client = SQLClient(backend=SQLiteBackend(os.path.join(tempfile.mkdtemp(), "leaderboard.db")))
+    else:
+        sql_client = SQLClient()
+    if not args.check_only or args.db == "sqlite":
+        # A throwaway SQLite database starts empty, and an empty table says little about the plans
+        fill(sql_client, args.users, args.seed)
+        with sql_client.cursor() as cur:
+            cur.execute("ANALYZE" if args.db == "sqlite" else "ANALYZE TABLE leaderboard, users")
+            cur.fetchall()
+
+    problems = check_query_plans(sql_client)
+    for problem in problems:
+        print(f"EXPLAIN: {problem}")
+    print("EXPLAIN check", "failed" if problems else "passed")
+    if args.check_only:
+        sys.exit(1 if problems else 0)
+
+    depth = args.users // 2
+    timed("first page (20)", 20, lambda: sql_client.load_leaderboard_page(20))
+    _, after = sql_client.load_leaderboard_page(depth)
+    timed(f"keyset page at rank {depth}", 20, lambda: sql_client.load_leaderboard_page(20, after))
+
+    def offset_page():
+        with sql_client.cursor() as cur:
+            cur.execute(LEADERBOARD_FIRST_PAGE_SQL.replace("LIMIT %s", "LIMIT %s OFFSET %s"), (20, depth))
+            cur.fetchall()
+
+    timed(f"OFFSET page at rank {depth} (old way)", 5, offset_page)
+    names = [f"bench_user{random.randrange(args.users)}" for _ in range(200)]
+    timed("record_results (200 results)", 5,
+          lambda: sql_client.record_results([(name, "win") for name in names]))
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Cost of one lobby page as the number of live games grows, against walking every game like before.
+
+    python -m benchmarks.bench_lobby --pages 2000
+"""
+import argparse
+import random
+import time
+
+from classes.lobby import OpenSeatIndex
+
+GAME_COUNTS = (100, 10000, 100000, 1000000)
+
+
+def build(game_count, rng):
+    index = OpenSeatIndex()
+    games = {}
+    for n in range(game_count):
+        game_id = f"G{n}"
+        num_players = rng.randint(2, 5)
+        # About half the games are already full
+        players = num_players if rng.random() < 0.5 else rng.randint(1, num_players - 1)
+        games[game_id] = {"players": players, "num_players": num_players}
+        if players < num_players:
+            index.add(game_id, num_players)
+    return index, games
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    for game_count in GAME_COUNTS:
+        index, games = build(game_count, rng)
+
+        started = time.perf_counter()
+        cursor = 0
+        for _ in range(args.pages):
+            entries, cursor = index.page(num_players=rng.choice((0, 2, 3, 4, 5)), cursor=cursor or 0)
+        page_time = (time.perf_counter() - started) / args.pages
+
+        scans = max(1, min(args.pages, 10000000 // game_count))
+        started = time.perf_counter()
+        for _ in range(scans):
+            [game_id for game_id, game in games.items() if game["players"] < game["num_players"]]
+        scan_time = (time.perf_counter() - started) / scans
+
+        print(f"{game_count:>9} games: lobby page {page_time * 1e6:8.1f} us | full walk {scan_time * 1e6:12.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""A login burst: scrypt verification inline in the client threads against the PasswordHasher process pool.
+
+While the burst runs, a ticker thread stands in for game traffic and records how late its 1 ms ticks fire.
+No database needed.
+    python -m benchmarks.bench_password_hashing --logins 400 --threads 64
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentile
+from sql.password_hasher import PasswordHasher, hash_password, verify_password
+
+
+class Ticker:
+    """Wakes every millisecond and records how late it woke."""
+
+    def __init__(self):
+        self.lateness = []
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+
+    def run(self):
+        while not self.stop.is_set():
+            due = time.perf_counter() + 0.001
+            time.sleep(0.001)
+            self.lateness.append(max(0.0, time.perf_counter() - due))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+def burst(verify, stored, logins, threads):
+    with Ticker() as ticker, ThreadPoolExecutor(threads) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: verify("password", stored)[0], range(logins)))
+        elapsed = time.perf_counter() - started
+    assert all(results)
+    return logins / elapsed, ticker.lateness
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+
+    stored = hash_password("password")
+    hasher = PasswordHasher()
+    hasher.verify("password", stored)  # Start the worker processes before timing
+    for label, verify in (("inline", verify_password), (f"process pool ({hasher.workers})", hasher.verify)):
+        rate, lateness = burst(verify, stored, args.logins, args.threads)
+        print(f"{label:<18} {rate:8.1f} logins/s  game tick lateness p50 {percentile(lateness, 50) * 1000:.2f} ms  "
+              f"p99 {percentile(lateness, 99) * 1000:.2f} ms  max {max(lateness) * 1000:.2f} ms")
+    print("pool latency histogram:", {bucket: count for bucket, count in hasher.histogram().items() if count})
+    hasher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Move throughput as worker threads are added: per-game locks (GameRegistry) against one global lock.
+
+Each worker plays moves in its own set of games, so with per-game locks the workers never contend.
+Under the GIL the pure-Python work still runs one thread at a time; the difference shows up once moves
+block on I/O while holding the lock.
+    python -m benchmarks.bench_registry --games-per-worker 200 --moves 200000
+"""
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+
+from classes.bitboard import Bitboard
+from classes.game_registry import GameRegistry
+from enums.game import Game
+
+BOARD_SIZE = 6
+NUM_PLAYERS = 5
+
+
+class GlobalLockRegistry(GameRegistry):
+    """Every game behind one lock, like a plain dict guarded by a single mutex."""
+
+    def __init__(self):
+        super().__init__()
+        self.global_lock = threading.RLock()
+
+    @contextmanager
+    def locked(self, game_id):
+        with self.global_lock:
+            yield self.get(game_id)
+
+
+def new_game():
+    return {Game.BOARD: Bitboard(BOARD_SIZE, NUM_PLAYERS), Game.CURRENT_PLAYER: 0, Game.NUM_PLAYERS: NUM_PLAYERS}
+
+
+def play(registry, game_ids, moves):
+    cells = BOARD_SIZE * BOARD_SIZE
+    for move in range(moves):
+        game_id = game_ids[move % len(game_ids)]
+        with registry.locked(game_id) as game_data:
+            board = game_data[Game.BOARD]
+            if board.is_full():
+                game_data[Game.BOARD] = board = Bitboard(BOARD_SIZE, NUM_PLAYERS)
+            row, col = divmod(bin(board.occupied).count("1") % cells, BOARD_SIZE)
+            player = game_data[Game.CURRENT_PLAYER]
+            board.place(row, col, player)
+            board.is_winning_move(row, col, player)
+            game_data[Game.CURRENT_PLAYER] = (player + 1) % NUM_PLAYERS
+
+
+def run(registry_class, workers, games_per_worker, moves):
+    registry = registry_class()
+    game_sets = []
+    for worker in range(workers):
+        game_ids = [f"{worker}-{n}" for n in range(games_per_worker)]
+        for game_id in game_ids:
+            registry.add_if_absent(game_id, new_game())
+        game_sets.append(game_ids)
+
+    moves_per_worker = moves // workers
+    threads = [threading.Thread(target=play, args=(registry, game_ids, moves_per_worker)) for game_ids in game_sets]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return moves_per_worker * workers / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games-per-worker", type=int, default=200)
+    parser.add_argument("--moves", type=int, default=200000)
+    args = parser.parse_args()
+
+    for workers in (1, 2, 4, 8, 16):
+        striped = run(GameRegistry, workers, args.games_per_worker, args.moves)
+        global_lock = run(GlobalLockRegistry, workers, args.games_per_worker, args.moves)
+        print(f"{workers:>2} workers: per-game locks {striped:>10,.0f} moves/s | "
+              f"global lock {global_lock:>10,.0f} moves/s")
+
+
+if __name__ == '__main__':
+    main()
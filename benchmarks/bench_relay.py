@@ -0,0 +1,150 @@
+"""Fan-out to the spectators of one game, straight from the server against through relay nodes.
+
+Two players play tie games back to back while --spectators watch, connected either all to the server
+(--relays 0) or spread over that many relay nodes (python -m classes.relay). For each move it reports the time
+until every spectator has the update, and the CPU time the owning server spends per move: with relays it
+sends each update once per relay instead of once per spectator. Uses a throwaway SQLite database.
+    python -m benchmarks.bench_relay --spectators 1000 --relays 0 2 4
+"""
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from benchmarks.common import ROOT_DIR, BenchClient, percentile, start_server_process, stop_server_process
+from classes.protocol import PING, PONG, FrameDecoder, encode_frame
+from classes.relay import PORT as RELAY_PORT
+from classes.server import ADDR, SERVER_MODES
+
+UPSTREAM_PORT = 65433
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time of a process, read from /proc (Linux only)."""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def start_relay_process(port):
+    process = subprocess.Popen([sys.executable, "-m", "classes.relay", "--port", str(port),
+                                "--upstream-port", str(UPSTREAM_PORT)], cwd=ROOT_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection((ADDR[0], port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Relay did not start listening in time")
+
+
+class Spectators:
+    """Many spectator sockets read from one selector, counting the messages each has received."""
+
+    def __init__(self, addresses):
+        self.selector = selectors.DefaultSelector()
+        self.received = {}
+        for address in addresses:
+            sock = socket.create_connection(address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.received[sock] = 0
+            self.selector.register(sock, selectors.EVENT_READ, FrameDecoder())
+
+    def send_all(self, message):
+        for sock in self.received:
+            sock.sendall(encode_frame(message))
+
+    def wait_for(self, count):
+        """Read until every spectator has received at least count messages in all."""
+        behind = sum(1 for received in self.received.values() if received < count)
+        while behind:
+            for key, _ in self.selector.select(timeout=30):
+                sock = key.fileobj
+                for message in key.data.feed(sock.recv(65536)):
+                    if message == PING:
+                        sock.sendall(encode_frame(PONG))
+                    elif message != PONG:
+                        self.received[sock] += 1
+                        if self.received[sock] == count:
+                            behind -= 1
+
+    def close(self):
+        for sock in self.received:
+            sock.close()
+
+
+def run(args, relays, server_pid):
+    if relays:
+        addresses = [(ADDR[0], RELAY_PORT + index % relays) for index in range(args.spectators)]
+    else:
+        addresses = [ADDR] * args.spectators
+    spectators = Spectators(addresses)
+    expected = 0
+    latencies = []
+    cpu = 0.0
+    for round_index in range(args.games):
+        names = (f"relay{relays}_{round_index}a", f"relay{relays}_{round_index}b")
+        creator, joiner = BenchClient(), BenchClient()
+        creator.send(f"create_game 2 {names[0]}")
+        game_id = creator.receive().split(":")[1].split()[0]
+        joiner.send(f"join_game {game_id} {names[1]}")
+        joiner.receive()
+        joiner.receive()
+        spectators.send_all(f"observer_join_game {game_id} watcher")
+        expected += 2  # Join confirmation and board snapshot
+        spectators.wait_for(expected)
+        players = (creator, joiner)
+        cpu_before = cpu_seconds(server_pid)
+        for turn, (row, col) in enumerate(TIE_MOVES):
+            started = time.perf_counter()
+            players[turn % 2].send(f"make_move {game_id} {names[turn % 2]} {row},{col}")
+            expected += 2 if turn == len(TIE_MOVES) - 1 else 1  # The last move also announces the tie
+            spectators.wait_for(expected)
+            latencies.append(time.perf_counter() - started)
+            for player in players:
+                player.receive()
+        cpu += cpu_seconds(server_pid) - cpu_before
+        creator.close()
+        joiner.close()
+    spectators.close()
+    return latencies, cpu / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spectators", type=int, default=1000)
+    parser.add_argument("--relays", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--mode", choices=SERVER_MODES, default="asyncio")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "relay.db")
+    server = start_server_process("--mode", args.mode, "--db", "sqlite", "--sqlite-path", path, "--journal-dir", "",
+                                  "--relay-port", str(UPSTREAM_PORT))
+    print(f"{os.cpu_count()} cores, {args.spectators} spectators, {args.mode} server")
+    try:
+        for relays in args.relays:
+            relay_processes = [start_relay_process(RELAY_PORT + index) for index in range(relays)]
+            try:
+                latencies, cpu_per_move = run(args, relays, server.pid)
+            finally:
+                for process in relay_processes:
+                    stop_server_process(process)
+            owner_sends = 2 + (relays or args.spectators)
+            print(f"{relays} relays: every spectator updated after p50 {percentile(latencies, 50) * 1000:6.2f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:6.2f} ms; server {cpu_per_move * 1000:5.2f} ms CPU "
+                  f"and {owner_sends} sends per move")
+    finally:
+        stop_server_process(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Bitboard win detection against the list-of-lists full-board scan, on board sizes 3x3 to 6x6.
+
+Before timing, every move of a few thousand random games is checked with both, and they must agree.
+Also reports the memory taken by one board in each representation.
+    python -m benchmarks.bench_rules --games 2000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from classes.bitboard import Bitboard
+from classes.rules import scan_for_win
+
+PLAYERS_CHARS = ['X', 'O', '∆', '4', '5']
+
+
+def random_game(board_size, rng):
+    """Yield (rows, bitboard, row, col, player_index) after every move of a random game, until a win or a full board."""
+    num_players = board_size - 1
+    rows = [[' '] * board_size for _ in range(board_size)]
+    bitboard = Bitboard(board_size, num_players)
+    cells = [(row, col) for row in range(board_size) for col in range(board_size)]
+    rng.shuffle(cells)
+    for index, (row, col) in enumerate(cells):
+        player_index = index % num_players
+        rows[row][col] = PLAYERS_CHARS[player_index]
+        bitboard.place(row, col, player_index)
+        yield rows, bitboard, row, col, player_index
+        if scan_for_win(rows, PLAYERS_CHARS[player_index]):
+            return
+
+
+def check_equivalence(board_size, games, rng):
+    moves = 0
+    for _ in range(games):
+        for rows, bitboard, row, col, player_index in random_game(board_size, rng):
+            moves += 1
+            if bitboard.is_winning_move(row, col, player_index) != scan_for_win(rows, PLAYERS_CHARS[player_index]):
+                raise AssertionError(f"Mismatch on {board_size}x{board_size} at {row},{col}: {rows}")
+            if bitboard.to_rows(PLAYERS_CHARS) != rows:
+                raise AssertionError(f"to_rows differs from the list board: {rows}")
+    return moves
+
+
+def bytes_per_board(factory, count=10000):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    boards = [factory() for _ in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del boards
+    return used / count
+
+
+def full_bitboard(board_size):
+    num_players = board_size - 1
+    bitboard = Bitboard(board_size, num_players)
+    for cell in range(board_size * board_size):
+        bitboard.place(*divmod(cell, board_size), cell % num_players)
+    return bitboard
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for board_size in range(3, 7):
+        moves = check_equivalence(board_size, args.games, rng)
+        positions = []
+        for _ in range(args.games):
+            for rows, bitboard, row, col, player_index in random_game(board_size, rng):
+                snapshot = Bitboard(board_size, board_size - 1)
+                snapshot.masks, snapshot.occupied = list(bitboard.masks), bitboard.occupied
+                positions.append(([list(r) for r in rows], snapshot, row, col, player_index))
+
+        started = time.perf_counter()
+        for rows, _, _, _, player_index in positions:
+            scan_for_win(rows, PLAYERS_CHARS[player_index])
+        scan_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _, bitboard, row, col, player_index in positions:
+            bitboard.is_winning_move(row, col, player_index)
+        bitboard_time = time.perf_counter() - started
+
+        list_bytes = bytes_per_board(lambda: [[PLAYERS_CHARS[0]] * board_size for _ in range(board_size)])
+        bitboard_bytes = bytes_per_board(lambda: full_bitboard(board_size))
+
+        count = len(positions)
+        print(f"{board_size}x{board_size}: {moves} moves equivalent | "
+              f"full scan {scan_time / count * 1e9:6.0f} ns/move, "
+              f"bitboard {bitboard_time / count * 1e9:6.0f} ns/move ({scan_time / bitboard_time:.1f}x) | "
+              f"list board {list_bytes:.0f} B, bitboard {bitboard_bytes:.0f} B")
+
+
+if __name__ == '__main__':
+    main()
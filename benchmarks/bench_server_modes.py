@@ -0,0 +1,77 @@
+"""Compare the threaded and asyncio server modes: idle connections per GB of RSS and move latency.
+
+Uses a throwaway SQLite database, with the game journal off:
+    python -m benchmarks.bench_server_modes --connections 2000 --games 50
+"""
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from benchmarks.common import ADDR, BenchClient, percentile, rss_bytes, start_server_process, stop_server_process
+
+GIB = 1024 ** 3
+# A full 3x3 game (2 players) that ends in a tie
+TIE_MOVES = [(0, 0), (0, 1), (0, 2), (1, 1), (1, 0), (2, 0), (2, 1), (1, 2), (2, 2)]
+
+
+def measure_idle_connections(process, count):
+    time.sleep(0.5)
+    baseline = rss_bytes(process.pid)
+    sockets = [socket.create_connection(ADDR) for _ in range(count)]
+    time.sleep(2)  # let the server accept and set up every connection
+    used = rss_bytes(process.pid) - baseline
+    for sock in sockets:
+        sock.close()
+    return used
+
+
+def measure_move_latency(games):
+    samples = []
+    for game_number in range(games):
+        creator, joiner = BenchClient(), BenchClient()
+        names = (f"bench_a{game_number}", f"bench_b{game_number}")
+        creator.send(f"create_game 2 {names[0]}")
+        game_id = creator.receive().split(":")[1].split()[0]
+        joiner.send(f"join_game {game_id} {names[1]}")
+        joiner.receive()  # join confirmation
+        joiner.receive()  # board snapshot
+        players = (creator, joiner)
+        # The last move ends the game and touches the database, so it is not sampled
+        for index, (row, col) in enumerate(TIE_MOVES[:-1]):
+            mover = players[index % 2]
+            started = time.perf_counter()
+            mover.send(f"make_move {game_id} {names[index % 2]} {row},{col}")
+            mover.receive()
+            samples.append(time.perf_counter() - started)
+            players[(index + 1) % 2].receive()
+        creator.close()
+        joiner.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--games", type=int, default=50)
+    args = parser.parse_args()
+
+    for mode in ("threaded", "asyncio"):
+        path = os.path.join(tempfile.mkdtemp(), "modes.db")
+        process = start_server_process("--mode", mode, "--db", "sqlite", "--sqlite-path", path, "--journal-dir", "")
+        try:
+            used = measure_idle_connections(process, args.connections)
+            samples = measure_move_latency(args.games)
+        finally:
+            stop_server_process(process)
+
+        per_gb = args.connections * GIB / used if used > 0 else float("inf")
+        print(f"[{mode}] {args.connections} idle connections used {used / 1024 ** 2:.1f} MiB "
+              f"-> {per_gb:,.0f} connections per GB")
+        print(f"[{mode}] move latency over {len(samples)} moves: "
+              f"p50 {percentile(samples, 50) * 1000:.3f} ms, p99 {percentile(samples, 99) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Move latency while a spectator that never reads watches every game, for each mode and slow-consumer policy.
+
+The spectator shrinks its receive buffer, so its backlog builds up on the server; moves should not slow down.
+Uses a throwaway SQLite database, with the game journal off:
+    python -m benchmarks.bench_slow_consumer --games 300 --high-water 4096
+"""
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from benchmarks.bench_server_modes import TIE_MOVES
+from benchmarks.common import ADDR, BenchClient, percentile, start_server_process, stop_server_process
+from classes.protocol import encode_frame
+
+
+def open_games(count):
+    games = []
+    for game_number in range(count):
+        creator, joiner = BenchClient(), BenchClient()
+        names = (f"slow_a{game_number}", f"slow_b{game_number}")
+        creator.send(f"create_game 2 {names[0]}")
+        game_id = creator.receive().split(":")[1].split()[0]
+        joiner.send(f"join_game {game_id} {names[1]}")
+        joiner.receive()  # join confirmation
+        joiner.receive()  # board snapshot
+        games.append((game_id, (creator, joiner), names))
+    return games
+
+
+def stalled_spectator(games):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+    sock.connect(ADDR)
+    for game_id, _, _ in games:
+        sock.sendall(encode_frame(f"observer_join_game {game_id} slow_watcher"))
+    return sock
+
+
+def play_round_robin(games):
+    """Play one move in every game in turn, so each move is broadcast to the stalled spectator."""
+    samples = []
+    # The last move ends the game and touches the database, so it is not played
+    for index, (row, col) in enumerate(TIE_MOVES[:-1]):
+        for game_id, players, names in games:
+            mover = players[index % 2]
+            started = time.perf_counter()
+            mover.send(f"make_move {game_id} {names[index % 2]} {row},{col}")
+            mover.receive()
+            samples.append(time.perf_counter() - started)
+            players[(index + 1) % 2].receive()
+    return samples
+
+
+def spectator_evicted(sock):
+    sock.settimeout(2)
+    try:
+        while True:
+            if not sock.recv(65536):
+                return True
+    except socket.timeout:
+        return False
+    except OSError:
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=300)
+    parser.add_argument("--high-water", type=int, default=4096)
+    args = parser.parse_args()
+
+    for mode in ("threaded", "asyncio"):
+        for policy in ("evict", "resync"):
+            path = os.path.join(tempfile.mkdtemp(), "slow_consumer.db")
+            process = start_server_process("--mode", mode, "--send-high-water", str(args.high_water),
+                                           "--slow-consumer", policy, "--db", "sqlite", "--sqlite-path", path,
+                                           "--journal-dir", "")
+            try:
+                games = open_games(args.games)
+                spectator = stalled_spectator(games)
+                samples = play_round_robin(games)
+                evicted = spectator_evicted(spectator)
+                print(f"{mode:<9} {policy:<7} {len(samples)} moves  p50 {percentile(samples, 50) * 1000:.2f} ms  "
+                      f"p99 {percentile(samples, 99) * 1000:.2f} ms  max {max(samples) * 1000:.2f} ms  "
+                      f"spectator {'evicted' if evicted else 'kept'}")
+                spectator.close()
+                for _, players, _ in games:
+                    for player in players:
+                        player.close()
+            finally:
+                stop_server_process(process)
+
+
+if __name__ == '__main__':
+    main()
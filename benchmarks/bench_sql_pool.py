@@ -0,0 +1,99 @@
+"""Login throughput against the database for different connection pool sizes, from many concurrent threads.
+
+With --backend mysql it drives SQLClient.authenticate_user against the configured MySQL/MariaDB server.
+With --backend sqlite it runs the same login query through a ConnectionPool of SQLiteBackend connections; --latency
+adds a per-query sleep standing in for the network round trip a MySQL server has (SQLite has none).
+    python -m benchmarks.bench_sql_pool --backend sqlite --threads 32 --seconds 3
+    python -m benchmarks.bench_sql_pool --backend mysql --threads 32 --seconds 3
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from sql.backends import SQLiteBackend
+from sql.connection_pool import ConnectionPool
+
+POOL_SIZES = (0, 1, 2, 4, 8, 16)
+USERS = 1000
+
+
+def sqlite_login_factory(pool_size, latency):
+    path = os.path.join(tempfile.mkdtemp(), "bench_pool.db")
+    setup = sqlite3.connect(path)
+    setup.execute("PRAGMA journal_mode=WAL")
+    setup.execute("CREATE TABLE users (username_id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)")
+    setup.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                      [(f"user{n}", hashlib.sha256(b"password").hexdigest()) for n in range(USERS)])
+    setup.commit()
+    setup.close()
+
+    # Pool size 0 is the old setup: one connection shared by every thread behind a lock
+    pool = ConnectionPool(SQLiteBackend(path).connect, max(pool_size, 1))
+    shared_lock = threading.Lock() if pool_size == 0 else contextlib.nullcontext()
+
+    def login(username):
+        hashed_password = hashlib.sha256(b"password").hexdigest()
+        with shared_lock, pool.connection() as conn:
+            time.sleep(latency)
+            row = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] == hashed_password
+
+    return login, pool.close
+
+
+def mysql_login_factory(pool_size, latency):
+    from sql.SQLClient import SQLClient
+
+    client = SQLClient(pool_size=pool_size)
+    for n in range(USERS):
+        client.insert_user(f"user{n}", "password")
+    return lambda username: client.authenticate_user(username, "password")[0], client.close_connection
+
+
+def measure(login, threads, seconds):
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(index):
+        n = index
+        while not stop.is_set():
+            login(f"user{n % USERS}")
+            counts[index] += 1
+            n += threads
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--latency", type=float, default=0.0005, help="sqlite only: simulated round trip, seconds")
+    args = parser.parse_args()
+
+    factory = sqlite_login_factory if args.backend == "sqlite" else mysql_login_factory
+    for pool_size in POOL_SIZES:
+        with contextlib.redirect_stdout(io.StringIO()):  # SQLClient prints on every login
+            login, close = factory(pool_size, args.latency)
+            rate = measure(login, args.threads, args.seconds)
+            close()
+        label = "shared" if pool_size == 0 else f"pool {pool_size}"
+        print(f"{label:<8} {rate:9.0f} logins/s with {args.threads} threads")
+
+
+if __name__ == '__main__':
+    main()
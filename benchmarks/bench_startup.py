@@ -0,0 +1,95 @@
+"""Server time-to-listen as the database grows, against reading every table up front as startup used to.
+
+Fills a SQLite database with --rows users, leaderboard rows and finished games per run, starts the server on it
+and measures how long until it accepts connections, then until get_leaderboard stops answering "still loading".
+No database server needed.
+    python -m benchmarks.bench_startup --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import BenchClient, rss_bytes, start_server_process, stop_server_process
+from sql.backends import SQLiteBackend
+from sql.sql_queries import CREATE_GAME_TABLE_SQL, CREATE_LEADERBOARD_TABLE_SQL, CREATE_USER_SQL, MIGRATIONS
+
+CHUNK = 100000
+
+
+def fill_database(path, rows):
+    conn = SQLiteBackend(path).connect()
+    cur = SQLiteBackend.cursor(conn)
+    for statement in (CREATE_USER_SQL, CREATE_LEADERBOARD_TABLE_SQL, CREATE_GAME_TABLE_SQL):
+        cur.execute(statement)
+    for start in range(0, rows, CHUNK):
+        ids = range(start + 1, min(start + CHUNK, rows) + 1)
+        cur.executemany("INSERT INTO users (username_id, username, password, token) VALUES (%s, %s, %s, %s)",
+                        [(n, f"user{n}", "x" * 106, "t" * 32) for n in ids])
+        cur.executemany("INSERT INTO leaderboard (username_id, wins, losses, draws) VALUES (%s, %s, %s, %s)",
+                        [(n, n % 97, n % 89, n % 7) for n in ids])
+        cur.executemany("INSERT INTO games (username_id, result) VALUES (%s, %s)",
+                        [(n, ("win", "loss", "tie")[n % 3]) for n in ids])
+        conn.commit()
+    # As a server that has run before left it, so startup doesn't build the indexes
+    for _, statement in MIGRATIONS:
+        cur.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def eager_load(path):
+    """What startup used to do before listening: fetchall() of the users, leaderboard and games tables."""
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    for query in ("SELECT username_id, username, token FROM users",
+                  "SELECT u.username, SUM(l.wins), SUM(l.losses), SUM(l.draws) FROM leaderboard l "
+                  "JOIN users u ON u.username_id = l.username_id GROUP BY u.username",
+                  "SELECT game_id, username_id, result, timestamp FROM games"):
+        conn.execute(query).fetchall()
+    conn.close()
+    return time.perf_counter() - started
+
+
+def wait_for_leaderboard():
+    client = BenchClient()
+    try:
+        while True:
+            client.send("get_leaderboard 0 1")
+            if not client.receive().startswith("Leaderboard is still loading"):
+                return
+            time.sleep(0.01)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    for rows in args.rows:
+        path = os.path.join(directory, f"startup_{rows}.db")
+        fill_database(path, rows)
+        eager = eager_load(path)
+        started = time.perf_counter()
+        process = start_server_process("--db", "sqlite", "--sqlite-path", path, "--journal-dir", "",
+                                       poll_interval=0.005)
+        try:
+            listening = time.perf_counter() - started
+            wait_for_leaderboard()
+            loaded = time.perf_counter() - started
+            rss = rss_bytes(process.pid)
+        finally:
+            stop_server_process(process)
+        print(f"{rows:>8} rows  time-to-listen {listening * 1000:7.0f} ms  leaderboard loaded after "
+              f"{loaded * 1000:7.0f} ms  RSS {rss / 2 ** 20:6.0f} MiB  (old up-front fetchall: {eager * 1000:7.0f} ms)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Turn clocks: cost of starting and resetting 200k concurrent clocks on the timer wheel, and how late they fire.
+
+Starts --clocks turn clocks, resets each one --resets times (a move restarts the mover's clock) and lets them
+run out, against the same on a heap with lazily dropped stale entries. No server or database needed.
+    python -m benchmarks.bench_timer_wheel --clocks 200000
+"""
+import argparse
+import heapq
+import threading
+import time
+
+from classes.timer_wheel import TimerWheel
+
+
+class HeapTimers:
+    """The usual alternative: a heap of (deadline, generation, key), stale entries skipped when popped."""
+
+    def __init__(self):
+        self.heap = []
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def schedule(self, key, delay, callback, *args):
+        with self.lock:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+            heapq.heappush(self.heap, (time.monotonic() + delay, generation, key, callback, args))
+
+    def expire(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, generation, key, callback, args = heapq.heappop(self.heap)
+                if self.generations.get(key) == generation:
+                    del self.generations[key]
+                    callback(*args)
+
+
+def time_schedules(timers, clocks, resets, delay, callback):
+    started = time.perf_counter()
+    for _ in range(resets + 1):
+        for key in range(clocks):
+            timers.schedule(key, delay, callback, key, time.monotonic() + delay)
+    return (time.perf_counter() - started) / (clocks * (resets + 1)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clocks", type=int, default=200000)
+    parser.add_argument("--resets", type=int, default=4, help="times each clock is restarted before it runs out")
+    parser.add_argument("--delay", type=float, default=3.0, help="seconds on each clock")
+    args = parser.parse_args()
+
+    lateness = []
+    done = threading.Event()
+
+    def fired(key, deadline):
+        lateness.append(time.monotonic() - deadline)
+        if len(lateness) == args.clocks:
+            done.set()
+
+    wheel = TimerWheel()
+    per_op = time_schedules(wheel, args.clocks, args.resets, args.delay, fired)
+    print(f"timer wheel: {per_op:5.2f} us per start/reset, {len(wheel)} clocks pending")
+    done.wait(args.delay * (args.resets + 2) + 10)
+    wheel.stop()
+    lateness.sort()
+    print(f"  fired {len(lateness)} of {args.clocks} once each, late by median "
+          f"{lateness[len(lateness) // 2] * 1000:.0f} ms, max {lateness[-1] * 1000:.0f} ms (tick {wheel.tick * 1000:.0f} ms)")
+
+    heap = HeapTimers()
+    per_op = time_schedules(heap, args.clocks, args.resets, args.delay, fired)
+    print(f"heap:        {per_op:5.2f} us per start/reset, {len(heap.heap)} entries held for "
+          f"{len(heap.generations)} clocks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""User-id cache: lookup cost and hit rate for a skewed player population, and the queries it saves per game.
+
+Players are drawn so that a small set plays most games, like a real population. No database needed.
+    python -m benchmarks.bench_user_cache --users 200000 --lookups 500000 --size 50000
+"""
+import argparse
+import random
+import time
+
+from sql.user_cache import UserCache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=500000)
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    cache = UserCache(max_size=args.size)
+    # Pareto-distributed player activity; each miss stands for one SELECT username_id round trip
+    names = [f"user{min(int(rng.paretovariate(1.2)) - 1, args.users - 1)}" for _ in range(args.lookups)]
+    started = time.perf_counter()
+    for name in names:
+        if cache.get(name) is None:
+            cache.put(name, int(name[4:]))
+    elapsed = time.perf_counter() - started
+
+    stats = cache.stats()
+    print(f"{args.lookups} lookups, cache of {args.size}: {elapsed / args.lookups * 1e9:.0f} ns/lookup, "
+          f"hit rate {stats['hits'] / args.lookups:.1%}")
+    print(f"user-id queries: {stats['misses']} instead of {args.lookups} "
+          f"({args.lookups - stats['misses']} round trips saved)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""create_game / exit_game latency as the number of live games grows, with the user index consistency check.
+
+Uses a throwaway SQLite database:
+    python -m benchmarks.bench_user_index --samples 2000
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from benchmarks.common import NullConnection, scratch_backend
+from classes.server import TicTacToeServer
+
+LIVE_GAME_COUNTS = (100, 1000, 10000, 100000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    server = TicTacToeServer(backend=scratch_backend())
+    live = 0
+    for target in LIVE_GAME_COUNTS:
+        # The server prints a line for every game created and left; keep that out of the timings and the output
+        with contextlib.redirect_stdout(io.StringIO()):
+            while live < target:
+                server.create_game(2, f"resident_{live}", NullConnection())
+                live += 1
+
+            create_time = exit_time = 0.0
+            for n in range(args.samples):
+                username = f"churn_{target}_{n}"
+                started = time.perf_counter()
+                server.create_game(2, username, NullConnection())
+                create_time += time.perf_counter() - started
+
+                started = time.perf_counter()
+                server.remove_player_from_game(username)
+                exit_time += time.perf_counter() - started
+
+        problems = server.games_data.check_consistency()
+        if problems:
+            raise AssertionError(f"User index out of sync: {problems[:5]}")
+        print(f"{len(server.games_data):>7} live games: create_game {create_time / args.samples * 1e6:7.1f} us, "
+              f"exit {exit_time / args.samples * 1e6:7.1f} us, index consistent")
+
+
+if __name__ == '__main__':
+    main()
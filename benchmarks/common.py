@@ -0,0 +1,114 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+from classes.protocol import PING, PONG, FrameReader, encode_frame
+from sql.backends import SQLiteBackend
+
+HOST = '127.0.0.1'
+PORT = 65432
+ADDR = (HOST, PORT)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scratch_backend():
+    """A SQLite database in a fresh temporary directory, for benchmarks that build a TicTacToeServer in process."""
+    return SQLiteBackend(os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+
+def start_server_process(*args, poll_interval=0.1):
+    """Start `python -m classes.server` with the given arguments and wait until it accepts connections."""
+    process = subprocess.Popen([sys.executable, "-m", "classes.server", *args], cwd=ROOT_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection(ADDR, timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(poll_interval)
+    process.kill()
+    raise RuntimeError("Server did not start listening in time")
+
+
+def stop_server_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def rss_bytes(pid):
+    """Resident memory of a process, read from /proc (Linux only)."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def thread_count(pid):
+    """Threads of a process, read from /proc (Linux only)."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    return 0
+
+
+class BenchClient:
+    """Minimal blocking client speaking the server's framed wire protocol."""
+
+    def __init__(self):
+        self.sock = socket.create_connection(ADDR)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader(self.sock)
+        self.pending = deque()
+
+    def send(self, message):
+        self.sock.sendall(encode_frame(message))
+
+    def receive(self):
+        """The next message, answering the server's heartbeat pings along the way."""
+        while True:
+            while not self.pending:
+                messages = self.reader.read_messages()
+                if messages is None:
+                    raise ConnectionError("Server closed the connection")
+                self.pending.extend(messages)
+            message = self.pending.popleft()
+            if message == PING:
+                self.send(PONG)
+            elif message != PONG:
+                return message
+
+    def close(self):
+        self.sock.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+
+class NullConnection:
+    """Stands in for a client socket when handlers are called directly; discards everything sent to it."""
+
+    def send(self, data):
+        return len(data)
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
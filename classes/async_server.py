@@ -0,0 +1,249 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from classes.commands import parse_command
+from classes.protocol import FrameDecoder, ProtocolError, SharedFrame, encode_frame, frame_counters
+
+# Before 3.12 transport.writelines() joins its buffers into one bytes object
+WRITELINES_COPIES = sys.version_info < (3, 12)
+
+
+class AsyncConnection:
+    """Socket-like wrapper around an asyncio transport, so the server's handlers can keep calling conn.send().
+
+    The transport's write buffer is the send queue. Once it passes the high-water mark the protocol's
+    pause_writing() marks the client as a slow consumer, and further writes either evict it or are
+    dropped until it catches up and gets the snapshots returned by on_resync (see QueuedConnection).
+    """
+
+    def __init__(self, loop, transport, policy="evict", on_resync=None):
+        self.loop = loop
+        self.transport = transport
+        self.loop_thread = threading.get_ident()
+        self.policy = policy
+        self.on_resync = on_resync
+        self.paused = False
+        self.needs_resync = False
+        self.dropped_frames = 0
+        self.last_seen = time.monotonic()  # When the client last sent anything
+
+    def send(self, data):
+        if self.transport.is_closing():
+            raise ConnectionError("Connection is closed")
+        # transport.write never blocks; it buffers whatever the kernel can't take yet
+        if not isinstance(data, (bytes, SharedFrame)):
+            data = bytes(data)  # The caller may reuse a mutable buffer once we return
+        if threading.get_ident() == self.loop_thread:
+            self.write(data)
+        else:
+            self.loop.call_soon_threadsafe(self.write, data)
+        return len(data)
+
+    def write(self, data):
+        if self.transport.is_closing():
+            return
+        if not self.paused:
+            if isinstance(data, SharedFrame) and len(data.parts) == 1:
+                self.transport.write(data.parts[0])
+            elif isinstance(data, SharedFrame):
+                self.transport.writelines(data.parts)  # Header and payload without joining them
+                if WRITELINES_COPIES:
+                    frame_counters.add(copied=1)
+            else:
+                self.transport.write(data)
+            return
+        self.dropped_frames += 1
+        if self.policy == "resync" and self.on_resync is not None:
+            self.needs_resync = True
+        else:
+            self.transport.abort()
+
+    def writing_paused(self):
+        self.paused = True
+
+    def writing_resumed(self):
+        self.paused = False
+        if self.needs_resync:
+            self.needs_resync = False
+            try:
+                frames = self.on_resync(self)
+            except Exception as e:
+                print(f"Error resyncing a slow client: {e}")
+                return
+            for frame in frames:
+                self.transport.write(frame)
+
+    def sendall(self, data):
+        self.send(data)
+
+    def close(self):
+        if threading.get_ident() == self.loop_thread:
+            self.transport.close()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+    def abort(self):
+        """Drop the connection without flushing; connection_lost() then cleans up."""
+        if threading.get_ident() == self.loop_thread:
+            self.transport.abort()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.abort)
+
+
+class ClientProtocol(asyncio.Protocol):
+    """Serves one client connection from the event loop using the server's command dispatcher."""
+
+    def __init__(self, server, loop, messages=(), leftover=b""):
+        """messages and leftover come with a connection another worker of the cluster handed over."""
+        self.server = server
+        self.loop = loop
+        self.conn = None
+        self.token = None
+        self.closed = False
+        self.decoder = FrameDecoder()
+        self.decoder.buffer += leftover
+        self.pending = deque(messages)
+        self.waiting_on_blocking_command = False
+        self.handoff = None  # (worker_id, fd, messages, leftover) once the connection moves to another worker
+
+    def connection_made(self, transport):
+        transport.set_write_buffer_limits(high=self.server.send_high_water_mark)
+        self.conn = AsyncConnection(self.loop, transport, self.server.slow_consumer_policy,
+                                    self.server.resync_connection)
+        self.token = next(self.server.connection_ids)
+        self.server.players_tokens[self.token] = self.conn
+        print(f"[NEW CONNECTION] {transport.get_extra_info('peername')} connected.")
+        if self.pending:
+            self.loop.call_soon(self.process_pending)
+
+    def data_received(self, data):
+        self.conn.last_seen = time.monotonic()
+        try:
+            self.pending.extend(self.decoder.feed(data))
+        except ProtocolError as e:
+            self.fail(e)
+            return
+        self.process_pending()
+
+    def process_pending(self):
+        while self.pending and not self.closed and not self.waiting_on_blocking_command:
+            command = parse_command(self.pending.popleft())
+            owner = self.server.route(command)
+            if owner is not None:
+                refusal = self.server.handoff_refusal(self.conn, command)
+                if refusal is not None:
+                    self.conn.send(encode_frame(refusal))
+                    continue
+                self.hand_off(owner, [command.raw, *self.pending])
+                return
+            if self.server.dispatcher.is_blocking(command):
+                # Commands that wait on the database run in a worker thread so they don't stall the loop.
+                # Stop reading until the reply is sent, so commands keep their order
+                self.waiting_on_blocking_command = True
+                self.conn.transport.pause_reading()
+                future = self.loop.run_in_executor(None, self.server.dispatch_command, self.conn, command)
+                future.add_done_callback(self.blocking_command_done)
+                return
+
+            try:
+                if not self.server.dispatch_command(self.conn, command):
+                    self.close()
+            except Exception as e:
+                self.fail(e)
+
+    def hand_off(self, owner, messages):
+        """Move the connection to the worker that owns its game, once what was already written has gone out.
+
+        Our transport closes only its own descriptor; a duplicate goes to the owner in connection_lost().
+        """
+        self.closed = True
+        self.pending.clear()
+        fd = os.dup(self.conn.transport.get_extra_info("socket").fileno())
+        self.handoff = (owner, fd, messages, bytes(self.decoder.buffer))
+        self.conn.transport.pause_reading()
+        self.conn.transport.close()
+
+    def pause_writing(self):
+        self.conn.writing_paused()
+
+    def resume_writing(self):
+        self.conn.writing_resumed()
+
+    def blocking_command_done(self, future):
+        self.waiting_on_blocking_command = False
+        if self.closed:
+            return
+        try:
+            if not future.result():
+                self.close()
+                return
+        except Exception as e:
+            self.fail(e)
+            return
+        self.conn.transport.resume_reading()
+        self.process_pending()
+
+    def fail(self, e):
+        print(f"Error in handle_client: {e}")
+        self.conn.send(encode_frame(f"Error: {e}\n"))
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.conn.send(encode_frame("Server closing connection.\n"))
+        self.conn.transport.close()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.server.players_tokens.pop(self.token, None)
+        self.server.handle_disconnect(self.conn)
+        if self.handoff is not None:
+            owner, fd, messages, leftover = self.handoff
+            try:
+                if not self.server.cluster.hand_off(owner, fd, messages, leftover):
+                    print(f"Could not hand a connection over to worker {owner}, dropping it.")
+            finally:
+                os.close(fd)
+            return
+        print("connection with a client closed")
+
+
+class AsyncServerEngine:
+    """Runs a TicTacToeServer from a single asyncio event loop instead of a thread per connection."""
+
+    def __init__(self, server, addr, backlog=4096):
+        self.server = server
+        self.addr = addr
+        self.backlog = backlog
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        host, port = self.addr
+        cluster = self.server.cluster is not None
+        if cluster:
+            # Connections other workers hand over arrive on a cluster thread
+            self.server.start_cluster(lambda sock, messages, leftover: asyncio.run_coroutine_threadsafe(
+                self.adopt(loop, sock, messages, leftover), loop))
+        # In a cluster every worker listens on the same port and the kernel spreads new connections across them
+        listener = await loop.create_server(lambda: ClientProtocol(self.server, loop), host, port,
+                                            backlog=self.backlog, reuse_port=cluster)
+        print(f"[LISTENING] Server (asyncio) is listening on {host}:{port}")
+        async with listener:
+            await listener.serve_forever()
+
+    async def adopt(self, loop, sock, messages, leftover):
+        """Serve a connection another worker handed over, starting with the messages it hadn't handled."""
+        try:
+            await loop.connect_accepted_socket(lambda: ClientProtocol(self.server, loop, messages, leftover), sock)
+        except Exception as e:
+            print(f"Error taking over a connection: {e}")
+            sock.close()
@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from classes.rules import line_masks
+
+EMPTY_CELL = ' '
+
+
+@lru_cache(maxsize=None)
+def full_mask(board_size):
+    return (1 << (board_size * board_size)) - 1
+
+
+class Bitboard:
+    """A game board stored as one integer bitmask per player, bit (row * size + col) set for each of their marks."""
+
+    __slots__ = ("size", "masks", "occupied")
+
+    def __init__(self, size, num_players):
+        self.size = size
+        self.masks = [0] * num_players
+        self.occupied = 0
+
+    def cell_bit(self, row, col):
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            raise IndexError(f"Cell {row},{col} is outside the {self.size}x{self.size} board")
+        return 1 << (row * self.size + col)
+
+    def is_empty(self, row, col):
+        return not self.occupied & self.cell_bit(row, col)
+
+    def place(self, row, col, player_index):
+        """Put a player's mark on a cell. Returns False if the cell is already taken."""
+        bit = self.cell_bit(row, col)
+        if self.occupied & bit:
+            return False
+        self.occupied |= bit
+        self.masks[player_index] |= bit
+        return True
+
+    def is_winning_move(self, row, col, player_index):
+        """Check whether the player's mark at (row, col) completes a line, testing only the lines through that cell."""
+        mask = self.masks[player_index]
+        for line in line_masks(self.size)[row * self.size + col]:
+            if mask & line == line:
+                return True
+        return False
+
+    def is_full(self):
+        return self.occupied == full_mask(self.size)
+
+    def to_rows(self, players_chars):
+        """The board as the list of lists of one-character strings that clients expect in {'game_board': ...}."""
+        rows = [[EMPTY_CELL] * self.size for _ in range(self.size)]
+        for player_index, mask in enumerate(self.masks):
+            symbol = players_chars[player_index]
+            while mask:
+                low_bit = mask & -mask
+                row, col = divmod(low_bit.bit_length() - 1, self.size)
+                rows[row][col] = symbol
+                mask ^= low_bit
+        return rows
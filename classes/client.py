@@ -3,9 +3,12 @@ import socket
 import threading
 import time
 import tkinter as tk
+from collections import deque
 from tkinter import messagebox, simpledialog
 from typing import NamedTuple
 
+from classes.protocol import HEARTBEAT_INTERVAL, PING, PONG, FrameReader, encode_frame
+
 HOST = '127.0.0.1'
 PORT = 65432
 FORMAT = "utf-8"
@@ -38,6 +41,12 @@ DEFAULT_PLAYERS = (
 class TicTacToeClient:
     def __init__(self):
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.frame_reader = FrameReader(self.client_socket)
+        self.pending_messages = deque()  # Messages that arrived in the same read as an earlier one
+        self.receive_lock = threading.Lock()
+        self.send_lock = threading.Lock()  # The heartbeat thread sends too; frames must not interleave
+        self.board_seq = 0  # Sequence number of the last move applied to our board
+        self.awaiting_snapshot = False  # Asked for a full board after missing a delta
         self.username = None
         self.token = None
         self.num_players = 2  # New variable to store the number of players
@@ -45,6 +54,7 @@ class TicTacToeClient:
 
     def create_authentication_window(self):
         self.client_socket.connect((HOST, PORT))
+        threading.Thread(target=self.send_heartbeats, daemon=True).start()
         self.root = tk.Tk()
         self.root.title("Tic Tac Toe - Client")
         login_button = tk.Button(self.root, text="Login", command=self.login)
@@ -145,10 +155,11 @@ class TicTacToeClient:
 
     def show_available_games(self):
         try:
-            # Send a request to the server to get a list of available games
-            self.send_data("get_available_games")
-            # Receive the list of available games from the server
-            available_games_str = self.receive_data()
+            # Ask the server for the first page of games with a free seat
+            self.send_data("get_lobby")
+            lobby = json.loads(self.receive_data())
+            available_games_str = '\n'.join(f"{game['game_id']} ({game['players']}/{game['num_players']} players)"
+                                            for game in lobby["games"])
 
             if available_games_str:
                 # Add debugging print statements
@@ -210,6 +221,7 @@ class TicTacToeClient:
 
                         # Access the game board list of lists
                         game_board = game_board_dict["game_board"]
+                        self.board_seq = game_board_dict.get("seq", 0)
                         self.show_game_window(game_id, num_players,game_board=game_board)
                     except ValueError:
                         print(f"Failed to convert num_players_str to int: {num_players_str}")
@@ -279,6 +291,7 @@ class TicTacToeClient:
 
                         # Access the game board list of lists
                         game_board = game_board_dict["game_board"]
+                        self.board_seq = game_board_dict.get("seq", 0)
                         self.show_game_window(game_id, num_players, game_board=game_board)
                     except ValueError:
                         print(f"Failed to convert num_players_str to int: {num_players_str}")
@@ -317,13 +330,40 @@ class TicTacToeClient:
 
     def send_data(self, message):
         try:
-            self.client_socket.send(message.encode(FORMAT))
+            with self.send_lock:
+                self.client_socket.sendall(encode_frame(message))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to send data to server: {e}")
 
+    def send_heartbeats(self):
+        """Ping the server now and then, so it knows we're still here while we sit in a menu or wait our turn."""
+        while True:
+            threading.Event().wait(HEARTBEAT_INTERVAL)
+            try:
+                with self.send_lock:
+                    self.client_socket.sendall(encode_frame(PING))
+            except OSError:
+                break  # Closed; the next receive_data or send_data reports it
+
     def receive_data(self):
+        """Return the next framed message from the server, reading from the socket only when none are pending.
+
+        Heartbeats are handled here: pings are answered and pongs dropped, so callers only see real replies.
+        """
         try:
-            return self.client_socket.recv(1024).decode(FORMAT, errors='ignore')
+            with self.receive_lock:
+                while True:
+                    while not self.pending_messages:
+                        messages = self.frame_reader.read_messages()
+                        if messages is None:
+                            return ""  # The server closed the connection
+                        self.pending_messages.extend(messages)
+                    message = self.pending_messages.popleft()
+                    if message == PING:
+                        with self.send_lock:
+                            self.client_socket.sendall(encode_frame(PONG))
+                    elif message != PONG:
+                        return message
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to receive data from server: {e}")
@@ -377,16 +417,17 @@ class TicTacToeClient:
     def make_move(self, row, col):
         move = f"{row},{col}"
         # Send the move to the server
+        # Replies are picked up by the listener thread started in show_game_window
         self.send_data(f"make_move {self.game_id} {self.username} {move}")
-        threading.Thread(target=self.listen_for_server_messages, daemon=True).start()
 
 
     def listen_for_server_messages(self):
         while True:
             try:
                 message = self.receive_data()
-                if message:
-                    self.process_server_message(message)
+                if not message:
+                    break  # Connection closed
+                self.process_server_message(message)
             except Exception as e:
                 print(f"Error receiving server message: {e}")
                 break
@@ -398,8 +439,12 @@ class TicTacToeClient:
             data = json.loads(message)
 
             # Process the JSON data
-            if 'game_board' in data:  # Handle game board update
+            if 'delta' in data:  # A single move
+                self.apply_board_delta(data['delta'])
+            elif 'game_board' in data:  # Full board snapshot
                 game_board = data['game_board']
+                self.board_seq = data.get('seq', self.board_seq)
+                self.awaiting_snapshot = False
                 # Run on main thread
                 self.game_window.after(0, lambda: self.update_game_board_ui(game_board))
             # Add more conditions as necessary, e.g., handling turn notifications, game results, etc.
@@ -410,6 +455,28 @@ class TicTacToeClient:
             # Show the message in a message box on the main thread
             self.game_window.after(0, lambda: messagebox.showinfo("Server Message", message))
 
+    def apply_board_delta(self, delta):
+        """Apply a move on top of our board, or ask for a full snapshot if we missed one."""
+        seq = delta['seq']
+        if seq <= self.board_seq:
+            return  # Already part of the board we have
+        if seq != self.board_seq + 1:
+            if not self.awaiting_snapshot:
+                self.awaiting_snapshot = True
+                self.send_data(f"get_board {self.game_id}")
+            return
+        if self.awaiting_snapshot:
+            return  # The snapshot on its way already includes this move
+        self.board_seq = seq
+        self.game_window.after(0, lambda: self.update_board_cell_ui(delta))
+
+    def update_board_cell_ui(self, delta):
+        button = self.board_buttons[delta['row']][delta['col']]
+        button.config(text=delta['mark'])
+        button['state'] = 'disabled'
+        if delta['next_player']:
+            self.turn_label.config(text=f"Current Turn: {delta['next_player']}")
+
     def update_game_board_ui(self, game_board):
         def task():
             for i, row in enumerate(game_board):
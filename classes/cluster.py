@@ -0,0 +1,204 @@
+import json
+import os
+import signal
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import deque
+
+from classes.protocol import FrameDecoder, encode_frame
+
+WORKER_PREFIXES = string.ascii_uppercase + string.digits  # A game ID starts with its worker's prefix
+MAX_WORKERS = len(WORKER_PREFIXES)
+LOBBY_SYNC_INTERVAL = 1  # Seconds between each worker's broadcasts of its open games to the others
+LINK_MAX_FRAME_SIZE = 64 * 1024 * 1024  # A lobby digest lists every open game of a worker
+RESTART_DELAY = 1  # Seconds before a worker that exited is started again
+
+
+class ClusterNode:
+    """One worker's links to the other workers of a cluster, over Unix sockets in run_dir.
+
+    Workers share the listening port (SO_REUSEPORT), so a client lands on any of them, and each owns the
+    games whose ID starts with its prefix. A command about another worker's game moves the client's
+    connection there: hand_off() sends the socket itself (SCM_RIGHTS) with the commands read from it
+    but not handled yet, and the owner carries on serving it as if it had accepted it. From then on
+    every command, move and broadcast for that game stays within one process.
+
+    Each worker also sends the others a digest of its open games every LOBBY_SYNC_INTERVAL, so any of
+    them can list the whole cluster's lobby, along with the game results it recorded since the last one, so
+    every worker's leaderboard cache has them within about a second. Each worker writes its own results to
+    the database; the periodic reconcile with the database stays the backstop for results lost on the way.
+
+    Still per worker: a user's seat. The check that a user plays in one game at a time only sees the
+    worker's own games, so one user can hold seats in games on several workers at once.
+    """
+
+    def __init__(self, worker_id, workers, run_dir):
+        if not 0 <= worker_id < workers <= MAX_WORKERS:
+            raise ValueError(f"Worker {worker_id} of {workers}: at most {MAX_WORKERS} workers are supported")
+        self.worker_id = worker_id
+        self.workers = workers
+        self.run_dir = run_dir
+        self.prefix = WORKER_PREFIXES[worker_id]
+        self.links = {}  # worker_id -> connected socket to that worker
+        self.link_locks = {peer: threading.Lock() for peer in range(workers)}
+        self.on_connection = None  # on_connection(sock, messages, leftover) for connections handed to us
+        self.on_lobby = None  # on_lobby(worker_id, [[game_id, num_players, players], ...])
+        self.on_results = None  # on_results([[username, 'win' | 'loss' | 'tie'], ...]) from another worker's games
+        self.outgoing_results = []  # Our results not sent to the other workers yet
+        self.results_lock = threading.Lock()
+        self.handed_off = 0
+        self.adopted = 0
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def socket_path(self, worker_id):
+        return os.path.join(self.run_dir, f"worker-{worker_id}.sock")
+
+    def owner_of(self, game_id):
+        """The worker that owns a game; IDs without a worker prefix are treated as our own."""
+        index = WORKER_PREFIXES.find(game_id[:1]) if game_id else -1
+        return index if 0 <= index < self.workers else self.worker_id
+
+    def is_local(self, game_id):
+        return self.owner_of(game_id) == self.worker_id
+
+    def start(self, lobby_digest):
+        """Listen for the other workers and start sending them lobby_digest() every LOBBY_SYNC_INTERVAL."""
+        path = self.socket_path(self.worker_id)
+        if os.path.exists(path):
+            os.remove(path)  # Left behind by a previous run of this worker
+        self.listener.bind(path)
+        self.listener.listen()
+        threading.Thread(target=self.accept_loop, name="cluster-accept", daemon=True).start()
+        threading.Thread(target=self.sync_lobby, args=(lobby_digest,), name="cluster-lobby", daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            link, _ = self.listener.accept()
+            threading.Thread(target=self.read_link, args=(link,), name="cluster-link", daemon=True).start()
+
+    def read_link(self, link):
+        """Handle everything one peer sends us. File descriptors arrive with (or before) the frame they belong to."""
+        decoder = FrameDecoder(LINK_MAX_FRAME_SIZE)
+        fds = deque()
+        try:
+            while True:
+                data, received_fds, _, _ = socket.recv_fds(link, 256 * 1024, 16)
+                fds.extend(received_fds)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    self.handle_link_message(json.loads(message), fds)
+        except Exception as e:
+            print(f"Error on a cluster link: {e}")
+        finally:
+            link.close()
+            for fd in fds:
+                os.close(fd)
+
+    def handle_link_message(self, message, fds):
+        if "lobby" in message:
+            if self.on_lobby is not None:
+                self.on_lobby(message["worker"], message["lobby"])
+            if message.get("results") and self.on_results is not None:
+                self.on_results(message["results"])
+            return
+        sock = socket.socket(fileno=fds.popleft())
+        self.adopted += 1
+        try:
+            self.on_connection(sock, message["messages"], message["leftover"].encode("latin-1"))
+        except Exception as e:
+            print(f"Error taking over a connection from worker {message['worker']}: {e}")
+            sock.close()
+
+    def send(self, worker_id, message, fds=()):
+        """Send a message to another worker, connecting on first use. Returns False if it couldn't be sent."""
+        frame = encode_frame(json.dumps(message))
+        with self.link_locks[worker_id]:
+            for attempt in range(2):  # Once more on a fresh link, in case the peer restarted since
+                link = self.links.get(worker_id)
+                try:
+                    if link is None:
+                        link = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        link.connect(self.socket_path(worker_id))
+                        self.links[worker_id] = link
+                    sent = socket.send_fds(link, [frame], list(fds)) if fds else 0
+                    link.sendall(frame[sent:])
+                    return True
+                except OSError as e:
+                    if link is not None:
+                        link.close()
+                    self.links.pop(worker_id, None)
+                    if attempt:
+                        print(f"Error sending to worker {worker_id}: {e}")
+        return False
+
+    def hand_off(self, worker_id, fd, messages, leftover):
+        """Give a client connection to the worker that owns its game. The caller closes its own copy of fd."""
+        sent = self.send(worker_id, {"worker": self.worker_id, "messages": list(messages),
+                                     "leftover": bytes(leftover).decode("latin-1")}, (fd,))
+        if sent:
+            self.handed_off += 1
+        return sent
+
+    def share_results(self, results):
+        """Queue (username, result) pairs of a game that ended here for the other workers' leaderboards."""
+        with self.results_lock:
+            self.outgoing_results.extend(results)
+
+    def sync_lobby(self, lobby_digest):
+        while True:
+            threading.Event().wait(LOBBY_SYNC_INTERVAL)
+            try:
+                message = {"worker": self.worker_id, "lobby": lobby_digest()}
+            except Exception as e:
+                print(f"Error building the lobby digest: {e}")
+                continue
+            with self.results_lock:
+                message["results"], self.outgoing_results = self.outgoing_results, []
+            for peer in range(self.workers):
+                if peer != self.worker_id:
+                    self.send(peer, message)
+
+
+def run_cluster(workers, worker_args):
+    """Run workers processes of `python -m classes.server <worker_args>` sharing the port, until told to stop.
+
+    worker_args are the server's own arguments, --workers included; each worker also gets its --worker-id
+    and the --run-dir where the workers find each other. A worker that exits is started again; SIGTERM or
+    Ctrl-C stops them all, letting each flush its queued writes.
+    """
+    if not 1 <= workers <= MAX_WORKERS:
+        raise ValueError(f"Between 1 and {MAX_WORKERS} workers are supported")
+    run_dir = tempfile.mkdtemp(prefix="tictactoe-cluster-")
+    stopping = threading.Event()
+
+    def start_worker(worker_id):
+        return subprocess.Popen([sys.executable, "-m", "classes.server", *worker_args, "--worker-id", str(worker_id),
+                                 "--run-dir", run_dir])
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    processes = {worker_id: start_worker(worker_id) for worker_id in range(workers)}
+    print(f"[CLUSTER] Started {workers} workers.")
+    try:
+        while not stopping.wait(RESTART_DELAY):
+            for worker_id, process in processes.items():
+                if process.poll() is not None:
+                    print(f"[CLUSTER] Worker {worker_id} exited with code {process.returncode}, restarting it.")
+                    processes[worker_id] = start_worker(worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in processes.values():
+            process.wait()
+        for worker_id in range(workers):
+            path = os.path.join(run_dir, f"worker-{worker_id}.sock")
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(run_dir)
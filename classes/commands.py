@@ -0,0 +1,54 @@
+from typing import Callable, NamedTuple, Tuple
+
+
+class Command(NamedTuple):
+    """A client message parsed once into its verb and arguments."""
+    verb: str
+    args: Tuple[str, ...]
+    raw: str
+
+
+class CommandEntry(NamedTuple):
+    handler: Callable
+    blocking: bool = False  # Waits on the database, so the asyncio engine runs it in a worker thread
+    closes_connection: bool = False
+    routed: bool = False  # Its first argument is a game ID; in a cluster it runs on the worker owning that game
+
+
+def parse_command(message):
+    parts = message.split()
+    if not parts:
+        return Command("", (), message)
+    return Command(parts[0], tuple(parts[1:]), message)
+
+
+class CommandDispatcher:
+    """Maps each protocol verb to its handler.
+
+    A handler is called as handler(conn, command) and returns the reply for the sender: None, a string,
+    or a tuple of strings. Handlers never need a real socket for their reply, so they can be called directly.
+    """
+
+    def __init__(self):
+        self.commands = {}
+
+    def register(self, verb, handler, blocking=False, closes_connection=False, routed=False):
+        self.commands[verb] = CommandEntry(handler, blocking, closes_connection, routed)
+
+    def is_blocking(self, command):
+        entry = self.commands.get(command.verb)
+        return entry is not None and entry.blocking
+
+    def game_of(self, command):
+        """The game ID a routed command is about, or None."""
+        entry = self.commands.get(command.verb)
+        if entry is None or not entry.routed or not command.args:
+            return None
+        return command.args[0]
+
+    def dispatch(self, conn, command):
+        """Run the handler for a command. Returns (reply, keep_connection_open)."""
+        entry = self.commands.get(command.verb)
+        if entry is None:
+            return None, True  # Unknown commands are ignored, like before
+        return entry.handler(conn, command), not entry.closes_connection
@@ -0,0 +1,223 @@
+import gc
+import json
+import os
+import threading
+
+from classes.game_registry import new_game_data
+from enums.game import Game
+
+SYNC_INTERVAL = 0.05  # Seconds between fsyncs of the journal; a crash loses at most this much of it
+SNAPSHOT_INTERVAL = 60  # Seconds between snapshots; recovery replays at most this much of the journal
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_PREFIX = "journal."
+JOURNAL_SUFFIX = ".log"
+
+
+def game_state(game_data):
+    """The compact form of a live game kept in snapshots. The caller holds the game's lock."""
+    return [game_data[Game.NUM_PLAYERS], list(game_data[Game.PLAYERS]), game_data[Game.CURRENT_PLAYER],
+            list(game_data[Game.MOVES]), game_data[Game.CREATED_AT], game_data[Game.JOURNAL_SEQ]]
+
+
+def restore_game(game_id, state, players_chars):
+    """Game data from game_state(), with the board rebuilt from the moves. Nobody is connected to it yet."""
+    num_players, players, current_player, moves, created_at, journal_seq = state
+    game_data = new_game_data(game_id, num_players, players[0], None, created_at)
+    game_data[Game.PLAYERS][:] = players
+    game_data[Game.CURRENT_PLAYER] = current_player
+    game_data[Game.JOURNAL_SEQ] = journal_seq
+    for row, col, mark in moves:
+        game_data[Game.BOARD].place(row, col, players_chars.index(mark))
+    game_data[Game.MOVES] = moves
+    game_data[Game.SEQUENCE] = len(moves)
+    return game_data
+
+
+def apply_event(games, event, players_chars):
+    """Replay one journal event onto {game_id: game_data}, the way the server applied it.
+
+    Events a snapshot already holds (journal_seq not above the game's) are skipped. A game that was won,
+    tied, forfeited or emptied is dropped: there is nothing left to resume.
+    """
+    kind, game_id, journal_seq = event[:3]
+    if kind == "create":
+        num_players, creator, created_at = event[3:]
+        games[game_id] = new_game_data(game_id, num_players, creator, None, created_at)
+        games[game_id][Game.JOURNAL_SEQ] = journal_seq
+        return
+    game_data = games.get(game_id)
+    if game_data is None or journal_seq <= game_data[Game.JOURNAL_SEQ]:
+        return
+    game_data[Game.JOURNAL_SEQ] = journal_seq
+    if kind == "join":
+        game_data[Game.PLAYERS].append(event[3])
+    elif kind == "leave":
+        if event[3] in game_data[Game.PLAYERS]:
+            game_data[Game.PLAYERS].remove(event[3])
+        if not game_data[Game.PLAYERS]:
+            del games[game_id]
+    elif kind == "skip":
+        game_data[Game.CURRENT_PLAYER] = (game_data[Game.CURRENT_PLAYER] + 1) % game_data[Game.NUM_PLAYERS]
+    elif kind == "forfeit":
+        del games[game_id]
+    elif kind == "move":
+        row, col = event[3:]
+        player = game_data[Game.CURRENT_PLAYER]
+        board = game_data[Game.BOARD]
+        board.place(row, col, player)
+        game_data[Game.SEQUENCE] += 1
+        game_data[Game.MOVES].append([row, col, players_chars[player]])
+        if board.is_winning_move(row, col, player) or board.is_full():
+            del games[game_id]
+        else:
+            game_data[Game.CURRENT_PLAYER] = (player + 1) % game_data[Game.NUM_PLAYERS]
+
+
+class GameJournal:
+    """Append-only journal of live-game events, with snapshots, for rebuilding the live games after a restart.
+
+    Events (create, join, move, skip, forfeit, leave) are JSON lines tagged with the game's journal sequence number.
+    append() only buffers the line; a background thread writes the buffer out and fsyncs it every
+    sync_interval, so one fsync covers every event of that interval and no game waits on the disk.
+
+    snapshot() moves on to a new journal file, saves every live game to snapshot.json and deletes the
+    older journal files, so recovery reads one snapshot and the events since it however long the server
+    has been running. Games are saved one at a time while play goes on; replay skips the events a saved
+    game already includes.
+    """
+
+    def __init__(self, directory, sync_interval=SYNC_INTERVAL, fsync=True):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()  # Guards the buffer and the current file
+        self.io_lock = threading.Lock()  # One writer of journal files at a time
+        self.buffer = []
+        self.file = None
+        self.generation = 0
+        self.closed = False
+        self.appended = 0
+        self.syncs = 0
+        self.wakeup = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_loop, name="game-journal", daemon=True)
+
+    def journal_path(self, generation):
+        return os.path.join(self.directory, f"{JOURNAL_PREFIX}{generation:08d}{JOURNAL_SUFFIX}")
+
+    def generations(self):
+        return sorted(int(name[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX))
+
+    def recover(self, players_chars):
+        """Rebuild the live games from the last snapshot and the journal after it. Returns {game_id: game_data}.
+
+        Call once at startup, before any append(); the journal then continues in a new file.
+        """
+        games = {}
+        first_generation = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        generations = self.generations()
+        # Millions of small objects that all stay alive: collections would only rescan them, over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if os.path.exists(snapshot_path):
+                with open(snapshot_path) as snapshot:
+                    saved = json.load(snapshot)
+                first_generation = saved["generation"]
+                for game_id, state in saved["games"].items():
+                    games[game_id] = restore_game(game_id, state, players_chars)
+            for generation in generations:
+                if generation >= first_generation:
+                    self.replay(self.journal_path(generation), games, players_chars)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.generation = max(generations + [first_generation]) + 1
+        self.file = open(self.journal_path(self.generation), "ab")
+        self.flusher.start()
+        return games
+
+    @staticmethod
+    def replay(path, games, players_chars):
+        with open(path, "rb") as journal:
+            for line in journal:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break  # Torn by the crash; nothing after it was synced
+                apply_event(games, event, players_chars)
+
+    def append(self, *event):
+        """Queue an event: (kind, game_id, journal_seq, *args). The caller holds the game's lock."""
+        line = json.dumps(event, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+        with self.lock:
+            self.buffer.append(line)
+            self.appended += 1
+
+    def flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.sync_interval)
+            self.sync()
+
+    def sync(self, next_generation=None):
+        """Write out and fsync the buffered events. With next_generation, later events go to that new file."""
+        with self.io_lock:
+            with self.lock:
+                lines = self.buffer
+                self.buffer = []
+                journal = self.file
+                if next_generation is not None:
+                    self.generation = next_generation
+                    self.file = open(self.journal_path(next_generation), "ab")
+            if journal is None:
+                return
+            if lines:
+                journal.write(b"".join(lines))
+                journal.flush()
+                if self.fsync:
+                    os.fsync(journal.fileno())
+                self.syncs += 1
+            if next_generation is not None:
+                journal.close()
+
+    def snapshot(self, capture):
+        """Save the live games and drop the journal files the snapshot replaces. Returns how many games were saved.
+
+        capture() returns {game_id: game_state(game_data)}; it runs after the switch to a new journal file,
+        so every change it misses is in that file.
+        """
+        generation = self.generation + 1
+        self.sync(next_generation=generation)
+        games = capture()
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        with open(snapshot_path + ".tmp", "w") as snapshot:
+            json.dump({"generation": generation, "games": games}, snapshot, separators=(",", ":"),
+                      ensure_ascii=False)
+            snapshot.flush()
+            if self.fsync:
+                os.fsync(snapshot.fileno())
+        os.replace(snapshot_path + ".tmp", snapshot_path)  # The old snapshot stays valid until this point
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            # Make the rename durable before the journal files it replaces are deleted
+            directory = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        for old_generation in self.generations():
+            if old_generation < generation:
+                os.remove(self.journal_path(old_generation))
+        return len(games)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        if self.flusher.is_alive():
+            self.flusher.join()
+        self.sync()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
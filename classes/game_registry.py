@@ -0,0 +1,175 @@
+import threading
+from contextlib import contextmanager
+
+from classes.bitboard import Bitboard
+from enums.game import Game
+
+NUM_SHARDS = 64
+
+
+def new_game_data(game_id, num_players, creator, conn, created_at):
+    """A game as the registry holds it, with the creator in the first seat. conn is None for a restored game,
+    until its players connect again."""
+    return {
+        Game.GAME_ID: game_id,
+        Game.NUM_PLAYERS: num_players,
+        Game.PLAYERS: [creator],
+        Game.BOARD: Bitboard(num_players + 1, num_players),
+        Game.CURRENT_PLAYER: 0,
+        Game.FINISHED: False,
+        Game.SEQUENCE: 0,
+        Game.MOVES: [],  # [row, col, mark] in play order, written to the games table at the end
+        Game.CREATED_AT: created_at,
+        Game.JOURNAL_SEQ: 0,  # Events journaled for this game, see classes/game_journal.py
+        Game.RELAY_SEQ: 0,  # Broadcasts published to relay nodes, see classes/pubsub.py
+        Game.SPECTATORS: [],
+        Game.PLAYERS_AND_SPECTATORS_CONNECTIONS: [] if conn is None else [conn],
+    }
+
+
+class GameRegistry:
+    """Thread-safe map of game_id -> game data, with lock striping.
+
+    Games are spread over shards; a shard's lock only guards adding, removing and listing its games.
+    Changing a game's state is done under that game's own lock (see locked()), so moves in different
+    games never wait on each other. The game lock is re-entrant, so broadcasts can run inside a move.
+    """
+
+    def __init__(self, num_shards=NUM_SHARDS):
+        self.num_shards = num_shards
+        self.shards = [{} for _ in range(num_shards)]
+        self.shard_game_locks = [{} for _ in range(num_shards)]
+        self.shard_locks = [threading.Lock() for _ in range(num_shards)]
+        # Reverse indexes, so finding a user's or a connection's games never walks every game
+        self.index_lock = threading.Lock()
+        self.user_games = {}  # username -> game_id the user is playing in
+        self.user_connections = {}  # username -> the connection their seat is played from
+        self.connection_games = {}  # connection -> {game_id: username, or None for a spectator}
+
+    def shard_index(self, game_id):
+        return hash(game_id) % self.num_shards
+
+    def add_if_absent(self, game_id, game_data):
+        """Add a new game. Returns False, without replacing anything, if the game ID is already taken."""
+        index = self.shard_index(game_id)
+        with self.shard_locks[index]:
+            if game_id in self.shards[index]:
+                return False
+            self.shards[index][game_id] = game_data
+            self.shard_game_locks[index][game_id] = threading.RLock()
+            return True
+
+    def remove(self, game_id):
+        index = self.shard_index(game_id)
+        with self.shard_locks[index]:
+            self.shard_game_locks[index].pop(game_id, None)
+            return self.shards[index].pop(game_id, None)
+
+    @contextmanager
+    def locked(self, game_id):
+        """Hold the game's own lock. Yields the game data, or None if there is no such game (any more)."""
+        index = self.shard_index(game_id)
+        with self.shard_locks[index]:
+            game_lock = self.shard_game_locks[index].get(game_id)
+        if game_lock is None:
+            yield None
+            return
+        with game_lock:
+            # Re-check under the lock: the game may have been removed (and its ID reused) while we waited
+            if self.shard_game_locks[index].get(game_id) is not game_lock:
+                yield None
+            else:
+                yield self.shards[index].get(game_id)
+
+    def get(self, game_id, default=None):
+        return self.shards[self.shard_index(game_id)].get(game_id, default)
+
+    def __getitem__(self, game_id):
+        return self.shards[self.shard_index(game_id)][game_id]
+
+    def __contains__(self, game_id):
+        return game_id in self.shards[self.shard_index(game_id)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def items(self):
+        """Snapshot of (game_id, game_data) pairs, safe to iterate while other threads add and remove games."""
+        items = []
+        for index, shard in enumerate(self.shards):
+            with self.shard_locks[index]:
+                items.extend(shard.items())
+        return items
+
+    def keys(self):
+        return [game_id for game_id, _ in self.items()]
+
+    def bind_player(self, username, game_id, conn):
+        """Record that a user plays in a game over a connection. Returns False if they already play in another game.
+
+        conn may be None for a restored game whose players haven't connected again yet. Binding a seat to a new
+        connection takes it off the old one, so closing the old connection no longer releases it.
+        """
+        with self.index_lock:
+            current_game_id = self.user_games.get(username)
+            if current_game_id is not None and current_game_id != game_id:
+                return False
+            self.user_games[username] = game_id
+            if conn is not None:
+                previous = self.user_connections.get(username)
+                if previous is not None and previous is not conn:
+                    previous_games = self.connection_games.get(previous, {})
+                    if previous_games.get(game_id) == username:
+                        del previous_games[game_id]
+                self.user_connections[username] = conn
+                self.connection_games.setdefault(conn, {})[game_id] = username
+            return True
+
+    def seat_connection(self, username):
+        """The connection a user's seat is played from, or None."""
+        return self.user_connections.get(username)
+
+    def bind_spectator(self, conn, game_id):
+        with self.index_lock:
+            self.connection_games.setdefault(conn, {}).setdefault(game_id, None)
+
+    def unbind_player(self, username, game_id):
+        with self.index_lock:
+            if self.user_games.get(username) == game_id:
+                del self.user_games[username]
+                self.user_connections.pop(username, None)
+
+    def game_of_user(self, username):
+        return self.user_games.get(username)
+
+    def games_of_connection(self, conn):
+        """IDs of the games a connection plays in or watches."""
+        with self.index_lock:
+            return list(self.connection_games.get(conn, ()))
+
+    def drop_connection(self, conn):
+        """Forget a closed connection. Returns its {game_id: username or None} so its seats can be released."""
+        with self.index_lock:
+            games = self.connection_games.pop(conn, {})
+            for username in games.values():
+                if username is not None and self.user_connections.get(username) is conn:
+                    del self.user_connections[username]
+            return games
+
+    def check_consistency(self):
+        """Compare the user index with the games themselves. Returns a list of problems, empty when they agree."""
+        problems = []
+        games = dict(self.items())
+        with self.index_lock:
+            user_games = dict(self.user_games)
+        for username, game_id in user_games.items():
+            game_data = games.get(game_id)
+            if game_data is None:
+                problems.append(f"{username} is indexed in missing game {game_id}")
+            elif username not in game_data[Game.PLAYERS]:
+                problems.append(f"{username} is indexed in game {game_id} but not one of its players")
+        for game_id, game_data in games.items():
+            for username in game_data[Game.PLAYERS]:
+                if user_games.get(username) != game_id:
+                    problems.append(f"{username} plays in game {game_id} but is indexed in {user_games.get(username)}")
+        return problems
@@ -0,0 +1,124 @@
+import threading
+from bisect import bisect_left, insort
+
+RESULT_INDEXES = {'win': 0, 'loss': 1, 'tie': 2}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def rank_key(username, wins, losses, draws):
+    """Sort key matching the database's ORDER BY wins DESC, draws DESC, losses (ties broken by name)."""
+    return -wins, -draws, losses, username
+
+
+class LeaderboardCache:
+    """The leaderboard, ranked, in memory.
+
+    A sorted list of rank keys is kept next to each player's counts. A result moves one key: a bisect to
+    find it and an insort to put it back, so there is no table scan and no re-sort. Top-K and rank
+    lookups are bisects and slices.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.stats = {}  # username -> [wins, losses, draws]
+        self.ranking = []  # sorted rank keys
+        self.loaded = False  # False until the first load or reconcile has filled it from the database
+
+    def load(self, rows):
+        """Replace the contents with (username, wins, losses, draws) rows."""
+        with self.lock:
+            self.stats = {username: [wins, losses, draws] for username, wins, losses, draws in rows}
+            self.ranking = sorted(rank_key(username, *counts) for username, counts in self.stats.items())
+            self.loaded = True
+
+    def __len__(self):
+        return len(self.stats)
+
+    def set_counts(self, username, counts):
+        old_counts = self.stats.get(username)
+        if old_counts is not None:
+            index = bisect_left(self.ranking, rank_key(username, *old_counts))
+            del self.ranking[index]
+        self.stats[username] = counts
+        insort(self.ranking, rank_key(username, *counts))
+
+    def record_many(self, results):
+        """Apply (username, 'win' | 'loss' | 'tie') results."""
+        with self.lock:
+            for username, result in results:
+                index = RESULT_INDEXES.get(result)
+                if index is None:
+                    continue
+                counts = list(self.stats.get(username, (0, 0, 0)))
+                counts[index] += 1
+                self.set_counts(username, counts)
+
+    def entry(self, position):
+        _, _, _, username = self.ranking[position]
+        wins, losses, draws = self.stats[username]
+        return {"rank": position + 1, "username": username, "wins": wins, "losses": losses, "draws": draws}
+
+    def top(self, limit, offset=0):
+        """Players ranked offset+1 to offset+limit."""
+        with self.lock:
+            return [self.entry(position) for position in range(offset, min(offset + limit, len(self.ranking)))]
+
+    def page(self, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        """Players ranked after the cursor (the rank of the last player on the previous page).
+
+        Returns (entries, next_cursor); next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        cursor = max(0, cursor)
+        with self.lock:
+            entries = self.top(limit, cursor)
+            has_more = cursor + limit < len(self.ranking)
+        return entries, cursor + limit if has_more else None
+
+    def rank(self, username):
+        """1-based rank of a player, or None if they have no results."""
+        with self.lock:
+            counts = self.stats.get(username)
+            if counts is None:
+                return None
+            return bisect_left(self.ranking, rank_key(username, *counts)) + 1
+
+    def around(self, username, radius):
+        """The player's entry with up to radius players ranked above and below them."""
+        with self.lock:
+            rank = self.rank(username)
+            if rank is None:
+                return []
+            radius = max(0, min(radius, MAX_PAGE_SIZE // 2))
+            start = max(0, rank - 1 - radius)
+            return self.top(rank + radius - start, start)
+
+    def reconcile(self, rows, pending=()):
+        """Compare with database rows plus results not written yet, and fix any player that differs.
+
+        rows may be streamed: they are read before the lock is taken. pending may be a function, called under
+        the lock so it matches what the cache holds. An unloaded cache is filled in one go instead.
+        Returns the usernames that were fixed.
+        """
+        expected = {username: [wins, losses, draws] for username, wins, losses, draws in rows}
+        fixed = []
+        with self.lock:
+            for username, result in (pending() if callable(pending) else pending):
+                index = RESULT_INDEXES.get(result)
+                if index is not None:
+                    expected.setdefault(username, [0, 0, 0])[index] += 1
+            if not self.loaded:
+                self.stats = expected
+                self.ranking = sorted(rank_key(username, *counts) for username, counts in expected.items())
+                self.loaded = True
+                return fixed
+            for username in list(self.stats):
+                if username not in expected:
+                    del self.ranking[bisect_left(self.ranking, rank_key(username, *self.stats.pop(username)))]
+                    fixed.append(username)
+            for username, counts in expected.items():
+                if self.stats.get(username) != counts:
+                    self.set_counts(username, counts)
+                    fixed.append(username)
+        return fixed
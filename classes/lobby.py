@@ -0,0 +1,75 @@
+import threading
+from bisect import bisect_right
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class OpenSeatIndex:
+    """Index of the games that still have a free seat, in the order they opened.
+
+    Every open game gets an increasing position; the lobby cursor is the position of the last game on the
+    previous page. A page is a bisect plus a slice, so its cost doesn't grow with the number of live games.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_position = 1
+        self.positions = {}  # game_id -> position
+        self.entries = {}  # position -> (game_id, num_players)
+        self.all_positions = []  # sorted positions of every open game
+        self.positions_by_players = {}  # num_players -> sorted positions of open games of that size
+
+    def add(self, game_id, num_players):
+        """Mark a game as having a free seat. Does nothing if it is already listed."""
+        with self.lock:
+            if game_id in self.positions:
+                return
+            position = self.next_position
+            self.next_position += 1
+            self.positions[game_id] = position
+            self.entries[position] = (game_id, num_players)
+            # Positions only grow, so these appends keep the lists sorted
+            self.all_positions.append(position)
+            self.positions_by_players.setdefault(num_players, []).append(position)
+
+    def discard(self, game_id):
+        """Take a game out of the lobby (full, finished or removed)."""
+        with self.lock:
+            position = self.positions.pop(game_id, None)
+            if position is None:
+                return
+            _, num_players = self.entries.pop(position)
+            self.remove_position(self.all_positions, position)
+            self.remove_position(self.positions_by_players[num_players], position)
+
+    @staticmethod
+    def remove_position(positions, position):
+        index = bisect_right(positions, position) - 1
+        if index >= 0 and positions[index] == position:
+            del positions[index]
+
+    def __contains__(self, game_id):
+        return game_id in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def game_ids(self):
+        with self.lock:
+            return [self.entries[position][0] for position in self.all_positions]
+
+    def page(self, num_players=None, cursor=0, limit=DEFAULT_PAGE_SIZE):
+        """Open games after the cursor, optionally only those for num_players.
+
+        Returns ([(game_id, num_players), ...], next_cursor); next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self.lock:
+            positions = self.all_positions if not num_players else self.positions_by_players.get(num_players, [])
+            start = bisect_right(positions, cursor)
+            page_positions = positions[start:start + limit]
+            entries = [self.entries[position] for position in page_positions]
+            has_more = start + limit < len(positions)
+        next_cursor = page_positions[-1] if has_more else None
+        return entries, next_cursor
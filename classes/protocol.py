@@ -0,0 +1,158 @@
+import struct
+import threading
+
+FORMAT = "utf-8"
+# Every message on the wire is a 4 byte big-endian payload length followed by the UTF-8 payload
+HEADER = struct.Struct("!I")
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 1024 * 1024
+RECV_BUFFER_SIZE = 64 * 1024
+# Below this payload size, joining header and payload once is cheaper than a scatter-gather send per recipient
+SCATTER_GATHER_MIN_SIZE = 16 * 1024
+# Heartbeat control messages. Either side may send PING and the other answers PONG; neither is ever a reply
+# to a command, so readers drop them before looking for one
+PING = "ping"
+PONG = "pong"
+HEARTBEAT_INTERVAL = 15  # Seconds a peer may stay quiet before it is pinged (or pings, on the client)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(message):
+    """Build a single frame (header + payload) from a str or bytes message."""
+    payload = message.encode(FORMAT) if isinstance(message, str) else message
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_frames(*messages):
+    """Build several frames in one buffer so they can go out in a single send."""
+    return b"".join(encode_frame(message) for message in messages)
+
+
+class FrameCounters:
+    """Process-wide counts of how outgoing frames are built and sent.
+
+    encoded counts broadcast payloads encoded, sent counts the recipients they were handed to and copied
+    counts frames joined into a new buffer on their way to a socket. A broadcast to N clients should add 1,
+    N and 0.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encoded = 0
+        self.encoded_bytes = 0
+        self.sent = 0
+        self.copied = 0
+
+    def add(self, encoded=0, encoded_bytes=0, sent=0, copied=0):
+        with self.lock:
+            self.encoded += encoded
+            self.encoded_bytes += encoded_bytes
+            self.sent += sent
+            self.copied += copied
+
+    def snapshot(self):
+        with self.lock:
+            return {"encoded": self.encoded, "encoded_bytes": self.encoded_bytes,
+                    "sent": self.sent, "copied": self.copied}
+
+
+frame_counters = FrameCounters()
+
+
+class SharedFrame:
+    """An immutable frame for a broadcast, encoded once and sent as is to every recipient.
+
+    Large payloads stay apart from their header and go out with sendmsg; small ones are joined to the
+    header once, here, since a single sendall beats building the iovec for every recipient.
+    """
+
+    __slots__ = ("header", "payload", "parts")
+
+    def __init__(self, message):
+        self.payload = message.encode(FORMAT) if isinstance(message, str) else message
+        self.header = HEADER.pack(len(self.payload))
+        if len(self.payload) < SCATTER_GATHER_MIN_SIZE:
+            self.parts = (self.header + self.payload,)
+        else:
+            self.parts = (self.header, self.payload)
+        frame_counters.add(encoded=1, encoded_bytes=len(self.payload))
+
+    def __len__(self):
+        return HEADER_SIZE + len(self.payload)
+
+
+def send_frame(sock, data):
+    """sendall() for a frame that may be a SharedFrame, sent with scatter-gather I/O instead of being joined."""
+    if not isinstance(data, SharedFrame):
+        sock.sendall(data)
+        return
+    if len(data.parts) == 1:
+        sock.sendall(data.parts[0])
+        return
+    if not hasattr(sock, "sendmsg"):  # Windows has no sendmsg
+        frame_counters.add(copied=1)
+        sock.sendall(data.header + data.payload)
+        return
+    views = [memoryview(part) for part in data.parts]
+    while views:
+        sent = sock.sendmsg(views)
+        # Drop what went out; a partial send leaves a slice of the current buffer, still without copying
+        while views and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent:
+            views[0] = views[0][sent:]
+
+
+class FrameDecoder:
+    """Streaming decoder: feed it raw bytes as they arrive and get back every complete message."""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        if self.buffer:
+            self.buffer += data
+            data = self.buffer
+
+        messages = []
+        offset = 0
+        total = len(data)
+        with memoryview(data) as view:
+            while total - offset >= HEADER_SIZE:
+                (length,) = HEADER.unpack_from(view, offset)
+                if length > self.max_frame_size:
+                    raise ProtocolError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+                end = offset + HEADER_SIZE + length
+                if end > total:
+                    break
+                # Decode straight from the receive buffer, no intermediate bytes object
+                messages.append(str(view[offset + HEADER_SIZE:end], FORMAT, 'ignore'))
+                offset = end
+
+        if data is self.buffer:
+            del self.buffer[:offset]
+        elif offset < total:
+            # Keep only the incomplete tail for the next read
+            self.buffer += data[offset:]
+        return messages
+
+
+class FrameReader:
+    """Reads framed messages from a blocking socket into one reusable receive buffer."""
+
+    def __init__(self, sock, buffer_size=RECV_BUFFER_SIZE):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+        self.recv_buffer = bytearray(buffer_size)
+        self.recv_view = memoryview(self.recv_buffer)
+
+    def read_messages(self):
+        """Block until at least one read completes. Returns the decoded messages, or None once the peer closed."""
+        received = self.sock.recv_into(self.recv_buffer)
+        if not received:
+            return None
+        return self.decoder.feed(self.recv_view[:received])
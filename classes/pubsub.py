@@ -0,0 +1,272 @@
+import json
+import socket
+import threading
+
+from classes.protocol import FrameReader, SharedFrame, encode_frame
+from classes.send_queue import QueuedConnection
+
+TRANSPORTS = ("local", "tcp")
+LINK_HIGH_WATER_MARK = 4 * 1024 * 1024  # Bytes a relay may fall behind on before its topics are resynced
+RECONNECT_DELAY = 1  # Seconds between a subscriber's attempts to reach a publisher that went away
+
+# A transport carries every game's broadcasts, one topic per game, from the server that owns the games
+# (the publisher side) to relay nodes (the subscriber side):
+#
+#   publisher:  start(snapshot), publish(topic, seq, message), close()
+#   subscriber: subscribe(topic, callback), resync(topic, callback), unsubscribe(topic, callback), close()
+#
+# snapshot(topic) returns (seq, state) for a topic's current state, state being None once the game is gone.
+# Subscribers get callback(topic, seq, message, is_snapshot): a snapshot right after subscribe() and each
+# resync(), then every message published with a higher seq. The seqs of a topic's messages have no holes,
+# so a subscriber that sees one knows it missed something and asks for a resync.
+
+
+class LocalPubSub:
+    """Both sides of the transport in one process: publish() calls the subscribers' callbacks directly."""
+
+    name = "local"
+
+    def __init__(self):
+        self.snapshot = None
+        self.topics = {}  # topic -> [callback, ...]
+        self.lock = threading.Lock()
+
+    def start(self, snapshot):
+        self.snapshot = snapshot
+
+    def publish(self, topic, seq, message):
+        callbacks = self.topics.get(topic)
+        if not callbacks:
+            return
+        for callback in tuple(callbacks):
+            try:
+                callback(topic, seq, message, False)
+            except Exception as e:
+                print(f"Error delivering an update for {topic}: {e}")
+
+    def subscribe(self, topic, callback):
+        with self.lock:
+            self.topics.setdefault(topic, []).append(callback)
+        self.resync(topic, callback)
+
+    def resync(self, topic, callback):
+        seq, state = self.snapshot(topic)
+        callback(topic, seq, state, True)
+
+    def unsubscribe(self, topic, callback):
+        with self.lock:
+            callbacks = self.topics.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.topics.pop(topic, None)
+
+    def close(self):
+        self.topics.clear()
+
+
+class TcpPublisher:
+    """Publisher side over TCP: relay nodes connect to host:port and subscribe to the topics they want.
+
+    Each relay's link has a send queue like a client's (see QueuedConnection). A relay that falls more than
+    high_water_mark bytes behind has its backlog dropped and gets fresh snapshots of its topics instead.
+    """
+
+    name = "tcp"
+
+    def __init__(self, host, port, high_water_mark=LINK_HIGH_WATER_MARK):
+        self.address = (host, port)
+        self.high_water_mark = high_water_mark
+        self.snapshot = None
+        self.topics = {}  # topic -> {link, ...}
+        self.link_topics = {}  # link -> {topic, ...}
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    def start(self, snapshot):
+        self.snapshot = snapshot
+        self.listener.bind(self.address)
+        self.listener.listen()
+        threading.Thread(target=self.accept_loop, name="relay-publisher", daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return  # Closed
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            link = QueuedConnection(sock, self.high_water_mark, "resync", self.resync_link)
+            threading.Thread(target=self.serve_link, args=(link,), name="relay-link", daemon=True).start()
+
+    def serve_link(self, link):
+        reader = FrameReader(link.sock)
+        with self.lock:
+            self.link_topics[link] = set()
+        try:
+            while True:
+                messages = reader.read_messages()
+                if messages is None:
+                    break
+                for message in messages:
+                    request = json.loads(message)
+                    if request["op"] == "subscribe":
+                        self.add_subscriber(request["topic"], link)
+                        link.sendall(self.snapshot_frame(request["topic"]))
+                    elif request["op"] == "unsubscribe":
+                        self.remove_subscriber(request["topic"], link)
+                    elif request["op"] == "resync":
+                        link.sendall(self.snapshot_frame(request["topic"]))
+        except Exception as e:
+            print(f"Error on a relay link: {e}")
+        finally:
+            with self.lock:
+                for topic in self.link_topics.pop(link, ()):
+                    self.topics[topic].discard(link)
+                    if not self.topics[topic]:
+                        del self.topics[topic]
+            link.close()
+
+    def add_subscriber(self, topic, link):
+        with self.lock:
+            self.topics.setdefault(topic, set()).add(link)
+            self.link_topics[link].add(topic)
+
+    def remove_subscriber(self, topic, link):
+        with self.lock:
+            self.link_topics[link].discard(topic)
+            links = self.topics.get(topic)
+            if links is not None:
+                links.discard(link)
+                if not links:
+                    del self.topics[topic]
+
+    def snapshot_frame(self, topic):
+        seq, state = self.snapshot(topic)
+        return encode_frame(json.dumps({"topic": topic, "seq": seq, "message": state, "snapshot": True}))
+
+    def resync_link(self, link):
+        """Snapshots of every topic of a relay whose backlog was dropped; it skips the updates it already has."""
+        with self.lock:
+            topics = tuple(self.link_topics.get(link, ()))
+        return [self.snapshot_frame(topic) for topic in topics]
+
+    def publish(self, topic, seq, message):
+        with self.lock:
+            links = self.topics.get(topic)
+            if not links:
+                return
+            links = tuple(links)
+        # Encoded once for every relay following the topic
+        frame = SharedFrame(json.dumps({"topic": topic, "seq": seq, "message": message}))
+        for link in links:
+            try:
+                link.sendall(frame)
+            except Exception:
+                pass  # Closing; serve_link drops its subscriptions
+
+    def close(self):
+        self.listener.close()
+
+
+class TcpSubscriber:
+    """Subscriber side over TCP, for a relay node: one connection to a TcpPublisher, re-established (and
+    every topic subscribed again, with fresh snapshots) whenever the publisher goes away."""
+
+    name = "tcp"
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.topics = {}  # topic -> [callback, ...]
+        self.lock = threading.Lock()  # Also keeps requests in the order they were made
+        self.sock = None
+        self.closed = False
+        self.connected = threading.Event()
+        threading.Thread(target=self.read_loop, name="relay-subscriber", daemon=True).start()
+
+    def request(self, op, topic):
+        """Send a request to the publisher; called with the lock held. Dropped while disconnected, since
+        connecting again subscribes every topic anew."""
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendall(encode_frame(json.dumps({"op": op, "topic": topic})))
+        except OSError:
+            pass  # read_loop sees the connection drop and reconnects
+
+    def subscribe(self, topic, callback):
+        with self.lock:
+            self.topics.setdefault(topic, []).append(callback)
+            self.request("subscribe", topic)
+
+    def resync(self, topic, callback):
+        with self.lock:
+            self.request("resync", topic)
+
+    def unsubscribe(self, topic, callback):
+        with self.lock:
+            callbacks = self.topics.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.topics.pop(topic, None)
+                self.request("unsubscribe", topic)
+
+    def connect(self):
+        while not self.closed:
+            try:
+                sock = socket.create_connection(self.address)
+            except OSError:
+                threading.Event().wait(RECONNECT_DELAY)
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.sock = sock
+                for topic in self.topics:
+                    self.request("subscribe", topic)
+            self.connected.set()
+            return sock
+        return None
+
+    def read_loop(self):
+        while True:
+            sock = self.connect()
+            if sock is None:
+                return
+            reader = FrameReader(sock)
+            try:
+                while True:
+                    messages = reader.read_messages()
+                    if messages is None:
+                        break
+                    for message in messages:
+                        self.deliver(json.loads(message))
+            except Exception as e:
+                if not self.closed:
+                    print(f"Error reading from the relay publisher at {self.address}: {e}")
+            with self.lock:
+                self.sock = None
+            self.connected.clear()
+            sock.close()
+            if not self.closed:
+                print(f"Lost the relay publisher at {self.address}, reconnecting.")
+
+    def deliver(self, update):
+        topic = update["topic"]
+        with self.lock:
+            callbacks = tuple(self.topics.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(topic, update["seq"], update["message"], update.get("snapshot", False))
+            except Exception as e:
+                print(f"Error delivering an update for {topic}: {e}")
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
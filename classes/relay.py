@@ -0,0 +1,330 @@
+import argparse
+import itertools
+import json
+import signal
+import socket
+import sys
+import threading
+import time
+
+from classes.cluster import WORKER_PREFIXES
+from classes.commands import CommandDispatcher, parse_command
+from classes.protocol import (HEARTBEAT_INTERVAL, PING, PONG, FrameReader, SharedFrame, encode_frame, encode_frames,
+                              frame_counters)
+from classes.pubsub import TcpSubscriber
+from classes.send_queue import HIGH_WATER_MARK, QueuedConnection
+
+HOST = '127.0.0.1'
+PORT = 65440  # Where spectators connect to a relay node
+UPSTREAM_PORT = 65433  # The server's --relay-port
+IDLE_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+PING_FRAME = encode_frame(PING)
+
+
+class RelayedGame:
+    """A game as a relay node follows it: its spectators here and a copy of its board."""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.spectators = []
+        self.joining = []  # Spectators who get their join reply with the first snapshot
+        self.seq = None  # Seq of the last broadcast passed on; None while waiting for a snapshot
+        self.pending = []  # (seq, message) received while waiting for a snapshot
+        self.num_players = 0
+        self.board = None
+        self.board_seq = 0
+
+    def board_json(self):
+        return json.dumps({'game_board': self.board, 'seq': self.board_seq})
+
+    def apply(self, message):
+        """Bring our copy of the board up to date with a broadcast, so later spectators get it from here."""
+        if not message.startswith('{'):
+            return  # A text message: a win, a tie, a timeout
+        update = json.loads(message)
+        if 'delta' in update:
+            delta = update['delta']
+            self.board[delta['row']][delta['col']] = delta['mark']
+            self.board_seq = delta['seq']
+        elif 'game_board' in update:
+            self.board = update['game_board']
+            self.board_seq = update['seq']
+
+
+class RelayNode:
+    """Serves spectators of games owned by another server, so that server sends each update once per relay
+    node instead of once per spectator.
+
+    A game's first spectator here subscribes the node to the game's topic on the owning server's transport
+    (see classes/pubsub.py) and its last one unsubscribes it. Subscribing starts with a snapshot of the game;
+    from then on every broadcast of the game arrives once, numbered, and is sent on to all of its spectators
+    here. A hole in the numbering means something was lost on the way: the node asks for a new snapshot,
+    holds back the updates until it arrives and sends its spectators the full board in their place.
+
+    buses are subscriber-side transports; with a cluster, buses[i] reaches worker i, the owner of the games
+    whose ID starts with its prefix.
+    """
+
+    def __init__(self, buses, heartbeat_interval=HEARTBEAT_INTERVAL, idle_timeout=IDLE_TIMEOUT):
+        self.buses = buses
+        self.games = {}  # game_id -> RelayedGame
+        self.connection_games = {}  # connection -> {game_id, ...}
+        self.lock = threading.Lock()
+        self.connections = {}  # number unique to each connection -> connection
+        self.connection_ids = itertools.count()
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.resyncs = 0
+        self.dispatcher = CommandDispatcher()
+        self.dispatcher.register("observer_join_game", self.handle_observer_join_game)
+        self.dispatcher.register("get_board", self.handle_get_board)
+        self.dispatcher.register("exit_game", self.handle_exit_game, closes_connection=True)
+        self.dispatcher.register(PING, self.handle_ping)
+        self.dispatcher.register(PONG, self.handle_pong)
+
+    def bus_for(self, game_id):
+        index = WORKER_PREFIXES.find(game_id[:1]) if len(self.buses) > 1 else 0
+        return self.buses[index if 0 <= index < len(self.buses) else 0]
+
+    def handle_observer_join_game(self, conn, command):
+        try:
+            game_id, username = command.args
+        except ValueError:
+            return "Invalid format for observer_join_game message.\n"
+
+        with self.lock:
+            game = self.games.get(game_id)
+            subscribe = game is None
+            if subscribe:
+                game = self.games[game_id] = RelayedGame(game_id)
+            self.connection_games.setdefault(conn, set()).add(game_id)
+            if game.seq is None:
+                game.joining.append(conn)
+                reply = None
+            else:
+                game.spectators.append(conn)
+                reply = f"Joined game successfully!,{game_id},{game.num_players},.\n", game.board_json()
+        if subscribe:
+            self.bus_for(game_id).subscribe(game_id, self.on_update)
+        return reply
+
+    def handle_get_board(self, conn, command):
+        if not command.args:
+            return "Invalid format for get_board message.\n"
+        game_id = command.args[0]
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None or game.board is None:
+                return f"Game {game_id} does not exist.\n"
+            return game.board_json()
+
+    def handle_exit_game(self, conn, command):
+        return None
+
+    def handle_ping(self, conn, command):
+        return PONG
+
+    def handle_pong(self, conn, command):
+        return None
+
+    def on_update(self, game_id, seq, message, is_snapshot):
+        """A broadcast or a snapshot of a game from its owner, on the transport's thread."""
+        resync = unsubscribe = False
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                return  # The last spectator left while this was on its way
+            if is_snapshot:
+                if message is None:
+                    self.end_game(game, f"Game {game_id} does not exist.\n")
+                    unsubscribe = True
+                else:
+                    resync = self.apply_snapshot(game, seq, message)
+            elif game.seq is None:
+                game.pending.append((seq, message))
+            elif seq > game.seq + 1:
+                game.seq = None
+                game.pending = [(seq, message)]
+                resync = True
+            else:
+                self.pass_on(game, seq, message)
+            if resync:
+                self.resyncs += 1
+        if resync:
+            self.bus_for(game_id).resync(game_id, self.on_update)
+        if unsubscribe:
+            self.bus_for(game_id).unsubscribe(game_id, self.on_update)
+
+    def apply_snapshot(self, game, seq, state):
+        """Start over from a snapshot and replay the updates held back since. Returns True if those have a
+        hole too, and another snapshot is needed. The caller holds the lock."""
+        catching_up = game.spectators and game.board is not None
+        game.seq = seq
+        game.num_players = state['num_players']
+        game.board = state['game_board']
+        game.board_seq = state['seq']
+        if catching_up:
+            self.send_to_spectators(game, game.board_json())  # In place of the updates that went missing
+        for conn in game.joining:
+            try:
+                conn.sendall(encode_frames(f"Joined game successfully!,{game.game_id},{game.num_players},.\n",
+                                           game.board_json()))
+                game.spectators.append(conn)
+            except Exception:
+                pass  # Gone already
+        game.joining = []
+        pending = sorted(update for update in game.pending if update[0] > seq)
+        game.pending = []
+        for index, (update_seq, message) in enumerate(pending):
+            if update_seq > game.seq + 1:
+                game.seq = None
+                game.pending = pending[index:]
+                return True
+            self.pass_on(game, update_seq, message)
+        return False
+
+    def pass_on(self, game, seq, message):
+        """Send the next broadcast of a game to its spectators. Older ones are already in the last snapshot."""
+        if seq <= game.seq:
+            return
+        game.seq = seq
+        game.apply(message)
+        self.send_to_spectators(game, message)
+
+    def send_to_spectators(self, game, message):
+        frame = SharedFrame(message)
+        failed_connections = []
+        for conn in game.spectators:
+            try:
+                conn.sendall(frame)
+            except Exception:
+                failed_connections.append(conn)
+        frame_counters.add(sent=len(game.spectators) - len(failed_connections))
+        for conn in failed_connections:
+            game.spectators.remove(conn)
+
+    def end_game(self, game, message):
+        """Stop following a game its owner no longer has. The caller holds the lock."""
+        for conn in game.joining + game.spectators:
+            try:
+                conn.sendall(encode_frame(message))
+            except Exception:
+                pass
+            self.connection_games.get(conn, set()).discard(game.game_id)
+        del self.games[game.game_id]
+
+    def handle_disconnect(self, conn):
+        """Drop a spectator from its games, and stop following the games left with nobody watching here."""
+        unsubscribe = []
+        with self.lock:
+            for game_id in self.connection_games.pop(conn, ()):
+                game = self.games.get(game_id)
+                if game is None:
+                    continue
+                game.spectators = [spectator for spectator in game.spectators if spectator is not conn]
+                game.joining = [spectator for spectator in game.joining if spectator is not conn]
+                if not game.spectators and not game.joining:
+                    del self.games[game_id]
+                    unsubscribe.append(game_id)
+        for game_id in unsubscribe:
+            self.bus_for(game_id).unsubscribe(game_id, self.on_update)
+
+    def resync_connection(self, conn):
+        """Full boards of a slow spectator's games, in place of the updates dropped from its queue."""
+        with self.lock:
+            return [encode_frame(self.games[game_id].board_json())
+                    for game_id in self.connection_games.get(conn, ())
+                    if game_id in self.games and self.games[game_id].board is not None]
+
+    def handle_client(self, conn, token):
+        reader = FrameReader(conn.sock)
+        try:
+            keep_open = True
+            while keep_open:
+                messages = reader.read_messages()
+                if messages is None:
+                    break
+                conn.last_seen = time.monotonic()
+                for message in messages:
+                    reply, keep_open = self.dispatcher.dispatch(conn, parse_command(message))
+                    if isinstance(reply, tuple):
+                        conn.sendall(encode_frames(*reply))
+                    elif reply is not None:
+                        conn.sendall(encode_frame(reply))
+                    if not keep_open:
+                        break
+
+        except Exception as e:
+            print(f"Error in handle_client: {e}")
+
+        finally:
+            self.connections.pop(token, None)
+            self.handle_disconnect(conn)
+            try:
+                conn.sendall(encode_frame("Server closing connection.\n"))
+            except Exception:
+                pass
+            conn.close()
+
+    def schedule_reaper(self):
+        while True:
+            threading.Event().wait(self.heartbeat_interval)
+            if self.idle_timeout:
+                self.reap_idle_connections()
+
+    def reap_idle_connections(self):
+        """Ping spectators that have gone quiet and drop those that stayed silent for idle_timeout."""
+        now = time.monotonic()
+        for conn in list(self.connections.values()):
+            quiet = now - conn.last_seen
+            if quiet >= self.idle_timeout:
+                conn.abort()
+            elif quiet >= self.heartbeat_interval:
+                try:
+                    conn.sendall(PING_FRAME)
+                except Exception:
+                    pass
+
+    def start_server(self, address):
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(address)
+        self.server_socket.listen()
+        print(f"[LISTENING] Relay is listening on {address[0]}:{address[1]}")
+        threading.Thread(target=self.schedule_reaper, daemon=True).start()
+
+        while True:
+            connection, address = self.server_socket.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            token = next(self.connection_ids)
+            connection = QueuedConnection(connection, HIGH_WATER_MARK, "resync", self.resync_connection)
+            self.connections[token] = connection
+            threading.Thread(target=self.handle_client, args=(connection, token), daemon=True).start()
+
+    def shutdown(self):
+        for bus in self.buses:
+            bus.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tic Tac Toe spectator relay")
+    parser.add_argument("--port", type=int, default=PORT, help="port spectators connect to")
+    parser.add_argument("--upstream-port", type=int, default=UPSTREAM_PORT,
+                        help="the server's --relay-port")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="the server's --workers; worker i publishes on --upstream-port + i")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="seconds a spectator may stay quiet before it is pinged")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds without a word from a spectator before it is disconnected; 0 to keep them")
+    args = parser.parse_args()
+
+    node = RelayNode([TcpSubscriber(HOST, args.upstream_port + worker_id) for worker_id in range(args.workers)],
+                     heartbeat_interval=args.heartbeat_interval, idle_timeout=args.idle_timeout)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        node.start_server((HOST, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.shutdown()
@@ -0,0 +1,63 @@
+from functools import lru_cache
+
+WIN_LENGTH = 3  # A player wins with 3 marks in a row, on every board size
+
+
+def line_starts(board_size):
+    """(row, col, row_step, col_step) for the start of every winning line the game recognises.
+
+    Rows and columns count anywhere on the board; diagonals only count along the two main diagonals.
+    """
+    for i in range(board_size):
+        for j in range(board_size - WIN_LENGTH + 1):
+            yield i, j, 0, 1
+            yield j, i, 1, 0
+    for i in range(board_size - WIN_LENGTH + 1):
+        yield i, i, 1, 1
+        yield i, board_size - 1 - i, 1, -1
+
+
+@lru_cache(maxsize=None)
+def winning_lines(board_size):
+    """Every winning line on the board, grouped by cell: result[row * board_size + col] holds the lines through it.
+
+    Computed once per board size, so checking a move only has to look at the handful of lines through it.
+    """
+    lines_by_cell = [[] for _ in range(board_size * board_size)]
+    for row, col, row_step, col_step in line_starts(board_size):
+        line = tuple((row + row_step * i, col + col_step * i) for i in range(WIN_LENGTH))
+        for line_row, line_col in line:
+            lines_by_cell[line_row * board_size + line_col].append(line)
+    return tuple(tuple(lines) for lines in lines_by_cell)
+
+
+@lru_cache(maxsize=None)
+def line_masks(board_size):
+    """winning_lines as bitmasks: result[cell] holds one int per line through the cell, with a bit set per cell."""
+    return tuple(
+        tuple(sum(1 << (row * board_size + col) for row, col in line) for line in lines)
+        for lines in winning_lines(board_size)
+    )
+
+
+def scan_for_win(board, player_symbol):
+    """Full-board scan of a list-of-lists board for a winning line. Used as the reference for Bitboard.is_winning_move."""
+    board_size = len(board)
+
+    # Check rows and columns for 3 in a row of the player's symbol
+    for i in range(board_size):
+        for j in range(board_size - 2):
+            if board[i][j] == board[i][j + 1] == board[i][j + 2] == player_symbol:
+                return True
+            if board[j][i] == board[j + 1][i] == board[j + 2][i] == player_symbol:
+                return True
+
+    # Check diagonals for player's symbol
+    for i in range(board_size - 2):
+        if board[i][i] == board[i + 1][i + 1] == board[i + 2][i + 2] == player_symbol:
+            return True
+        if board[i][board_size - 1 - i] == board[i + 1][board_size - 2 - i] == board[i + 2][
+            board_size - 3 - i] == player_symbol:
+            return True
+
+    return False
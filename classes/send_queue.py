@@ -0,0 +1,128 @@
+import socket
+import threading
+import time
+from collections import deque
+
+from classes.protocol import send_frame
+
+HIGH_WATER_MARK = 256 * 1024  # Bytes a client may have waiting before it counts as a slow consumer
+SLOW_CONSUMER_POLICIES = ("evict", "resync")
+
+
+class QueuedConnection:
+    """A client socket whose sends go through a bounded queue drained by its own writer thread.
+
+    send()/sendall() only append to the queue, so a broadcast never waits on a recipient's socket.
+    When more than high_water_mark bytes are waiting the client is a slow consumer:
+    - "evict" drops the queue and shuts the socket down; its reader thread then sees EOF and cleans up.
+    - "resync" drops the queue and, once the client has caught up, queues the frames returned by
+      on_resync(conn), i.e. full snapshots instead of the updates it missed. They skip the high-water
+      check, so a resync can't trigger another one.
+
+    The writer thread comes on top of the connection's reader thread, so the threaded engine costs two threads
+    per client. It is meant for modest connection counts; the asyncio engine is the one that scales.
+    """
+
+    def __init__(self, sock, high_water_mark=HIGH_WATER_MARK, policy="evict", on_resync=None):
+        self.sock = sock
+        self.high_water_mark = high_water_mark
+        self.policy = policy
+        self.on_resync = on_resync
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.closed = False
+        self.closing = False
+        self.needs_resync = False
+        self.writer_done = False
+        self.dropped_frames = 0
+        self.last_seen = time.monotonic()  # When the client last sent anything; kept up to date by its reader
+        self.handed_off = False  # Given to another worker of the cluster, which now serves the client
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def send(self, data):
+        with self.condition:
+            if self.closed or self.closing:
+                raise ConnectionError("Connection is closed")
+            if self.queued_bytes + len(data) > self.high_water_mark:
+                self.slow_consumer()
+                return len(data)
+            self.queue.append(data)
+            self.queued_bytes += len(data)
+            self.condition.notify()
+        return len(data)
+
+    def sendall(self, data):
+        self.send(data)
+
+    def slow_consumer(self):
+        """Called with the condition held when the queue is over its high-water mark."""
+        self.dropped_frames += len(self.queue) + 1
+        self.queue.clear()
+        self.queued_bytes = 0
+        if self.policy == "resync" and self.on_resync is not None:
+            self.needs_resync = True
+            return
+        self.abort()
+
+    def abort(self):
+        """Drop everything queued and shut the socket down; the reader thread then sees EOF and cleans up."""
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.queued_bytes = 0
+            self.condition.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed and not self.closing and not self.needs_resync:
+                    self.condition.wait()
+                if self.closed or (self.closing and not self.queue):
+                    break
+                resync = self.needs_resync and not self.queue
+                if resync:
+                    self.needs_resync = False
+                data = self.queue.popleft() if self.queue else None
+                if data is not None:
+                    self.queued_bytes -= len(data)
+            if resync:
+                try:
+                    frames = self.on_resync(self)
+                except Exception as e:
+                    print(f"Error resyncing a slow client: {e}")
+                    continue
+                with self.condition:
+                    for frame in frames:
+                        self.queue.append(frame)
+                        self.queued_bytes += len(frame)
+                continue
+            try:
+                send_frame(self.sock, data)
+            except OSError:
+                with self.condition:
+                    self.closed = True
+                    self.queue.clear()
+                    self.queued_bytes = 0
+                break
+        # Whoever comes last of the writer and close() closes the socket, so the reader thread never
+        # finds its socket closed under it
+        with self.condition:
+            self.writer_done = True
+            should_close = self.closing
+        if should_close:
+            self.sock.close()
+
+    def close(self):
+        """Close once everything already queued has been written."""
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+            should_close = self.writer_done
+        if should_close:
+            self.sock.close()
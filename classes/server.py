@@ -1,20 +1,53 @@
+import argparse
+import itertools
 import json
+import os
+import signal
 import socket
+import sys
 import threading
+import time
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+from classes.async_server import AsyncServerEngine
+from classes.cluster import ClusterNode, run_cluster
+from classes.commands import CommandDispatcher, parse_command
+from classes.game_journal import SNAPSHOT_INTERVAL, GameJournal, game_state
+from classes.game_registry import GameRegistry, new_game_data
+from classes.leaderboard_cache import DEFAULT_PAGE_SIZE as LEADERBOARD_PAGE_SIZE, LeaderboardCache
+from classes.lobby import DEFAULT_PAGE_SIZE, OpenSeatIndex
+from classes.protocol import (HEARTBEAT_INTERVAL, PING, PONG, FrameReader, SharedFrame, encode_frame, encode_frames,
+                              frame_counters)
+from classes.pubsub import TcpPublisher
+from classes.send_queue import HIGH_WATER_MARK, SLOW_CONSUMER_POLICIES, QueuedConnection
+from classes.timer_wheel import TimerWheel
+from classes.rules import scan_for_win
 from enums.game import Game
 from sql.SQLClient import SQLClient
+from sql.backends import BACKENDS, SQLiteBackend, create_backend
+from sql.sql_constants import SQLConstants
+from sql.write_behind import WriteBehindQueue
 from utils.utils import generate_token
 
 HOST = '127.0.0.1'
 PORT = 65432
 FORMAT = "utf-8"
 ADDR = (HOST, PORT)
-MOVE_TIMEOUT = 10000
+MOVE_TIMEOUT = 10000  # Seconds a player has for their turn once every seat is taken
+TURN_TIMEOUT_POLICIES = ("forfeit", "skip")
+TURN_TIMEOUT_POLICY = "forfeit"
+SERVER_MODES = ("threaded", "asyncio")
+SLOW_CONSUMER_POLICY = "resync"
+LEADERBOARD_RECONCILE_INTERVAL = 300  # Seconds between checks of the cached leaderboard against the database
+HISTORY_BATCH_SIZE = 500  # Finished games per multi-row insert into the games table
+HISTORY_MAX_PENDING = 50000  # Finished games buffered for the games table before new ones are dropped
+LEADERBOARD_MAX_PENDING = 100000  # Player results buffered for the leaderboard before new ones are dropped
+JOURNAL_DIR = "game_journal"
+IDLE_TIMEOUT = 3 * HEARTBEAT_INTERVAL  # Seconds without a word from a client, pongs included, before it is dropped
+PING_FRAME = encode_frame(PING)
 DATABASE_FILE = "tictactoe.db"
 SQL_PATH = ""
 key = b'\x04\x03|\xeb\x8dSh\xe0\xc5\xae\xe5\xe1l9\x0co\xca\xb1"\r-Oo\xbaiYa\x1e\xd1\xf7\xa2\xdf'
@@ -22,7 +55,17 @@ iv = b'#\xb59\xee\xa7\xc4@n\xe5r\xac\x97lV\xff\xf1'
 
 
 class TicTacToeServer:
-    def __init__(self, num_players=2):
+    def __init__(self, num_players=2, backend=None, journal_dir=None, turn_timeout=MOVE_TIMEOUT,
+                 turn_timeout_policy=TURN_TIMEOUT_POLICY, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 idle_timeout=IDLE_TIMEOUT, cluster=None, relay_bus=None):
+        """journal_dir keeps a journal of the live games there and restores them from it on startup.
+
+        A player who doesn't move within turn_timeout seconds forfeits, or with the "skip" policy loses the turn.
+        Clients quiet for heartbeat_interval seconds are pinged, and dropped after idle_timeout (0 keeps them).
+        cluster is this worker's ClusterNode when the server runs as one of several worker processes.
+        relay_bus is the publisher side of a pub/sub transport (see classes/pubsub.py) that passes every game's
+        broadcasts on to relay nodes, which fan them out to their own spectators.
+        """
         self.username = None
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.num_players = num_players
@@ -30,223 +73,565 @@ class TicTacToeServer:
         self.players = self.players_chars[:num_players]
         self.board_size = num_players + 1
         self.current_player = self.players[0]
-        self.players_tokens = {}
-        self.user_data = {}
-        self.leaderboard_data = {}
-        self.games_data = {}
-        self.sql_client = SQLClient()
-        self.load_all_data()
-
-    def load_all_data(self):
-        self.user_data = self.sql_client.load_user_data()
-        self.leaderboard_data = self.sql_client.load_leaderboard_data()
-        self.games_data = self.sql_client.load_games_data()
-
-    def handle_client(self, conn, token):
-        conn.settimeout(MOVE_TIMEOUT)  # Set the timeout for receiving moves
+        self.players_tokens = {}  # Live connections by a number unique to each, for the idle reaper
+        self.connection_ids = itertools.count()
+        self.leaderboard = LeaderboardCache()  # Ranked in memory, updated on every result
+        self.games_data = GameRegistry()
+        self.open_games = OpenSeatIndex()  # Games with a free seat, kept up to date on create/join/leave/finish
+        # In a cluster the lobby also lists the other workers' open games, from their latest digests
+        self.cluster = cluster
+        self.game_id_prefix = cluster.prefix if cluster is not None else ""
+        self.remote_lobbies = {}  # worker_id -> {game_id: (num_players, players)}
+        self.sql_client = SQLClient(backend=backend)
+        # Game results are written to the leaderboard in batches by a background thread
+        self.leaderboard_writer = WriteBehindQueue(self.sql_client.record_results, name="leaderboard-writer",
+                                                   max_items=LEADERBOARD_MAX_PENDING)
+        # Finished games go to the games table the same way, with a bounded buffer
+        self.history_writer = WriteBehindQueue(self.sql_client.record_games, batch_size=HISTORY_BATCH_SIZE,
+                                               name="history-writer", max_items=HISTORY_MAX_PENDING)
+        self.dispatcher = CommandDispatcher()
+        # How much a client may fall behind on its sends, and what happens to it then
+        self.send_high_water_mark = HIGH_WATER_MARK
+        self.slow_consumer_policy = SLOW_CONSUMER_POLICY
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.reaped_connections = 0
+        # One wheel holds every game's turn clock; forfeit ends the game, skip passes the turn on
+        self.turn_clock = TimerWheel(name="turn-clock")
+        self.turn_timeout = turn_timeout
+        self.turn_timeout_policy = turn_timeout_policy
+        self.register_commands()
+        self.relay_bus = relay_bus
+        if relay_bus is not None:
+            relay_bus.start(self.relay_snapshot)
+        self.journal = None
+        if journal_dir:
+            self.journal = GameJournal(journal_dir)
+            self.restore_games(self.journal.recover(self.players_chars))
+            threading.Thread(target=self.schedule_snapshots, daemon=True).start()
+        # Nothing is read up front: users and games are looked up when needed, and the leaderboard cache is
+        # filled by its first reconcile while the server is already accepting connections
+        self.leaderboard_writer.call_soon(self.reconcile_leaderboard)
+        threading.Thread(target=self.schedule_leaderboard_reconcile, daemon=True).start()
+        threading.Thread(target=self.schedule_reaper, daemon=True).start()
+
+    def restore_games(self, games):
+        """Put games recovered from the journal back in play. Their players rejoin with join_game."""
+        for game_id, game_data in games.items():
+            self.games_data.add_if_absent(game_id, game_data)
+            for username in game_data[Game.PLAYERS]:
+                self.games_data.bind_player(username, game_id, None)
+            if len(game_data[Game.PLAYERS]) < game_data[Game.NUM_PLAYERS]:
+                self.open_games.add(game_id, game_data[Game.NUM_PLAYERS])
+            else:
+                self.start_turn_clock(game_id)
+        if games:
+            print(f"Restored {len(games)} live games from the journal.")
+
+    def journal_event(self, game_data, kind, *args):
+        """Record a change to a live game in the journal. The caller holds the game's lock."""
+        if self.journal is not None:
+            game_data[Game.JOURNAL_SEQ] += 1
+            self.journal.append(kind, game_data[Game.GAME_ID], game_data[Game.JOURNAL_SEQ], *args)
+
+    def schedule_snapshots(self):
+        while not self.journal.closed:
+            threading.Event().wait(SNAPSHOT_INTERVAL)
+            self.snapshot_games()
+
+    def snapshot_games(self):
+        """Save every live game, so a restart only replays the journal written since."""
         try:
-            while True:
-                try:
-                    move = conn.recv(1024).decode(FORMAT, errors='ignore')
-                    if not move:
-                        break
-                    if move.startswith("make_move"):
-                        parts = move.split()
-                        game_id = parts[1]
-                        username = parts[-2]  # נניח שהשם משתמש מועבר כחלק מהפקודה
-                        row_col_part = parts[-1]
-                        row_str, col_str = row_col_part.split(',')
-                        row, col = int(row_str), int(col_str)
-
-                        # בדיקה אם זה תור השחקן
-                        if not self.is_players_turn(game_id, username):
-                            conn.send("It's not your turn.\n".encode(FORMAT))
-                            continue
-
-                        # ממשיך כרגיל אם זה תור השחקן
-                        if self.games_data[game_id][Game.BOARD][row][col] == ' ':
-                            current_player = self.games_data[game_id][Game.CURRENT_PLAYER]
-                            self.games_data[game_id][Game.BOARD][row][col] = self.players_chars[current_player]
-                            self.send_game_board_to_all_clients(game_id)
-                            if self.check_win(self.players_chars[current_player], game_id):
-                                win_message = f"Congratulations! Player {username} wins the game!"
-                                self.broadcast_to_all_clients_in_game(win_message, game_id)
-                                self.sql_client.update_leaderboard(username, 'win')
-
-                                losers_list = self.games_data[game_id][Game.PLAYERS]
-                                del losers_list[username]
-                                for loser in losers_list:
-                                    self.sql_client.update_leaderboard(loser, 'loss')
-
-                                self.sql_client.load_leaderboard_data()
-
-                            elif self.check_tie(game_id):
-                                tie_message = "It's a tie!"
-                                self.broadcast_to_all_clients_in_game(tie_message, game_id)
-
-                                draw_users_list = self.games_data[game_id][Game.PLAYERS]
-                                for draw_user in draw_users_list:
-                                    self.sql_client.update_leaderboard(draw_user, 'draw')
-
-                                self.sql_client.load_leaderboard_data()
-                            else:
-                                self.get_next_player(game_id)
-                                current_player = self.games_data[game_id][Game.CURRENT_PLAYER]
-                                # player_turn_message = f"Your move, player {current_player}.\n"
-                                # self.broadcast_to_all_clients_in_game(player_turn_message, game_id)
-
-                        else:
-                            conn.send("Invalid move. Try again.\n".encode(FORMAT))
-
-                    if move.startswith("register "):
-                        reg_username, reg_password = move.split()[1:]
-                        registration_result = self.sql_client.insert_user(reg_username, reg_password)
-                        if registration_result:
-                            conn.send("success".encode(FORMAT))
-                            conn.send(registration_result.encode(FORMAT))
-                        else:
-                            conn.send("failure".encode(FORMAT))
-                        continue
-
-                    if move.startswith("login "):
-                        login_username, login_password = move.split()[1:]
-                        login_result, message = self.sql_client.authenticate_user(login_username, login_password)
-                        if login_result:
-                            conn.send(message.encode(FORMAT))
-                        else:
-                            conn.send(message.encode(FORMAT))
-                        continue
-
-                    # Check if the received message is for changing the number of players
-                    if move.startswith("set_players "):
-                        new_num_players = move.split()
-                        if new_num_players not in [2, 3, 4, 5]:
-                            conn.send("Invalid number of players. Please enter 2 or 3 or 4 or 5.\n".encode(FORMAT))
-                        else:
-                            self.set_num_players(new_num_players)
-                            conn.send(f"Number of players updated to {new_num_players}.\n".encode(FORMAT))
-                        continue
-
-                    if move.startswith("exit_game"):
-                        try:
-                            # Extract the username from the message
-                            username = move.split()[1]
-                        except IndexError:
-                            print("Invalid format for exit_game message.\n")
-                            continue
-
-                        print(username)
-                        self.remove_player_from_game(username)
-                        break
-
-                    if move.startswith("create_game"):
-                        try:
-                            num_players, cr_username = move.split()[1:]
-                            num_players = int(num_players)
-                        except ValueError:
-                            conn.send("Invalid format for create_game message.\n".encode(FORMAT))
-                            continue
-
-                        response = self.create_game(num_players, cr_username, conn)
-                        conn.send(response.encode(FORMAT))
-                        continue
-
-                    if move.startswith("get_available_games"):
-                        # Get the list of available games and send it to the client
-                        available_games = self.get_available_games()
-                        games_str = ' '.join(available_games)  # Convert the list to a space-separated string
-                        conn.send(games_str.encode(FORMAT))
-                        continue
-
-                    if move.startswith("get_all_available_games"):
-                        # Get the list of available games and send it to the client as a JSON string
-                        all_available_games = self.get_all_available_games()
-                        games_str = json.dumps(all_available_games)
-                        conn.send(games_str.encode(FORMAT))
-                        continue
-
-                    if move.startswith("join_game"):
-                        try:
-                            # Extract the game ID from the message
-                            game_id, username = move.split()[1:]
-                            # Implement the logic to join the game using the game ID
-                            # You might want to check if the game exists and if the player can join
-                            # Example:
-                            if game_id in self.games_data:
-                                game_data = self.games_data[game_id]
-                                num_players = game_data[Game.NUM_PLAYERS]
-                                print(num_players)
-                                players_in_game = game_data[Game.PLAYERS]
-
-                                if len(players_in_game) < num_players:
-                                    # Add the player to the game
-                                    game_data[Game.PLAYERS].append(username)
-                                    game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].append(conn)
-
-                                    conn.send(f"Joined game successfully!,{game_id},{num_players},.\n".encode(FORMAT))
-                                    # self.notify_spectators(f"Player {username} has joined game {game_id}.\n", game_id)
-                                    # self.send_game_board_to_all_clients(game_id)
-
-                                    game_board = self.games_data[game_id][Game.BOARD]  # Get the game board data
-                                    game_board_json = json.dumps({'game_board': game_board})
-                                    conn.send(game_board_json.encode('utf-8'))
-
-                                    # Update the game state and send it to the client
-                                else:
-                                    conn.send(f"Game {game_id} is full. Cannot join.\n".encode(FORMAT))
-                            else:
-                                conn.send(f"Game {game_id} does not exist.\n".encode(FORMAT))
-
-                        except IndexError:
-                            conn.send("Invalid format for join_game message.\n".encode(FORMAT))
-                        continue  # Continue the loop after processing the join_game message
-
-                    if move.startswith("observer_join_game"):
-                        game_id, username = move.split()[1:]
-                        # Implement the logic to join the game using the game ID
-                        # You might want to check if the game exists and if the player can join
-                        # Example:
-                        if game_id in self.games_data:
-                            game_data = self.games_data[game_id]
-                            num_players = game_data[Game.NUM_PLAYERS]
-                            game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].append(conn)
-                            conn.send(f"Joined game successfully!,{game_id},{num_players},.\n".encode(FORMAT))
-                            # self.notify_spectators(f"Player {username} has joined game {game_id}.\n", game_id)
-
-                            game_board = self.games_data[game_id][Game.BOARD]  # Get the game board data
-                            game_board_json = json.dumps({'game_board': game_board})
-                            conn.send(game_board_json.encode('utf-8'))
-
-
-
-                except socket.timeout:
-                    conn.send("Timeout: No move received within the time limit. Game aborted.\n".encode(FORMAT))
-                    self.sql_client.update_leaderboard(self.current_player, 'loss')
-                    self.sql_client.load_leaderboard_data()
-
+            saved = self.journal.snapshot(self.capture_games)
+            print(f"Snapshot of {saved} live games saved.")
+        except Exception as e:
+            print(f"Error saving a snapshot of the live games: {e}")
+
+    def capture_games(self):
+        states = {}
+        for game_id, _ in self.games_data.items():
+            with self.games_data.locked(game_id) as game_data:
+                if game_data is not None and not game_data[Game.FINISHED]:
+                    states[game_id] = game_state(game_data)
+        return states
+
+    def handle_client(self, conn, token, messages=(), leftover=b""):
+        """Serve one connection. One handed over by another worker comes with the messages that worker read
+        but didn't handle, and leftover, the start of a frame it was still reading."""
+        # Turn deadlines are kept per game by turn_clock, so a quiet connection (a spectator, someone in the
+        # lobby, a player waiting for their turn) is never timed out here
+        reader = FrameReader(conn.sock)
+        reader.decoder.buffer += leftover
+        try:
+            # One read can carry several pipelined commands
+            while self.process_messages(conn, messages, reader.decoder.buffer):
+                messages = reader.read_messages()
+                if messages is None:
+                    break
+                conn.last_seen = time.monotonic()
 
         except Exception as e:
             print(f"Error in handle_client: {e}")
-            conn.send(f"Error: {e}\n".encode(FORMAT))
+            self.send_message(conn, f"Error: {e}\n")
 
         finally:
-            if token in self.players_tokens:
-                del self.players_tokens[token]
+            self.players_tokens.pop(token, None)
+            self.handle_disconnect(conn)
+            if conn.handed_off:
+                return  # Still open, on the worker that owns its game
 
             try:
-                conn.send("Server closing connection.\n".encode(FORMAT))
+                self.send_message(conn, "Server closing connection.\n")
             except:
                 pass  # The connection may already be closed by the client
 
         print("connection with a client closed")
         conn.close()
 
+    def register_commands(self):
+        """Build the dispatch table that maps every protocol verb to its handler."""
+        self.dispatcher.register("make_move", self.handle_make_move, routed=True)
+        self.dispatcher.register("register", self.handle_register, blocking=True)
+        self.dispatcher.register("login", self.handle_login, blocking=True)
+        self.dispatcher.register("set_players", self.handle_set_players)
+        self.dispatcher.register("exit_game", self.handle_exit_game, closes_connection=True)
+        self.dispatcher.register("create_game", self.handle_create_game)
+        self.dispatcher.register("get_available_games", self.handle_get_available_games)
+        self.dispatcher.register("get_all_available_games", self.handle_get_all_available_games)
+        self.dispatcher.register("get_lobby", self.handle_get_lobby)
+        self.dispatcher.register("get_leaderboard", self.handle_get_leaderboard)
+        self.dispatcher.register("get_board", self.handle_get_board, routed=True)
+        self.dispatcher.register("join_game", self.handle_join_game, routed=True)
+        self.dispatcher.register("observer_join_game", self.handle_observer_join_game, routed=True)
+        self.dispatcher.register(PING, self.handle_ping)
+        self.dispatcher.register(PONG, self.handle_pong)
+
+    def process_message(self, conn, move):
+        """Handle a single message received from a client. Returns False when the connection should close."""
+        return self.dispatch_command(conn, parse_command(move))
+
+    def process_messages(self, conn, messages, leftover):
+        """Handle the messages of one read, in order. Returns False once the connection should close, or when
+        it was handed to another worker along with the rest of the messages and the leftover bytes."""
+        for index, move in enumerate(messages):
+            command = parse_command(move)
+            owner = self.route(command)
+            if owner is not None:
+                refusal = self.handoff_refusal(conn, command)
+                if refusal is not None:
+                    self.send_message(conn, refusal)
+                    continue
+                self.hand_off(conn, owner, messages[index:], leftover)
+                return False
+            if not self.dispatch_command(conn, command):
+                return False
+        return True
+
+    def route(self, command):
+        """The other worker owning the game a command is about, or None when it is handled here."""
+        if self.cluster is None:
+            return None
+        game_id = self.dispatcher.game_of(command)
+        if game_id is None or self.cluster.is_local(game_id):
+            return None
+        return self.cluster.owner_of(game_id)
+
+    def handoff_refusal(self, conn, command):
+        """The reply to a command about another worker's game from a connection that plays in or watches games
+        here, or None if the connection is free to go. Handing it over would take it out of those games."""
+        if not self.games_data.games_of_connection(conn):
+            return None
+        return (f"Game {command.args[0]} is hosted elsewhere. Leave your current game, or use a new connection, "
+                f"to reach it.\n")
+
+    def hand_off(self, conn, owner, messages, leftover):
+        """Move a client's connection to the worker that owns its game (see ClusterNode)."""
+        fd = os.dup(conn.sock.fileno())
+        try:
+            conn.handed_off = True
+            conn.close()
+            conn.writer.join()  # Replies already queued here go out before the new owner's
+            if not self.cluster.hand_off(owner, fd, messages, leftover):
+                print(f"Could not hand a connection over to worker {owner}, dropping it.")
+        finally:
+            os.close(fd)
+
+    def start_cluster(self, on_connection):
+        """Join the other workers; on_connection(sock, messages, leftover) serves connections they hand over."""
+        self.cluster.on_connection = on_connection
+        self.cluster.on_lobby = self.merge_remote_lobby
+        self.cluster.on_results = self.leaderboard.record_many  # Their writers put them in the database
+        self.cluster.start(self.lobby_digest)
+
+    def lobby_digest(self):
+        """This worker's open games as [[game_id, num_players, players], ...], for the other workers' lobbies."""
+        digest = []
+        for game_id in self.open_games.game_ids():
+            game_data = self.games_data.get(game_id)
+            if game_data is not None:
+                digest.append([game_id, game_data[Game.NUM_PLAYERS], len(game_data[Game.PLAYERS])])
+        return digest
+
+    def merge_remote_lobby(self, worker_id, digest):
+        """Bring another worker's open games in our lobby up to date with its latest digest."""
+        games = {game_id: (num_players, players) for game_id, num_players, players in digest}
+        previous = self.remote_lobbies.get(worker_id, {})
+        self.remote_lobbies[worker_id] = games
+        for game_id in previous.keys() - games.keys():
+            self.open_games.discard(game_id)
+        for game_id, (num_players, _) in games.items():
+            if game_id not in previous:
+                self.open_games.add(game_id, num_players)
+
+    def remote_game(self, game_id):
+        """(num_players, players) of another worker's open game, as of its latest digest, or None."""
+        if self.cluster is None or self.cluster.is_local(game_id):
+            return None
+        return self.remote_lobbies.get(self.cluster.owner_of(game_id), {}).get(game_id)
+
+    def dispatch_command(self, conn, command):
+        reply, keep_open = self.dispatcher.dispatch(conn, command)
+        if reply is not None:
+            if isinstance(reply, tuple):
+                self.send_messages(conn, *reply)
+            else:
+                self.send_message(conn, reply)
+        return keep_open
+
+    def handle_make_move(self, conn, command):
+        game_id = command.args[0]
+        username = command.args[-2]  # נניח שהשם משתמש מועבר כחלק מהפקודה
+        row_str, col_str = command.args[-1].split(',')
+        row, col = int(row_str), int(col_str)
+
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return f"Game {game_id} does not exist.\n"
+            return self.make_move(game_id, username, row, col)
+
+    def make_move(self, game_id, username, row, col):
+        """Play a move. The caller holds the game's lock."""
+        if self.games_data[game_id][Game.FINISHED]:
+            return "The game is over.\n"
+
+        # בדיקה אם זה תור השחקן
+        if not self.is_players_turn(game_id, username):
+            return "It's not your turn.\n"
+
+        # ממשיך כרגיל אם זה תור השחקן
+        current_player = self.games_data[game_id][Game.CURRENT_PLAYER]
+        if not self.games_data[game_id][Game.BOARD].place(row, col, current_player):
+            return "Invalid move. Try again.\n"
+        self.games_data[game_id][Game.SEQUENCE] += 1
+        self.games_data[game_id][Game.MOVES].append([row, col, self.players_chars[current_player]])
+        self.journal_event(self.games_data[game_id], "move", row, col)
+
+        # Only the lines through the new mark can have changed
+        if self.check_move_wins(game_id, row, col, current_player):
+            self.finish_game(game_id)
+            self.send_move_to_all_clients(game_id, row, col, current_player)
+            win_message = f"Congratulations! Player {username} wins the game!"
+            self.broadcast_to_all_clients_in_game(win_message, game_id)
+            self.record_results(game_id, winner=username)
+
+        elif self.check_tie(game_id):
+            self.finish_game(game_id)
+            self.send_move_to_all_clients(game_id, row, col, current_player)
+            tie_message = "It's a tie!"
+            self.broadcast_to_all_clients_in_game(tie_message, game_id)
+            self.record_results(game_id)
+        else:
+            # Advance the turn before the board goes out, so a pipelined reply from the next
+            # player can't arrive while it is still the previous player's turn
+            self.get_next_player(game_id)
+            self.send_move_to_all_clients(game_id, row, col, current_player)
+            # player_turn_message = f"Your move, player {current_player}.\n"
+            # self.broadcast_to_all_clients_in_game(player_turn_message, game_id)
+        return None
+
+    def record_results(self, game_id, winner=None, loser=None):
+        """Queue every player's result for the leaderboard, and the game for the games table. No winner means a tie;
+        a loser (who forfeited) loses and everyone else wins.
+
+        The caller holds the game's lock.
+        """
+        game_data = self.games_data[game_id]
+        players = game_data[Game.PLAYERS]
+        if loser is not None:
+            results = [(player, 'loss' if player == loser else 'win') for player in players]
+        elif winner is None:
+            results = [(player, 'tie') for player in players]
+        else:
+            results = [(player, 'win' if player == winner else 'loss') for player in players]
+        # Both under the cache lock, so a reconcile never sees a result in one but not the other. Results the
+        # writer turns away (the database is behind, or the server is shutting down) stay out of the cache too
+        with self.leaderboard.lock:
+            if self.leaderboard_writer.put_many(results):
+                self.leaderboard.record_many(results)
+                if self.cluster is not None:
+                    self.cluster.share_results(results)
+            else:
+                print(f"Leaderboard writer is full or closed, results of game {game_id} not recorded "
+                      f"({self.leaderboard_writer.dropped} dropped).")
+
+        marks = [(player, self.players_chars[index]) for index, player in enumerate(players)]
+        duration_ms = int((time.time() - game_data[Game.CREATED_AT]) * 1000)
+        game = (game_id, [(player, mark, result) for (player, mark), (_, result) in zip(marks, results)],
+                game_data[Game.MOVES], duration_ms)
+        if not self.history_writer.put(game):
+            print(f"Games table writer is full or closed, game {game_id} not recorded ({self.history_writer.dropped} dropped).")
+
+    def schedule_leaderboard_reconcile(self):
+        while not self.leaderboard_writer.closed:
+            threading.Event().wait(LEADERBOARD_RECONCILE_INTERVAL)
+            self.leaderboard_writer.call_soon(self.reconcile_leaderboard)
+
+    def reconcile_leaderboard(self):
+        """Fix the cached leaderboard where it drifted from the database. Runs on the leaderboard writer's thread,
+        so the only results missing from the database are the ones still queued."""
+        loading = not self.leaderboard.loaded
+        try:
+            # Streamed from the database without holding the cache lock, so games can keep finishing meanwhile
+            fixed = self.leaderboard.reconcile(self.sql_client.iter_leaderboard_rows(),
+                                               self.leaderboard_writer.pending)
+        except Exception as e:
+            print(f"Error loading the leaderboard: {e}")
+            return  # Database unavailable; try again next time
+        if loading:
+            print(f"Leaderboard cache loaded, {len(self.leaderboard)} players.")
+        elif fixed:
+            print(f"Leaderboard cache reconciled, {len(fixed)} players corrected.")
+
+    def shutdown(self):
+        """Write out everything still queued for the database before the process exits."""
+        self.turn_clock.stop()
+        if self.relay_bus is not None:
+            self.relay_bus.close()
+        unwritten = self.leaderboard_writer.close()
+        if unwritten:
+            print(f"Could not write {len(unwritten)} leaderboard results: {unwritten}")
+        unwritten = self.history_writer.close()
+        if unwritten:
+            print(f"Could not write {len(unwritten)} finished games to the games table.")
+        if self.journal is not None:
+            # A fresh snapshot makes the next startup quick
+            self.snapshot_games()
+            self.journal.close()
+        self.sql_client.close_connection()
+
+    def handle_ping(self, conn, command):
+        return PONG
+
+    def handle_pong(self, conn, command):
+        return None  # Receiving it already marked the client as alive
+
+    def schedule_reaper(self):
+        while True:
+            threading.Event().wait(self.heartbeat_interval)
+            if self.idle_timeout:
+                self.reap_idle_connections()
+
+    def reap_idle_connections(self):
+        """Ping clients that have gone quiet and drop those that stayed silent for idle_timeout.
+
+        A client whose machine or network went away never closes its end, so its connection, thread, token
+        and game seat would otherwise be held until the server restarts. Dropping it runs the usual cleanup.
+        """
+        now = time.monotonic()
+        reaped = 0
+        for conn in list(self.players_tokens.values()):
+            quiet = now - conn.last_seen
+            if quiet >= self.idle_timeout:
+                conn.abort()
+                reaped += 1
+            elif quiet >= self.heartbeat_interval:
+                try:
+                    conn.sendall(PING_FRAME)
+                except Exception:
+                    pass  # Already closing; its cleanup is on the way
+        if reaped:
+            self.reaped_connections += reaped
+            print(f"Dropped {reaped} idle connections.")
+
+    def handle_register(self, conn, command):
+        reg_username, reg_password = command.args
+        registration_result = self.sql_client.insert_user(reg_username, reg_password)
+        if registration_result:
+            # The client reads the registered username as a second message
+            return "success", reg_username
+        return "failure"
+
+    def handle_login(self, conn, command):
+        login_username, login_password = command.args
+        login_result, message = self.sql_client.authenticate_user(login_username, login_password)
+        return message
+
+    def handle_set_players(self, conn, command):
+        # Changes the number of players for the server defaults
+        try:
+            new_num_players = int(command.args[0])
+        except (IndexError, ValueError):
+            new_num_players = None
+        if new_num_players not in [2, 3, 4, 5]:
+            return "Invalid number of players. Please enter 2 or 3 or 4 or 5.\n"
+        self.set_num_players(new_num_players)
+        return f"Number of players updated to {new_num_players}.\n"
+
+    def handle_exit_game(self, conn, command):
+        if not command.args:
+            print("Invalid format for exit_game message.\n")
+            return None
+
+        username = command.args[0]
+        print(username)
+        self.remove_player_from_game(username)
+        return None
+
+    def handle_create_game(self, conn, command):
+        try:
+            num_players, cr_username = command.args
+            num_players = int(num_players)
+        except ValueError:
+            return "Invalid format for create_game message.\n"
+
+        return self.create_game(num_players, cr_username, conn)
+
+    def handle_get_available_games(self, conn, command):
+        available_games = self.get_available_games()
+        return ' '.join(available_games)  # Convert the list to a space-separated string
+
+    def handle_get_all_available_games(self, conn, command):
+        all_available_games = self.get_all_available_games()
+        return json.dumps(all_available_games)
+
+    def handle_get_lobby(self, conn, command):
+        """get_lobby [num_players] [cursor] [limit] -> one page of games with free seats, as JSON.
+
+        num_players 0 means any size. Pass the returned next_cursor to get the following page.
+        """
+        try:
+            values = [int(arg) for arg in command.args[:3]]
+        except ValueError:
+            return "Invalid format for get_lobby message.\n"
+        num_players, cursor, limit = values + [0, 0, DEFAULT_PAGE_SIZE][len(values):]
+
+        entries, next_cursor = self.open_games.page(num_players, cursor, limit)
+        games = []
+        for game_id, game_num_players in entries:
+            game_data = self.games_data.get(game_id)
+            if game_data is not None:
+                games.append({"game_id": game_id, "num_players": game_num_players,
+                              "players": len(game_data[Game.PLAYERS])})
+            elif (remote := self.remote_game(game_id)) is not None:
+                games.append({"game_id": game_id, "num_players": game_num_players, "players": remote[1]})
+        return json.dumps({"games": games, "next_cursor": next_cursor})
+
+    def handle_get_leaderboard(self, conn, command):
+        """get_leaderboard [cursor] [limit] -> one page of the ranked leaderboard, as JSON.
+        get_leaderboard around <username> [radius] -> the user's entry with radius players above and below.
+
+        Each entry is {"rank", "username", "wins", "losses", "draws"}. Pass the returned next_cursor to get the
+        following page.
+        """
+        if not self.leaderboard.loaded:
+            return "Leaderboard is still loading, try again shortly.\n"
+        args = command.args
+        try:
+            if args and args[0] == "around":
+                if len(args) < 2:
+                    return "Invalid format for get_leaderboard message.\n"
+                radius = int(args[2]) if len(args) > 2 else LEADERBOARD_PAGE_SIZE // 2
+                return json.dumps({"entries": self.leaderboard.around(args[1], radius)})
+            values = [int(arg) for arg in args[:2]]
+        except ValueError:
+            return "Invalid format for get_leaderboard message.\n"
+        cursor, limit = values + [0, LEADERBOARD_PAGE_SIZE][len(values):]
+        entries, next_cursor = self.leaderboard.page(cursor, limit)
+        return json.dumps({"entries": entries, "next_cursor": next_cursor})
+
+    def handle_get_board(self, conn, command):
+        """Full board snapshot, for clients that missed a delta update."""
+        if not command.args:
+            return "Invalid format for get_board message.\n"
+        game_id = command.args[0]
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return f"Game {game_id} does not exist.\n"
+            return self.game_board_json(game_id)
+
+    def handle_join_game(self, conn, command):
+        try:
+            game_id, username = command.args
+        except ValueError:
+            return "Invalid format for join_game message.\n"
+
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return f"Game {game_id} does not exist.\n"
+
+            num_players = game_data[Game.NUM_PLAYERS]
+            # Checking for a free seat and taking it happen under the same lock, so two joiners can't both get it
+            if game_data[Game.FINISHED]:
+                return f"Game {game_id} is over. Cannot join.\n"
+            if username in game_data[Game.PLAYERS]:
+                if conn in game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]:
+                    return f"You are already in game {game_id}.\n"
+                # Back after a restart restored the game, or on a new connection: take the seat again
+                previous = self.games_data.seat_connection(username)
+                self.games_data.bind_player(username, game_id, conn)
+                connections = game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]
+                if previous is not None and previous in connections:
+                    connections.remove(previous)  # The seat's updates go to the new connection only
+                connections.append(conn)
+                return f"Joined game successfully!,{game_id},{num_players},.\n", self.game_board_json(game_id)
+            if len(game_data[Game.PLAYERS]) >= num_players:
+                return f"Game {game_id} is full. Cannot join.\n"
+            if not self.games_data.bind_player(username, game_id, conn):
+                return "You are already in a game. Finish or exit the current game before joining another one.\n"
+
+            # Add the player to the game
+            game_data[Game.PLAYERS].append(username)
+            game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].append(conn)
+            self.journal_event(game_data, "join", username)
+            if len(game_data[Game.PLAYERS]) >= num_players:
+                self.open_games.discard(game_id)
+                self.start_turn_clock(game_id)
+            # self.notify_spectators(f"Player {username} has joined game {game_id}.\n", game_id)
+
+            game_board_json = self.game_board_json(game_id)
+        # Both messages go out in a single send
+        return f"Joined game successfully!,{game_id},{num_players},.\n", game_board_json
+
+    def handle_observer_join_game(self, conn, command):
+        try:
+            game_id, username = command.args
+        except ValueError:
+            return "Invalid format for observer_join_game message.\n"
+
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return f"Game {game_id} does not exist.\n"
+
+            num_players = game_data[Game.NUM_PLAYERS]
+            game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].append(conn)
+            self.games_data.bind_spectator(conn, game_id)
+            # self.notify_spectators(f"Player {username} has joined game {game_id}.\n", game_id)
+
+            game_board_json = self.game_board_json(game_id)
+        return f"Joined game successfully!,{game_id},{num_players},.\n", game_board_json
+
+    def send_message(self, conn, message):
+        """Send one framed message to a single connection."""
+        conn.sendall(encode_frame(message))
+
+    def send_messages(self, conn, *messages):
+        """Send several framed messages to a single connection with one send call."""
+        conn.sendall(encode_frames(*messages))
+
     def get_available_games(self):
         try:
-            available_games = [game_id for game_id, game_data in self.games_data.items()
-                               if len(game_data['players']) < game_data['num_players']]
-            print(f"Available games: {available_games}")
-            return available_games
+            # Read from the open-seat index instead of walking every live game
+            return self.open_games.game_ids()
 
         except Exception as e:
             print(f"Error in get_available_games: {e}")
@@ -254,9 +639,11 @@ class TicTacToeServer:
 
     def get_all_available_games(self):
         try:
-            all_available_games = [game_id for game_id, game_data in self.games_data.items()]
-            print(f"Available games: {all_available_games}")
-            return all_available_games
+            game_ids = self.games_data.keys()
+            # Other workers' games are only known while they have a free seat
+            for games in list(self.remote_lobbies.values()):
+                game_ids.extend(games)
+            return game_ids
 
         except Exception as e:
             print(f"Error in get_available_games: {e}")
@@ -266,25 +653,25 @@ class TicTacToeServer:
         try:
             print(f"Received username: {username}, num_players: {num_players}")
             # Check if the user is already in a game
-            for game_id, game_data in self.games_data.items():
-                if username in game_data['players']:
-                    return "You are already in a game. Finish or exit the current game before creating a new one."
+            if self.games_data.game_of_user(username) is not None:
+                return "You are already in a game. Finish or exit the current game before creating a new one."
 
             if int(num_players) not in [2, 3, 4, 5]:
                 return "Invalid number of players. Please enter 2, 3, 4, or 5."
 
-            game_id = generate_token()
-
-            self.games_data[game_id] = {
-                Game.GAME_ID: game_id,
-                Game.NUM_PLAYERS: int(num_players),
-                Game.PLAYERS: [username],
-                Game.BOARD: [[' ' for _ in range((int(num_players) + 1))] for _ in
-                             range((int(num_players) + 1))],
-                Game.CURRENT_PLAYER: 0,
-                Game.SPECTATORS: [],
-                Game.PLAYERS_AND_SPECTATORS_CONNECTIONS: [user_connection]
-            }
+            # Draw new IDs until one is free; short tokens do collide once many games are live
+            game_id = generate_token(self.game_id_prefix)
+            game_data = new_game_data(game_id, int(num_players), username, user_connection, time.time())
+            while not self.games_data.add_if_absent(game_id, game_data):
+                game_id = generate_token(self.game_id_prefix)
+                game_data[Game.GAME_ID] = game_id
+            if not self.games_data.bind_player(username, game_id, user_connection):
+                # Lost a race with another create/join by the same user
+                self.games_data.remove(game_id)
+                return "You are already in a game. Finish or exit the current game before creating a new one."
+            with self.games_data.locked(game_id):
+                self.journal_event(game_data, "create", int(num_players), username, game_data[Game.CREATED_AT])
+            self.open_games.add(game_id, int(num_players))
             return f"Game created! Your game ID: {game_id} Num Players: {num_players}"
 
         except Exception as e:
@@ -297,37 +684,22 @@ class TicTacToeServer:
         self.row_column_size = (num_players + 1)
         self.current_player = self.players[0]
 
+    def finish_game(self, game_id):
+        """Mark a game as won or tied: no more moves, and it leaves the lobby. The caller holds the game's lock."""
+        self.games_data[game_id][Game.FINISHED] = True
+        self.open_games.discard(game_id)
+        self.turn_clock.cancel(game_id)
+
     def check_win(self, player_symbol, game_id):
-        board = self.games_data[game_id][Game.BOARD]
-        board_size = len(board)
-
-        # Check rows and columns for 3 in a row of the player's symbol
-        for i in range(board_size):
-            for j in range(board_size - 2):
-                if board[i][j] == board[i][j + 1] == board[i][j + 2] == player_symbol:
-                    return True
-                if board[j][i] == board[j + 1][i] == board[j + 2][i] == player_symbol:
-                    return True
-
-        # Check diagonals for player's symbol
-        for i in range(board_size - 2):
-            if board[i][i] == board[i + 1][i + 1] == board[i + 2][i + 2] == player_symbol:
-                return True
-            if board[i][board_size - 1 - i] == board[i + 1][board_size - 2 - i] == board[i + 2][
-                board_size - 3 - i] == player_symbol:
-                return True
-
-        return False
+        """Scan the whole board for a win. make_move uses check_move_wins, which only looks at the last move."""
+        return scan_for_win(self.games_data[game_id][Game.BOARD].to_rows(self.players_chars), player_symbol)
 
-    def check_tie(self, game_id):
-        board = self.games_data[game_id][Game.BOARD]
-        # Check if any cell in the board is still empty (indicating the game is not yet a draw)
-        for row in board:
-            if ' ' in row:  # Assuming ' ' represents an empty cell
-                return False
+    def check_move_wins(self, game_id, row, col, player_index):
+        return self.games_data[game_id][Game.BOARD].is_winning_move(row, col, player_index)
 
-        # If no cell is empty and no player has won, it's a draw
-        return True
+    def check_tie(self, game_id):
+        # The board is a draw once every cell is filled and no player has won
+        return self.games_data[game_id][Game.BOARD].is_full()
 
     def get_next_player(self, game_id):
         # Retrieve the current player index
@@ -342,10 +714,41 @@ class TicTacToeServer:
 
         # Update the game data with the index of the next player
         self.games_data[game_id][Game.CURRENT_PLAYER] = next_index
+        self.start_turn_clock(game_id)
 
         # Return the username of the next player
         return next_index
 
+    def start_turn_clock(self, game_id):
+        """(Re)start the clock of the player to move, once every seat is taken. The caller holds the game's lock."""
+        game_data = self.games_data[game_id]
+        if len(game_data[Game.PLAYERS]) < game_data[Game.NUM_PLAYERS]:
+            self.turn_clock.cancel(game_id)  # Waiting for players; nobody's clock runs
+        else:
+            self.turn_clock.schedule(game_id, self.turn_timeout, self.turn_timed_out, game_id)
+
+    def turn_timed_out(self, game_id):
+        """A turn clock ran out (on the turn clock's thread): the player to move forfeits, or is skipped."""
+        with self.games_data.locked(game_id) as game_data:
+            # A move may have restarted the clock while this one was going off
+            if game_data is None or game_data[Game.FINISHED] or self.turn_clock.pending(game_id):
+                return
+            players = game_data[Game.PLAYERS]
+            if game_data[Game.CURRENT_PLAYER] >= len(players):
+                return
+            username = players[game_data[Game.CURRENT_PLAYER]]
+            if self.turn_timeout_policy == "skip":
+                self.get_next_player(game_id)
+                self.journal_event(game_data, "skip")
+                self.broadcast_to_all_clients_in_game(f"Timeout: {username} did not move in time and was skipped.",
+                                                      game_id)
+            else:
+                self.finish_game(game_id)
+                self.journal_event(game_data, "forfeit")
+                self.broadcast_to_all_clients_in_game(f"Timeout: {username} did not move in time and forfeits "
+                                                      f"the game.", game_id)
+                self.record_results(game_id, loser=username)
+
     def is_players_turn(self, game_id, username):
         # קבלת האינדקס של השחקן הנוכחי
         current_player_index = self.games_data[game_id][Game.CURRENT_PLAYER]
@@ -371,7 +774,7 @@ class TicTacToeServer:
             # Loop through each spectator and send them the message
             for spectator in spectators:
                 try:
-                    spectator.send(message.encode('utf-8'))  # Assuming 'utf-8' as the FORMAT
+                    self.send_message(spectator, message)
                 except Exception as e:
                     print(f"Error sending message to spectator: {e}")
                     # Optionally, handle the exception (e.g., logging or removing the spectator from the list)
@@ -379,47 +782,116 @@ class TicTacToeServer:
             print(f"No game data found for game_id: {game_id}")
 
     def remove_player_from_game(self, username):
-        # Iterate through all games and remove the player
-        for game_id, game_data in self.games_data.items():
-            if username in game_data[Game.PLAYERS]:
-                game_data[Game.PLAYERS].remove(username)
-                # Notify other players/spectators about the player's exit
-                self.notify_spectators(f"Player {username} has left game {game_id}.\n")
-                # If the game is now empty, remove it from game data
-                if not game_data[Game.PLAYERS]:
-                    del self.games_data[game_id]
-                    print(f"Game {game_id} removed from game data.")
-                    break  # Exit the loop after removing the player from the game and the game is now empty
-                else:
-                    print(f"Player {username} removed from game {game_id}.")
-                    break  # Exit the loop after removing the player from the game
+        # Find the player's game through the user index
+        game_id = self.games_data.game_of_user(username)
+        if game_id is None:
+            return
+        with self.games_data.locked(game_id) as game_data:
+            self.games_data.unbind_player(username, game_id)
+            if game_data is None or username not in game_data[Game.PLAYERS]:
+                return
+            game_data[Game.PLAYERS].remove(username)
+            if not game_data[Game.FINISHED]:
+                self.journal_event(game_data, "leave", username)
+            # Notify other players/spectators about the player's exit
+            self.notify_spectators(f"Player {username} has left game {game_id}.\n", game_id)
+            # If the game is now empty, remove it from game data
+            if not game_data[Game.PLAYERS]:
+                self.games_data.remove(game_id)
+                self.open_games.discard(game_id)
+                self.turn_clock.cancel(game_id)
+                print(f"Game {game_id} removed from game data.")
+            else:
+                if not game_data[Game.FINISHED]:
+                    self.open_games.add(game_id, game_data[Game.NUM_PLAYERS])  # A seat just opened up
+                    self.start_turn_clock(game_id)  # Stops it until the seat is taken again
+                print(f"Player {username} removed from game {game_id}.")
+
+    def handle_disconnect(self, conn):
+        """Release everything a closed connection held: its players' seats and its place in game broadcasts."""
+        for game_id, username in self.games_data.drop_connection(conn).items():
+            if username is not None and self.games_data.game_of_user(username) == game_id:
+                self.remove_player_from_game(username)
+            with self.games_data.locked(game_id) as game_data:
+                if game_data is not None and conn in game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]:
+                    game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS].remove(conn)
+
+    def game_board_json(self, game_id):
+        """Full snapshot of the board, in the {'game_board': [[...], ...]} JSON shape clients expect.
+
+        'seq' is the number of moves played so far; clients apply deltas with a higher sequence number on top.
+        """
+        game_data = self.games_data[game_id]
+        return json.dumps({'game_board': game_data[Game.BOARD].to_rows(self.players_chars),
+                           'seq': game_data[Game.SEQUENCE]})
+
+    def move_delta_json(self, game_id, row, col, player_index):
+        """A single move as a delta update: the changed cell, whose turn it is now, and the sequence number."""
+        game_data = self.games_data[game_id]
+        next_player = None
+        if not game_data[Game.FINISHED] and game_data[Game.CURRENT_PLAYER] < len(game_data[Game.PLAYERS]):
+            next_player = game_data[Game.PLAYERS][game_data[Game.CURRENT_PLAYER]]
+        return json.dumps({'delta': {'row': row, 'col': col, 'mark': self.players_chars[player_index],
+                                     'next_player': next_player, 'seq': game_data[Game.SEQUENCE]}})
+
+    def send_move_to_all_clients(self, game_id, row, col, player_index):
+        """Send a move to all connected clients as a delta instead of the whole board."""
+        self.broadcast_to_all_clients_in_game(self.move_delta_json(game_id, row, col, player_index), game_id)
 
     def send_game_board_to_all_clients(self, game_id):
         """Serialize the game board to JSON and send it to all connected clients."""
-        game_board = self.games_data[game_id][Game.BOARD]  # Get the game board data
         # Serialize the game board here only once
-        game_board_json = json.dumps({'game_board': game_board})
-        self.broadcast_to_all_clients_in_game(game_board_json, game_id)
+        self.broadcast_to_all_clients_in_game(self.game_board_json(game_id), game_id)
+
+    def resync_connection(self, conn):
+        """Full board snapshots, one frame per game, for a slow client that had queued updates dropped."""
+        frames = []
+        for game_id in self.games_data.games_of_connection(conn):
+            with self.games_data.locked(game_id) as game_data:
+                if game_data is not None:
+                    frames.append(encode_frame(self.game_board_json(game_id)))
+        return frames
 
     def broadcast_to_all_clients_in_game(self, game_board_json, game_id):
         """Send a JSON-formatted message with the game board to all players and spectators in a game."""
-        if game_id in self.games_data:
-            connections = self.games_data[game_id][Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return
+            self.publish_to_relays(game_data, game_board_json)
+            connections = game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]
             failed_connections = []  # To track connections that fail to receive the message
+            # Encoded once; every connection sends these same buffers
+            frame = SharedFrame(game_board_json)
 
             for conn in connections:
                 try:
-                    # Send the JSON string as it is
-                    conn.send(game_board_json.encode('utf-8'))
+                    conn.sendall(frame)
                 except Exception as e:
                     failed_connections.append(conn)
                     # Handle the failed connections as needed
+            frame_counters.add(sent=len(connections) - len(failed_connections))
 
             # Remove failed connections if any
             for conn in failed_connections:
                 connections.remove(conn)
                 # Further handling for the disconnected clients
 
+    def publish_to_relays(self, game_data, message):
+        """Pass a broadcast on to the relay nodes following the game. The caller holds the game's lock."""
+        if self.relay_bus is not None:
+            game_data[Game.RELAY_SEQ] += 1
+            self.relay_bus.publish(game_data[Game.GAME_ID], game_data[Game.RELAY_SEQ], message)
+
+    def relay_snapshot(self, game_id):
+        """(seq, state) of a game for a relay node subscribing or catching up: state is what a spectator
+        joining here would see, or None if there is no such game. Broadcasts up to seq are already in it."""
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return 0, None
+            return game_data[Game.RELAY_SEQ], {'num_players': game_data[Game.NUM_PLAYERS],
+                                               'game_board': game_data[Game.BOARD].to_rows(self.players_chars),
+                                               'seq': game_data[Game.SEQUENCE]}
+
     # def broadcast_to_specific_client_in_game(self, game_id, connection):
     #     game_board = self.games_data[game_id][Game.BOARD]  # Get the game board data
     #     # Serialize the game board here only once
@@ -428,17 +900,22 @@ class TicTacToeServer:
 
     def broadcast_a_message_to_all_clients_in_game(self, game_board_message, game_id):
         """Send a regular string message with the game board to all players and spectators in a game."""
-        if game_id in self.games_data:
-            connections = self.games_data[game_id]['players_and_spectators_connections']
+        with self.games_data.locked(game_id) as game_data:
+            if game_data is None:
+                return
+            self.publish_to_relays(game_data, game_board_message)
+            connections = game_data[Game.PLAYERS_AND_SPECTATORS_CONNECTIONS]
             failed_connections = []  # To track connections that fail to receive the message
+            # Encoded once; every connection sends these same buffers
+            frame = SharedFrame(game_board_message)
 
             for conn in connections:
                 try:
-                    # Send the string message as it is
-                    conn.send(game_board_message.encode('utf-8'))  # Assuming the connection send method accepts strings
+                    conn.sendall(frame)
                 except Exception as e:
                     failed_connections.append(conn)
                     # Handle the failed connections as needed
+            frame_counters.add(sent=len(connections) - len(failed_connections))
 
             # Remove failed connections if any
             for conn in failed_connections:
@@ -446,6 +923,12 @@ class TicTacToeServer:
                 # Further handling for the disconnected clients
 
     def start_server(self):
+        if self.cluster is not None:
+            # Every worker listens on the same port and the kernel spreads new connections across them. A worker
+            # the supervisor restarts must also bind past its predecessor's connections still in TIME_WAIT
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.start_cluster(self.serve_connection)
         self.server_socket.bind(ADDR)
         print(f"[LISTENING] Server is listening on {HOST}:{PORT}")
         self.server_socket.listen()
@@ -453,14 +936,83 @@ class TicTacToeServer:
         while True:
             connection, address = self.server_socket.accept()
             print(f"[NEW CONNECTION] {address} connected.")
-            # Generate a unique token for the client
-            token = generate_token()
-            self.players_tokens[token] = connection
-            # Start the client thread
-            client_thread = threading.Thread(target=self.handle_client, args=(connection, token))
-            client_thread.start()
+            self.serve_connection(connection)
+
+    def serve_connection(self, connection, messages=(), leftover=b""):
+        """Serve a connection from its own thread: one just accepted, or one another worker handed over."""
+        connection.setblocking(True)  # A connection from an asyncio worker arrives non-blocking
+        # Like asyncio's transports: a move's update must not sit in Nagle's buffer behind the previous one
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Number the connection; random tokens would collide once thousands of clients are connected
+        token = next(self.connection_ids)
+        # Sends go through a queue with its own writer thread, so no handler waits on this client's socket.
+        # With the reader thread below that makes two threads per client; --mode asyncio needs none
+        connection = QueuedConnection(connection, self.send_high_water_mark, self.slow_consumer_policy,
+                                      self.resync_connection)
+        self.players_tokens[token] = connection
+        # Start the client thread
+        client_thread = threading.Thread(target=self.handle_client, args=(connection, token, messages, leftover))
+        client_thread.start()
 
 
 if __name__ == '__main__':
-    server = TicTacToeServer()
-    server.start_server()
+    parser = argparse.ArgumentParser(description="Multi players Tic Tac Toe server")
+    parser.add_argument("--mode", choices=SERVER_MODES, default="threaded",
+                        help="threaded: a reader and a writer thread per connection, asyncio: a single event loop "
+                             "(scales to many more connections)")
+    parser.add_argument("--send-high-water", type=int, default=HIGH_WATER_MARK,
+                        help="bytes a client may have queued before it is treated as a slow consumer")
+    parser.add_argument("--slow-consumer", choices=SLOW_CONSUMER_POLICIES, default=SLOW_CONSUMER_POLICY,
+                        help="evict: disconnect slow clients, resync: drop their backlog and send a full board")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="seconds a client may stay quiet before it is pinged")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds without a word from a client before it is disconnected; 0 to keep them")
+    parser.add_argument("--db", choices=BACKENDS, default=SQLConstants.BACKEND,
+                        help="storage backend, defaults to SQLConstants.BACKEND")
+    parser.add_argument("--sqlite-path", default=SQLConstants.SQLITE_PATH, help="database file for --db sqlite")
+    parser.add_argument("--journal-dir", default=JOURNAL_DIR,
+                        help="where live games are journaled and restored from on startup; empty to turn it off")
+    parser.add_argument("--turn-timeout", type=float, default=MOVE_TIMEOUT,
+                        help="seconds a player has for each turn")
+    parser.add_argument("--on-turn-timeout", choices=TURN_TIMEOUT_POLICIES, default=TURN_TIMEOUT_POLICY,
+                        help="forfeit: the player who ran out of time loses, skip: the next player moves instead")
+    parser.add_argument("--relay-port", type=int, default=0,
+                        help="publish every game's updates for relay nodes on this port (one more per worker); "
+                             "0 to turn it off")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port, each owning a shard of the games")
+    parser.add_argument("--worker-id", type=int, help=argparse.SUPPRESS)  # Set by the cluster supervisor
+    parser.add_argument("--run-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.worker_id is None:
+        run_cluster(args.workers, sys.argv[1:])
+        sys.exit(0)
+    cluster = None
+    if args.worker_id is not None:
+        cluster = ClusterNode(args.worker_id, args.workers, args.run_dir)
+        if args.journal_dir:
+            args.journal_dir = os.path.join(args.journal_dir, f"worker-{args.worker_id}")
+
+    relay_bus = None
+    if args.relay_port:
+        relay_bus = TcpPublisher(HOST, args.relay_port + (args.worker_id or 0))
+
+    backend = SQLiteBackend(args.sqlite_path) if args.db == "sqlite" else create_backend(args.db, SQLConstants)
+    server = TicTacToeServer(backend=backend, journal_dir=args.journal_dir, turn_timeout=args.turn_timeout,
+                             turn_timeout_policy=args.on_turn_timeout, heartbeat_interval=args.heartbeat_interval,
+                             idle_timeout=args.idle_timeout, cluster=cluster, relay_bus=relay_bus)
+    server.send_high_water_mark = args.send_high_water
+    server.slow_consumer_policy = args.slow_consumer
+    # Turn SIGTERM into a normal exit, so queued database writes are flushed below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args.mode == "asyncio":
+            AsyncServerEngine(server, ADDR).run()
+        else:
+            server.start_server()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+
+TICK = 0.1  # Seconds per tick; timers fire at most one tick late
+SLOTS = 256  # Slots per level
+LEVELS = 3  # 256 ticks, 256 ** 2 ticks (~1.8 hours) and 256 ** 3 ticks (~19 days) at 0.1 s
+
+
+class Timer:
+    __slots__ = ("deadline", "key", "callback", "args", "active")
+
+    def __init__(self, deadline, key, callback, args):
+        self.deadline = deadline  # In ticks
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+
+class TimerWheel:
+    """Hierarchical timing wheel: one thread keeps any number of timers, each keyed, e.g. by game.
+
+    Level 0 has a slot per tick; each higher level has a slot per whole turn of the level below. A timer
+    goes into the lowest level whose range covers its deadline, and moves down a level (cascades) as the
+    wheel turns, so scheduling, cancelling and firing are O(1) amortized however many timers are pending.
+    Cancelled timers are only marked and get dropped when their slot comes up.
+
+    Callbacks run on the wheel's thread, one after another, so they should be short.
+    """
+
+    def __init__(self, tick=TICK, slots=SLOTS, levels=LEVELS, name="timer-wheel"):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.timers = {}  # key -> its active Timer
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.current_tick = 0  # The next tick to process
+        self.fired = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def schedule(self, key, delay, callback, *args):
+        """Call callback(*args) in delay seconds, replacing the timer already scheduled under key, if any."""
+        deadline = math.ceil((time.monotonic() - self.started + delay) / self.tick)
+        with self.lock:
+            previous = self.timers.get(key)
+            if previous is not None:
+                previous.active = False
+            timer = Timer(deadline, key, callback, args)
+            self.timers[key] = timer
+            self.place(timer)
+        return timer
+
+    def cancel(self, key):
+        with self.lock:
+            timer = self.timers.pop(key, None)
+            if timer is not None:
+                timer.active = False
+
+    def pending(self, key):
+        """Whether a timer is scheduled under key and hasn't fired yet."""
+        return key in self.timers
+
+    def __len__(self):
+        return len(self.timers)
+
+    def place(self, timer):
+        ticks = max(timer.deadline - self.current_tick, 0)
+        span = 1
+        for level in range(self.levels):
+            if ticks < span * self.slots or level == self.levels - 1:
+                deadline = min(max(timer.deadline, self.current_tick), self.current_tick + span * self.slots - 1)
+                self.wheels[level][(deadline // span) % self.slots].append(timer)
+                return
+            span *= self.slots
+
+    def advance(self):
+        """Process one tick. Returns the timers that expired."""
+        with self.lock:
+            tick = self.current_tick
+            if tick % self.slots == 0:
+                # Level 0 has come full circle: move the next slot of each level above down to the levels below
+                span = self.slots
+                for level in range(1, self.levels):
+                    index = (tick // span) % self.slots
+                    cascading = self.wheels[level][index]
+                    self.wheels[level][index] = []
+                    for timer in cascading:
+                        if timer.active:
+                            self.place(timer)
+                    if index != 0:
+                        break
+                    span *= self.slots
+            index = tick % self.slots
+            slot = self.wheels[0][index]
+            self.wheels[0][index] = []
+            self.current_tick = tick + 1
+            expired = []
+            for timer in slot:
+                if not timer.active:
+                    continue
+                if timer.deadline > tick:
+                    self.place(timer)  # Clamped to the top level's range; not due yet
+                    continue
+                timer.active = False
+                del self.timers[timer.key]
+                expired.append(timer)
+            return expired
+
+    def run(self):
+        while not self.stopped.is_set():
+            due = int((time.monotonic() - self.started) / self.tick)
+            while self.current_tick <= due:
+                for timer in self.advance():
+                    self.fired += 1
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception as e:
+                        print(f"Error in timer {timer.key}: {e}")
+            self.stopped.wait(self.started + (self.current_tick * self.tick) - time.monotonic())
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -5,4 +5,10 @@ class Game:
     PLAYERS= "players"
     BOARD= "board"
     CURRENT_PLAYER= "current_player"
-    SPECTATORS= "spectators"
\ No newline at end of file
+    SPECTATORS= "spectators"
+    FINISHED= "finished"
+    SEQUENCE= "sequence"
+    MOVES= "moves"
+    CREATED_AT= "created_at"
+    JOURNAL_SEQ= "journal_seq"
+    RELAY_SEQ= "relay_seq"
@@ -1,72 +1,143 @@
-import hashlib
+import json
 import secrets
-import sqlite3
-import mysql.connector
+import threading
+from contextlib import contextmanager
+
+from sql.backends import create_backend
+from sql.connection_pool import POOL_SIZE, ConnectionPool
+from sql.password_hasher import PasswordHasher, PasswordHasherBusy
 from sql.sql_constants import SQLConstants
 from sql.sql_queries import *
+from sql.user_cache import UserCache
+
+STREAM_CHUNK_SIZE = 1000  # Rows fetched per round trip when streaming a full table
+IN_QUERY_CHUNK_SIZE = 500  # Values per IN (...) lookup
 
 
 class SQLClient:
-    def __init__(self):
-        self.host = SQLConstants.HOST
-        self.user = SQLConstants.USER
-        self.password = SQLConstants.PASSWORD
-        self.database = SQLConstants.DATABASE
-        self.conn = self.create_connection()
-        self.cur = self.conn.cursor(buffered=True)
+    def __init__(self, pool_size=POOL_SIZE, backend=None):
+        """pool_size > 0 gives every operation its own pooled connection and cursor; 0 shares a single one.
+
+        backend defaults to the one named by SQLConstants.BACKEND ("mysql" or "sqlite"), see sql/backends.py.
+        """
+        self.backend = backend or create_backend(SQLConstants.BACKEND, SQLConstants)
+        self.pool = None
+        self.conn = None
+        self.cur = None
+        self.lock = threading.RLock()  # Serializes operations on the shared connection when there is no pool
+        self.user_ids = UserCache()  # username -> username_id; a user's id never changes after registration
+        self.hasher = PasswordHasher()  # scrypt in worker processes, so hashing never holds up other clients
+        if pool_size:
+            self.pool = ConnectionPool(self.create_connection, pool_size, is_healthy=self.backend.is_healthy,
+                                       reconnect_errors=self.backend.reconnect_errors)
+        else:
+            self.conn = self.create_connection()
+            self.cur = self.backend.cursor(self.conn)
         self.create_tables()
 
     def create_connection(self):
         """Create a database connection."""
         try:
-            conn = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            if conn.is_connected():
-                print("MySQL connection is established.")
+            conn = self.backend.connect()
+            if conn is not None:
+                print(f"{self.backend.name} connection is established.")
                 return conn
             else:
                 print("Connection failed.")
                 return None
-        except mysql.connector.Error as e:
-            print(f"Error connecting to MySQL database: {e}")
+        except self.backend.Error as e:
+            print(f"Error connecting to the {self.backend.name} database: {e}")
             return None
 
-    def close_connection(self):
-        """Close the database connection."""
-        if self.conn.is_connected():
-            self.conn.close()
-            print("MySQL connection is closed.")
+    @contextmanager
+    def cursor(self, streaming=False):
+        """A buffered cursor for one operation; committed when the block ends, rolled back if it raises.
+
+        streaming=True gives an unbuffered (server-side) cursor instead, which fetches rows as they are read.
+        """
+        make_cursor = self.backend.streaming_cursor if streaming else self.backend.cursor
+        if self.pool is None:
+            with self.lock:
+                if not streaming:
+                    yield from self.run_transaction(self.conn, self.cur)
+                    return
+                cur = make_cursor(self.conn)
+                try:
+                    yield from self.run_transaction(self.conn, cur)
+                finally:
+                    cur.close()
+            return
+        with self.pool.connection() as conn:
+            cur = make_cursor(conn)
+            try:
+                yield from self.run_transaction(conn, cur)
+            finally:
+                cur.close()
+
+    def stream(self, query, params=(), chunk_size=STREAM_CHUNK_SIZE):
+        """Yield the rows of a query, fetched chunk_size at a time over a server-side cursor.
+
+        Only one chunk is in memory at once. The generator holds a connection until it is exhausted or closed.
+        """
+        with self.cursor(streaming=True) as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
+
+    @staticmethod
+    def run_transaction(conn, cur):
+        try:
+            yield cur
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass  # The connection is gone; the pool replaces it
+            raise
+        # Also ends read-only transactions, so a pooled connection never reads from an old snapshot
+        conn.commit()
 
     def create_tables(self):
         try:
             self.create_users_table()
             self.create_leaderboard_table()
             self.create_games_table()
+            self.apply_migrations()
             print("Tables created successfully.")
-        except sqlite3.Error as e:
+        except self.backend.Error as e:
             print(f"Error,Tables not created successfully: {e}")
             return None
 
     def create_games_table(self):
         """Create the games table if it doesn't exist, with a foreign key to the users table."""
-        self.cur.execute(CREATE_GAME_TABLE_SQL)
-        self.conn.commit()
+        with self.cursor() as cur:
+            cur.execute(CREATE_GAME_TABLE_SQL)
 
     def create_users_table(self):
         """Create a placeholder users table for the foreign key relationship."""
 
-        self.cur.execute(CREATE_USER_SQL)
-        self.conn.commit()
+        with self.cursor() as cur:
+            cur.execute(CREATE_USER_SQL)
 
     def create_leaderboard_table(self):
         """Simulate creating the leaderboard table with a foreign key."""
 
-        self.cur.execute(CREATE_LEADERBOARD_TABLE_SQL)
-        self.conn.commit()
+        with self.cursor() as cur:
+            cur.execute(CREATE_LEADERBOARD_TABLE_SQL)
+
+    def apply_migrations(self):
+        """Add the indexes in MIGRATIONS to tables created before them."""
+        for name, statement in MIGRATIONS:
+            try:
+                with self.cursor() as cur:
+                    cur.execute(statement)
+                print(f"Migration applied: {name}.")
+            except self.backend.Error as e:
+                if not self.backend.is_already_applied(e):
+                    print(f"Error applying migration {name}: {e}")
 
     def generate_token(self):
         """Generate a secure random token."""
@@ -74,40 +145,52 @@ class SQLClient:
 
     def insert_user(self, username, password):
         """Insert a new user into the users table with a hashed password and generated token."""
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
         token = self.generate_token()
-        parameters = (username, hashed_password, token)
-
-        # Check if the username already exists
-        self.cur.execute("SELECT username FROM users WHERE username = %s", (username,))
-        if self.cur.fetchone():
-            # If the username exists, print error and return False
-            print(f"Error inserting user: Username {username} already exists.")
-            return False
 
         try:
-            self.cur.execute("INSERT INTO users (username, password, token) VALUES (%s, %s, %s)", parameters)
-            self.conn.commit()
+            with self.cursor() as cur:
+                # Check if the username already exists
+                cur.execute("SELECT username FROM users WHERE username = %s", (username,))
+                if cur.fetchone():
+                    # If the username exists, print error and return False
+                    print(f"Error inserting user: Username {username} already exists.")
+                    return False
+
+            # Hash without holding a database connection; the UNIQUE username still catches a racing registration
+            parameters = (username, self.hasher.hash(password), token)
+            with self.cursor() as cur:
+                cur.execute("INSERT INTO users (username, password, token) VALUES (%s, %s, %s)", parameters)
+                username_id = cur.lastrowid
+            self.user_ids.put(username, username_id)
             print("User inserted successfully.")
             return True
-        except mysql.connector.IntegrityError as e:
+        except PasswordHasherBusy as e:
+            print(f"Error inserting user: {e}")
+        except self.backend.IntegrityError as e:
             print(f"Error inserting user (possible duplicate): {e}")
-        except mysql.connector.Error as e:
+        except self.backend.Error as e:
             print(f"Error inserting user: {e}")
         return False
 
     def authenticate_user(self, username, password):
-        """Authenticate a user with a username and password."""
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        """Authenticate a user with a username and password.
 
+        A password still stored as an old unsalted sha256 hash is rehashed with scrypt on a successful login.
+        """
         try:
-            query = "SELECT password FROM users WHERE username = %s"
-            self.cur.execute(query, (username,))
-            row = self.cur.fetchone()
+            query = "SELECT password, username_id FROM users WHERE username = %s"
+            with self.cursor() as cur:
+                cur.execute(query, (username,))
+                row = cur.fetchone()
 
             if row:
                 stored_password = row[0]
-                if stored_password == hashed_password:
+                matches, needs_rehash = self.hasher.verify(password, stored_password)
+                if matches:
+                    if needs_rehash:
+                        self.rehash_password(username, password, stored_password)
+                    # The player's results will need their id once the game ends
+                    self.user_ids.put(username, row[1])
                     print("Authentication successful!")
                     return True, "success"
                 else:
@@ -116,32 +199,55 @@ class SQLClient:
             else:
                 print(f"Authentication failed: Username {username} not found.")
                 return False, "failure"
-        except sqlite3.Error as e:
+        except PasswordHasherBusy as e:
+            print(f"Authentication postponed: {e}")
+            return False, "Server busy, please try again."
+        except self.backend.Error as e:
             print(f"Database error during authentication: {e}")
             return False, "Database error during authentication."
         except Exception as e:
             print(f"Unexpected error during authentication: {e}")
             return False, "Unexpected error during authentication."
 
+    def rehash_password(self, username, password, old_hash):
+        """Replace an outdated hash. Only if it is unchanged, so a concurrent password change wins."""
+        try:
+            new_hash = self.hasher.hash(password)
+            with self.cursor() as cur:
+                cur.execute("UPDATE users SET password = %s WHERE username = %s AND password = %s",
+                            (new_hash, username, old_hash))
+            print(f"Upgraded the password hash of {username}.")
+        except Exception as e:
+            print(f"Could not upgrade the password hash of {username}: {e}")
+
     def close_connection(self):
-        """Close the database connection."""
-        if self.conn:
+        """Close the database connection, or every pooled one."""
+        self.hasher.close()
+        if self.pool is not None:
+            self.pool.close()
+            print(f"{self.backend.name} connection pool is closed.")
+        elif self.conn:
             self.conn.close()
-            print("SQLite connection is closed.")
+            print(f"{self.backend.name} connection is closed.")
 
     def get_user_id(self, username):
+        username_id = self.user_ids.get(username)
+        if username_id is not None:
+            return username_id
         try:
             # Prepare the SQL query
             query = "SELECT username_id FROM users WHERE username = %s"
 
-            # Execute the SQL query
-            self.cur.execute(query, (username,))
+            with self.cursor() as cur:
+                # Execute the SQL query
+                cur.execute(query, (username,))
 
-            # Fetch the result
-            result = self.cur.fetchone()
+                # Fetch the result
+                result = cur.fetchone()
 
             # If we have a result, return the username_id
             if result:
+                self.user_ids.put(username, result[0])
                 return result[0]  # result[0] is the username_id since it's the only column we selected
             else:
                 # Handle the case where the username does not exist
@@ -160,91 +266,147 @@ class SQLClient:
                 print("User not found.")
                 return  # Exit the function if the user is not found
 
-            # Now we have the username_id, we can check if the user exists in the leaderboard
-            query = "SELECT wins, losses, draws FROM leaderboard WHERE username_id = %s"
-            self.cur.execute(query, (username_id,))
-            row = self.cur.fetchone()
+            # Determine which count to increment
+            column = {'win': 'wins', 'loss': 'losses', 'tie': 'draws'}.get(result)
+            if column is None:
+                print("Invalid result.")
+                return
 
-            if row:
-                # Unpack the current counts
-                wins, losses, draws = row
-                # Determine which count to increment
-                if result == 'win':
-                    wins += 1
-                elif result == 'loss':
-                    losses += 1
-                elif result == 'tie':
-                    draws += 1
-                else:
-                    print("Invalid result.")
-                    return
+            with self.cursor() as cur:
+                # Increment in place, so concurrent results for the same user can't overwrite each other
+                update_query = f"UPDATE leaderboard SET {column} = {column} + 1 WHERE username_id = %s"
+                cur.execute(update_query, (username_id,))
+                if cur.rowcount == 0:
+                    # If the user doesn't exist in the leaderboard, create a new record
+                    insert_query = "INSERT INTO leaderboard (username_id, wins, losses, draws) VALUES (%s, %s, %s, %s)"
+                    cur.execute(insert_query, (username_id, int(result == 'win'), int(result == 'loss'),
+                                               int(result == 'tie')))
+                cur.execute("SELECT wins, losses, draws FROM leaderboard WHERE username_id = %s", (username_id,))
+                wins, losses, draws = cur.fetchone()
 
-                # Update the leaderboard with the new counts
-                update_query = "UPDATE leaderboard SET wins = %s, losses = %s, draws = %s WHERE username_id = %s"
-                self.cur.execute(update_query, (wins, losses, draws, username_id))
-            else:
-                # If the user doesn't exist in the leaderboard, create a new record
-                wins, losses, draws = (1, 0, 0) if result == 'win' else (0, 1, 0) if result == 'loss' else (
-                0, 0, 1) if result == 'tie' else (0, 0, 0)
-                if result not in ('win', 'loss', 'tie'):
-                    print("Invalid result.")
-                    return
-                insert_query = "INSERT INTO leaderboard (username_id, wins, losses, draws) VALUES (%s, %s, %s, %s)"
-                self.cur.execute(insert_query, (username_id, wins, losses, draws))
-
-            # Commit the changes
-            self.conn.commit()
             print(f"Updated {username}'s record: {wins} wins, {losses} losses, {draws} draws.")
         except Exception as e:
             print(f"Error updating leaderboard: {e}")
 
-    def load_leaderboard_data(self):
-        """Retrieve leaderboard data or return empty dictionary if error or empty."""
-        try:
-            # Selecting username_id, wins, losses, and draws from the leaderboard
-            query = """
-            SELECT username_id, wins, losses, draws
-            FROM leaderboard
-            ORDER BY wins DESC, draws DESC, losses
-            """
-            self.cur.execute(query)
-            rows = self.cur.fetchall()
-            if rows:
-                leaderboard_data = [
-                    {"username_id": row[0], "wins": row[1], "losses": row[2], "draws": row[3]}
-                    for row in rows
-                ]
-                return {"success": True, "data": leaderboard_data}
-            else:
-                return {}  # Empty result
-        except sqlite3.Error:
-            return {}  # Error occurred
+    def record_results(self, results):
+        """Apply a batch of (username, 'win' | 'loss' | 'tie') game results in one transaction.
 
-    def load_user_data(self):
-        """Retrieve user data or return empty dictionary if empty/error."""
-        try:
-            query = "SELECT username_id, username, token FROM users"
-            self.cur.execute(query)
-            rows = self.cur.fetchall()
-            if rows:
-                user_data = [{"username_id": row[0], "username": row[1], "token": row[2]} for row in rows]
-                return {"success": True, "data": user_data}
-            else:
-                return {}  # Empty result
-        except sqlite3.Error:
-            return {}  # Error occurred
+        Results are summed per user first, so the round trips depend on the batch, not on how many results
+        it holds. Raises on database errors so the caller can retry the batch.
+        """
+        totals = {}
+        for username, result in results:
+            column = {'win': 0, 'loss': 1, 'tie': 2}.get(result)
+            if column is None:
+                print(f"Invalid result {result} for {username}.")
+                continue
+            totals.setdefault(username, [0, 0, 0])[column] += 1
+        if not totals:
+            return
 
-    def load_games_data(self):
-        """Retrieve games data or return empty dictionary if empty/error."""
-        try:
-            query = "SELECT game_id, username_id, result, timestamp FROM games"
-            self.cur.execute(query)
-            rows = self.cur.fetchall()
+        usernames = list(totals)
+        with self.cursor() as cur:
+            user_ids = self.resolve_user_ids(cur, usernames)
+            for username in usernames:
+                if username not in user_ids:
+                    print(f"User {username} not found, dropping their results.")
+            ids = [user_ids[username] for username in usernames if username in user_ids]
+            if not ids:
+                return
+
+            id_placeholders = ", ".join(["%s"] * len(ids))
+            cur.execute(f"SELECT username_id FROM leaderboard WHERE username_id IN ({id_placeholders})", ids)
+            existing = {row[0] for row in cur.fetchall()}
+            updates = []
+            inserts = []
+            for username in usernames:
+                username_id = user_ids.get(username)
+                if username_id is None:
+                    continue
+                wins, losses, draws = totals[username]
+                if username_id in existing:
+                    updates.append((wins, losses, draws, username_id))
+                else:
+                    inserts.append((username_id, wins, losses, draws))
+            if updates:
+                cur.executemany("UPDATE leaderboard SET wins = wins + %s, losses = losses + %s, draws = draws + %s "
+                                "WHERE username_id = %s", updates)
+            if inserts:
+                cur.executemany("INSERT INTO leaderboard (username_id, wins, losses, draws) VALUES (%s, %s, %s, %s)",
+                                inserts)
+        print(f"Recorded {len(results)} results for {len(ids)} players.")
+
+    def resolve_user_ids(self, cur, usernames):
+        """{username: username_id} for the given users, from the cache and one query for the rest.
+
+        Unknown users are left out.
+        """
+        user_ids = {}
+        for username in usernames:
+            username_id = self.user_ids.get(username)
+            if username_id is not None:
+                user_ids[username] = username_id
+        missing = list({username for username in usernames if username not in user_ids})
+        # In chunks, to stay under the database's limit on parameters per statement
+        for start in range(0, len(missing), IN_QUERY_CHUNK_SIZE):
+            chunk = missing[start:start + IN_QUERY_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cur.execute(f"SELECT username, username_id FROM users WHERE username IN ({placeholders})", chunk)
+            for username, username_id in cur.fetchall():
+                user_ids[username] = username_id
+                self.user_ids.put(username, username_id)
+        return user_ids
+
+    def record_games(self, games):
+        """Write a batch of finished games to the games table in one transaction, one row per player.
+
+        Each game is (game_token, [(username, mark, result), ...], moves, duration_ms), moves being
+        [[row, col, mark], ...] in play order. The rows go out in one executemany, which mysql.connector sends
+        as a single multi-row INSERT. Raises on database errors so the caller can retry the batch.
+        """
+        if not games:
+            return
+        with self.cursor() as cur:
+            user_ids = self.resolve_user_ids(cur, [username for _, players, _, _ in games
+                                                   for username, _, _ in players])
+            rows = []
+            for game_token, players, moves, duration_ms in games:
+                moves_json = json.dumps(moves, separators=(",", ":"))
+                for username, mark, result in players:
+                    username_id = user_ids.get(username)
+                    if username_id is None:
+                        continue  # Not a registered user, so there is nothing to attach the row to
+                    rows.append((username_id, result, game_token, mark, moves_json, duration_ms))
             if rows:
-                games_data = [{"game_id": row[0], "username_id": row[1], "result": row[2], "timestamp": row[3]} for row in
-                              rows]
-                return {"success": True, "data": games_data}
+                cur.executemany(INSERT_GAME_SQL, rows)
+        print(f"Recorded {len(games)} finished games.")
+
+    def load_leaderboard_page(self, limit, after=None):
+        """One page of the ranked leaderboard straight from the database, using idx_leaderboard_rank.
+
+        Returns (rows, next_after) with rows of (username, wins, losses, draws); pass next_after back to get the
+        following page. next_after is None on the last page.
+        """
+        with self.cursor() as cur:
+            if after is None:
+                cur.execute(LEADERBOARD_FIRST_PAGE_SQL, (limit,))
             else:
-                return {}  # Empty result
-        except sqlite3.Error:
-            return {}  # Error occurred
+                leaderboard_id, wins, losses, draws = after
+                cur.execute(LEADERBOARD_NEXT_PAGE_SQL,
+                            (wins, wins, draws, draws, losses, losses, leaderboard_id, limit))
+            rows = cur.fetchall()
+        next_after = None
+        if len(rows) == limit:
+            leaderboard_id, _, wins, losses, draws = rows[-1]
+            next_after = (leaderboard_id, wins, losses, draws)
+        return [row[1:] for row in rows], next_after
+
+    def iter_leaderboard_rows(self):
+        """(username, wins, losses, draws) for every player on the leaderboard, streamed in chunks."""
+        query = """
+        SELECT u.username, SUM(l.wins), SUM(l.losses), SUM(l.draws)
+        FROM leaderboard l JOIN users u ON u.username_id = l.username_id
+        GROUP BY u.username
+        """
+        for username, wins, losses, draws in self.stream(query):
+            yield username, int(wins), int(losses), int(draws)
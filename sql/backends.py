@@ -0,0 +1,147 @@
+import sqlite3
+from functools import lru_cache
+
+BACKENDS = ("mysql", "sqlite")
+
+
+class MySQLBackend:
+    """mysql.connector against a MySQL/MariaDB server. The driver is only imported when this backend is used."""
+
+    name = "mysql"
+
+    def __init__(self, host, user, password, database):
+        import mysql.connector
+        from mysql.connector import errorcode
+
+        self.driver = mysql.connector
+        self.duplicate_errnos = (errorcode.ER_DUP_KEYNAME, errorcode.ER_DUP_FIELDNAME)
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.Error = mysql.connector.Error
+        self.IntegrityError = mysql.connector.IntegrityError
+        # The connection is gone; the pool drops it and opens a new one
+        self.reconnect_errors = (mysql.connector.OperationalError, mysql.connector.InterfaceError)
+
+    def connect(self):
+        # consume_results lets a streaming cursor be closed before all of its rows were read
+        conn = self.driver.connect(host=self.host, user=self.user, password=self.password, database=self.database,
+                                   consume_results=True)
+        return conn if conn.is_connected() else None
+
+    @staticmethod
+    def is_healthy(conn):
+        """Pings the server, reconnecting the same connection object if it can."""
+        conn.ping(reconnect=True, attempts=1)
+        return conn.is_connected()
+
+    @staticmethod
+    def cursor(conn):
+        return conn.cursor(buffered=True)
+
+    @staticmethod
+    def streaming_cursor(conn):
+        """Unbuffered: rows stay on the server until fetched, instead of the whole result being read at once."""
+        return conn.cursor(buffered=False)
+
+    def is_already_applied(self, error):
+        """The migration's index or column is already there."""
+        return getattr(error, "errno", None) in self.duplicate_errnos
+
+
+@lru_cache(maxsize=512)
+def to_sqlite(query):
+    """Rewrite a query written for MySQL (%s placeholders, AUTO_INCREMENT keys) into SQLite's dialect."""
+    return (query.replace("%s", "?")
+            .replace("INT PRIMARY KEY AUTO_INCREMENT", "INTEGER PRIMARY KEY AUTOINCREMENT"))
+
+
+class SQLiteCursor:
+    """A sqlite3 cursor that takes the same queries as the MySQL one."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        self.cursor.execute(to_sqlite(query), params)
+
+    def executemany(self, query, seq_of_params):
+        self.cursor.executemany(to_sqlite(query), seq_of_params)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self.cursor.description or ())
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteBackend:
+    """A local SQLite file in WAL mode: readers never wait on the writer, and there are no network round trips.
+
+    synchronous=NORMAL only syncs at WAL checkpoints; a power cut can lose the last commits but never
+    corrupts the database. Each connection keeps its prepared statements (cached_statements), so the
+    same queries are not parsed again.
+    """
+
+    name = "sqlite"
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    reconnect_errors = ()  # A local file doesn't drop connections
+    SYNCHRONOUS = "NORMAL"
+    BUSY_TIMEOUT_MS = 10000
+    CACHED_STATEMENTS = 256
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               cached_statements=self.CACHED_STATEMENTS)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def is_healthy(conn):
+        conn.execute("SELECT 1").fetchone()
+        return True
+
+    @staticmethod
+    def cursor(conn):
+        return SQLiteCursor(conn.cursor())
+
+    # sqlite3 cursors already step through the result as rows are fetched
+    streaming_cursor = cursor
+
+    @staticmethod
+    def is_already_applied(error):
+        return "already exists" in str(error) or "duplicate column name" in str(error)
+
+
+def create_backend(name, constants):
+    """The storage backend named in the config (SQLConstants.BACKEND)."""
+    if name == "mysql":
+        return MySQLBackend(constants.HOST, constants.USER, constants.PASSWORD, constants.DATABASE)
+    if name == "sqlite":
+        return SQLiteBackend(constants.SQLITE_PATH)
+    raise ValueError(f"Unknown database backend {name!r}, expected one of {BACKENDS}")
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+POOL_SIZE = 8
+CHECKOUT_TIMEOUT = 10  # Seconds to wait for a free connection before giving up
+HEALTH_CHECK_INTERVAL = 30  # Seconds a connection may sit idle before it is checked on checkout
+
+
+class PoolError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A fixed-size pool of database connections, each used by one thread at a time.
+
+    Connections are opened lazily with connect(). One that sat idle for a while is checked with
+    is_healthy(conn) before it is handed out and replaced if the check fails. A connection whose
+    operation raised one of reconnect_errors is closed instead of going back to the pool, so the
+    next checkout opens a fresh one.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, is_healthy=None, reconnect_errors=(),
+                 checkout_timeout=CHECKOUT_TIMEOUT, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.connect = connect
+        self.size = size
+        self.is_healthy = is_healthy
+        self.reconnect_errors = tuple(reconnect_errors)
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.idle = queue.LifoQueue()  # (connection, time it was returned); the most recently used goes out first
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.closed = False
+
+    def open_connection(self):
+        try:
+            conn = self.connect()
+        except Exception:
+            conn = None
+        if conn is None:
+            with self.lock:
+                self.opened -= 1
+            raise PoolError("Could not open a database connection")
+        return conn
+
+    def discard(self, conn):
+        with self.lock:
+            self.opened -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def checkout(self):
+        if self.closed:
+            raise PoolError("The connection pool is closed")
+        try:
+            conn, returned_at = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open = self.opened < self.size
+                if can_open:
+                    self.opened += 1
+            if can_open:
+                return self.open_connection()
+            try:
+                conn, returned_at = self.idle.get(timeout=self.checkout_timeout)
+            except queue.Empty:
+                raise PoolError(f"No database connection free after {self.checkout_timeout} seconds")
+
+        if self.is_healthy is not None and time.monotonic() - returned_at > self.health_check_interval:
+            healthy = False
+            try:
+                healthy = self.is_healthy(conn)
+            except Exception:
+                pass
+            if not healthy:
+                print("Replacing a stale database connection.")
+                self.discard(conn)
+                with self.lock:
+                    self.opened += 1
+                return self.open_connection()
+        return conn
+
+    def release(self, conn):
+        if self.closed:
+            self.discard(conn)
+        else:
+            self.idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the with block."""
+        conn = self.checkout()
+        try:
+            yield conn
+        except self.reconnect_errors:
+            self.discard(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def close(self):
+        """Close every idle connection; ones still checked out are closed when they come back."""
+        self.closed = True
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
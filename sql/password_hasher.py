@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+# scrypt cost: about 50 ms and 16 MiB per hash, so guessing attacks on a leaked table are slow
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 64
+MAX_PENDING = 256  # Hashes queued or running before new requests are turned away
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Salted scrypt hash, stored as scrypt$n$r$p$salt$hash (hex)."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=HASH_BYTES)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password, stored):
+    """Check a password against a stored hash. Returns (matches, needs_rehash).
+
+    needs_rehash is True for the old unsalted sha256 hashes and for scrypt hashes with weaker parameters,
+    so they can be replaced while the plain password is at hand.
+    """
+    if LEGACY_SHA256.match(stored):
+        matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        return matches, matches
+    try:
+        scheme, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+    except ValueError:
+        return False, False
+    if scheme != "scrypt":
+        return False, False
+    candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p,
+                               dklen=len(digest) // 2)
+    matches = hmac.compare_digest(candidate.hex(), digest)
+    return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+class PasswordHasher:
+    """Runs hash_password and verify_password in a pool of worker processes.
+
+    Callers block on the result, but only their own thread does: the hashing itself runs on other cores
+    and never holds this process's GIL. At most max_pending hashes may be queued or running; past that
+    PasswordHasherBusy is raised instead of letting a login storm queue up without bound. Every call's
+    latency, queueing included, goes into a histogram.
+    """
+
+    def __init__(self, workers=None, max_pending=MAX_PENDING):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.histogram_lock = threading.Lock()
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)  # The last bucket is everything slower
+        self.rejected = 0
+
+    def get_executor(self):
+        # Started on first use; forkserver keeps the workers from inheriting the server's threads and sockets
+        with self.executor_lock:
+            if self.executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self.executor
+
+    def run(self, func, *args):
+        if not self.pending.acquire(blocking=False):
+            with self.histogram_lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Too many logins in progress, try again shortly.")
+        started = time.perf_counter()
+        try:
+            return self.get_executor().submit(func, *args).result()
+        finally:
+            self.pending.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.histogram_lock:
+                self.latency_counts[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def hash(self, password):
+        return self.run(hash_password, password)
+
+    def verify(self, password, stored):
+        """(matches, needs_rehash), see verify_password."""
+        return self.run(verify_password, password, stored)
+
+    def histogram(self):
+        """{"<=N ms": count, ..., ">N ms": count, "rejected": count}"""
+        with self.histogram_lock:
+            result = {f"<={bound} ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_counts)}
+            result[f">{LATENCY_BUCKETS_MS[-1]} ms"] = self.latency_counts[-1]
+            result["rejected"] = self.rejected
+            return result
+
+    def close(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
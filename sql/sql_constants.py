@@ -1,5 +1,7 @@
 class SQLConstants:
+    BACKEND = "mysql"  # "mysql", or "sqlite" for a single node without a database server
     HOST = "127.0.0.1"
     USER = "root"
-    PASSWORD = #Enter your password
-    DATABASE = "TicTacToe"
\ No newline at end of file
+    PASSWORD = ""  # Enter your password
+    DATABASE = "TicTacToe"
+    SQLITE_PATH = "tictactoe.db"
@@ -27,3 +27,44 @@ CREATE_GAME_TABLE_SQL = """
        FOREIGN KEY (username_id) REFERENCES users (username_id)
    )
    """
+
+# Indexes and columns added to existing databases by SQLClient.apply_migrations; each runs once, a duplicate
+# name is skipped.
+MIGRATIONS = [
+    # update_leaderboard and record_results look rows up by username_id. InnoDB indexes a foreign key column
+    # on its own, SQLite doesn't; on MySQL this is a second index over the same column
+    ("leaderboard user index", "CREATE INDEX idx_leaderboard_user ON leaderboard (username_id)"),
+    ("leaderboard rank index", """
+    CREATE INDEX idx_leaderboard_rank ON leaderboard (wins DESC, draws DESC, losses, leaderboard_id)
+    """),
+    # games holds one row per player of a finished game: their result and mark, and the game's move list
+    ("games game_token column", "ALTER TABLE games ADD COLUMN game_token VARCHAR(32)"),
+    ("games mark column", "ALTER TABLE games ADD COLUMN mark VARCHAR(8)"),
+    ("games moves column", "ALTER TABLE games ADD COLUMN moves TEXT"),
+    ("games duration column", "ALTER TABLE games ADD COLUMN duration_ms INT"),
+    ("games token index", "CREATE INDEX idx_games_token ON games (game_token)"),
+]
+
+INSERT_GAME_SQL = """
+INSERT INTO games (username_id, result, game_token, mark, moves, duration_ms) VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+# One page of the ranked leaderboard, continuing after the last row of the previous page (keyset pagination),
+# so deep pages cost the same as the first one. Walks idx_leaderboard_rank in order.
+LEADERBOARD_FIRST_PAGE_SQL = """
+SELECT l.leaderboard_id, u.username, l.wins, l.losses, l.draws
+FROM leaderboard l JOIN users u ON u.username_id = l.username_id
+ORDER BY l.wins DESC, l.draws DESC, l.losses, l.leaderboard_id
+LIMIT %s
+"""
+
+LEADERBOARD_NEXT_PAGE_SQL = """
+SELECT l.leaderboard_id, u.username, l.wins, l.losses, l.draws
+FROM leaderboard l JOIN users u ON u.username_id = l.username_id
+WHERE l.wins < %s
+   OR (l.wins = %s AND (l.draws < %s
+   OR (l.draws = %s AND (l.losses > %s
+   OR (l.losses = %s AND l.leaderboard_id > %s)))))
+ORDER BY l.wins DESC, l.draws DESC, l.losses, l.leaderboard_id
+LIMIT %s
+"""
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_SIZE = 100000
+USER_CACHE_TTL = 3600  # Seconds before an entry is looked up again, in case the users table changed underneath us
+
+
+class UserCache:
+    """Bounded LRU map of username -> username_id, with entries expiring after ttl seconds.
+
+    Only found users are cached, so a user registered by another server is picked up on the next lookup.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # username -> (username_id, expires_at), least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        """The cached id, or None on a miss."""
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[username]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(username)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, username, username_id):
+        if username_id is None:
+            return
+        with self.lock:
+            self.entries[username] = (username_id, time.monotonic() + self.ttl)
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,126 @@
+import threading
+import time
+
+FLUSH_BATCH_SIZE = 200  # Flush as soon as this many items are waiting
+FLUSH_INTERVAL = 0.5  # Seconds an item may wait before it is flushed anyway
+RETRY_DELAY = 2  # Seconds to wait after a failed flush before trying again
+
+
+class WriteBehindQueue:
+    """Collects writes in memory and hands them to flush(items) in batches, from a background thread.
+
+    A batch goes out once batch_size items are waiting or the oldest has waited flush_interval seconds.
+    If flush raises, the batch is kept and retried, in order, ahead of newer items. close() flushes
+    everything still waiting before it returns. call_soon(func) runs func on the same thread between
+    batches, when no write is in flight.
+
+    With max_items set, put_many turns items away once that many are waiting (the database has fallen
+    behind), instead of buffering without bound or making the caller wait; dropped counts them. Items put
+    after close() are turned away the same way.
+    """
+
+    def __init__(self, flush, batch_size=FLUSH_BATCH_SIZE, flush_interval=FLUSH_INTERVAL, name="write-behind",
+                 max_items=None):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.items = []
+        self.calls = []
+        self.oldest = None  # When the oldest waiting item was added
+        self.closed = False
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.flusher = threading.Thread(target=self.flush_loop, name=name, daemon=True)
+        self.flusher.start()
+
+    def put(self, item):
+        return self.put_many((item,))
+
+    def put_many(self, items):
+        """Queue items for the next batch. False if they were dropped because the queue is full or closed."""
+        with self.condition:
+            if self.closed or (self.max_items is not None and len(self.items) + len(items) > self.max_items):
+                self.dropped += len(items)
+                return False
+            if not self.items:
+                self.oldest = time.monotonic()
+            self.items.extend(items)
+            if len(self.items) >= self.batch_size:
+                self.condition.notify()
+            return True
+
+    def __len__(self):
+        return len(self.items)
+
+    def pending(self):
+        """Items queued and not written yet. Called from a call_soon function, that is every item not in the database."""
+        with self.condition:
+            return list(self.items)
+
+    def call_soon(self, func):
+        with self.condition:
+            self.calls.append(func)
+            self.condition.notify()
+
+    def take_batch(self):
+        """Wait until a batch or a call is due and take them. Returns (None, []) once closed and drained."""
+        with self.condition:
+            while not self.calls:
+                if self.items and (self.closed or len(self.items) >= self.batch_size):
+                    break
+                if not self.items and self.closed:
+                    return None, []
+                timeout = None
+                if self.items:
+                    timeout = self.oldest + self.flush_interval - time.monotonic()
+                    if timeout <= 0:
+                        break
+                self.condition.wait(timeout)
+            calls = self.calls
+            self.calls = []
+            if calls and not self.closed and len(self.items) < self.batch_size:
+                return [], calls  # Leave the items to their own trigger
+            batch = self.items
+            self.items = []
+            return batch, calls
+
+    def flush_loop(self):
+        while True:
+            batch, calls = self.take_batch()
+            if batch is None:
+                return
+            if batch and not self.write_batch(batch):
+                if self.closed:
+                    return  # Don't spin on shutdown; close() reports what was left
+                time.sleep(RETRY_DELAY)
+            # After the batch, so whatever a call sees is either in the database or still queued
+            for func in calls:
+                try:
+                    func()
+                except Exception as e:
+                    print(f"Error in {self.flusher.name}: {e}")
+
+    def write_batch(self, batch):
+        try:
+            self.flush(batch)
+            self.flushed += len(batch)
+            return True
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"Error flushing {len(batch)} queued writes, will retry: {e}")
+            with self.condition:
+                self.items[:0] = batch
+                self.oldest = time.monotonic()
+            return False
+
+    def close(self, timeout=None):
+        """Stop taking writes and wait for everything queued to be flushed. Returns the items left unwritten."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.flusher.join(timeout)
+        with self.condition:
+            return list(self.items)
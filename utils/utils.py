@@ -2,5 +2,5 @@ import random
 import string
 
 
-def generate_token():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+def generate_token(prefix=""):
+    return prefix + ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))